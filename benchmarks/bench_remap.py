@@ -0,0 +1,180 @@
+"""Benchmark the single-pass remapper against the legacy per-line regex chain.
+
+Generates a synthetic pg_dump-style file (DDL followed by large COPY blocks),
+remaps it with both implementations and reports throughput. The DDL portion
+of both outputs must be byte-identical; COPY payload is expected to differ
+only where the legacy data remapper rewrote ``public.`` inside user data.
+
+    python benchmarks/bench_remap.py --size-mb 4096
+"""
+
+from __future__ import annotations
+
+import argparse
+import filecmp
+import os
+import re
+import tempfile
+import time
+
+from supaneon_sync.backup import remap_data_file, remap_schema_file
+from supaneon_sync.remap import Remapper
+
+NEW_SCHEMA = "backup_20260101t000000z"
+
+DDL_TEMPLATE = """\
+CREATE TABLE public.t{i} (
+    id uuid DEFAULT extensions.uuid_generate_v4() NOT NULL,
+    parent_id uuid REFERENCES "public"."t{i}"(id),
+    body text DEFAULT 'public.placeholder'::text,
+    created_at timestamp with time zone DEFAULT now()
+);
+ALTER TABLE public.t{i} ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "p{i}" ON public.t{i} TO authenticated USING (true);
+GRANT ALL ON TABLE public.t{i} TO anon;
+ALTER TABLE ONLY public.t{i} ADD CONSTRAINT t{i}_pkey PRIMARY KEY (id);
+CREATE INDEX t{i}_parent ON public.t{i} USING btree (parent_id);
+"""
+
+ROW = (
+    "5f0c6d0e-8a4b-4c1e-9f7a-{n:012d}\t\\N\t"
+    "lorem ipsum dolor sit amet, see public.docs\t2026-01-01 00:00:00+00\n"
+)
+
+
+# ---------------------------------------------------------------------
+# Legacy implementation (before the single-pass engine)
+# ---------------------------------------------------------------------
+
+
+def legacy_remap_schema_file(src: str, dst: str, new_schema: str) -> None:
+    SKIP_PREFIXES = (
+        "GRANT ",
+        "REVOKE ",
+        "ALTER DEFAULT PRIVILEGES",
+        "SET ROLE",
+        "CREATE POLICY",
+        "ALTER POLICY",
+        "DROP POLICY",
+    )
+    SKIP_CONTAINS = (
+        "ROW LEVEL SECURITY",
+        "TO anon",
+        "TO authenticated",
+        "TO service_role",
+        "EXTENSION ",
+    )
+    public_quoted_re = re.compile(r'"public"')
+    public_unquoted_re = re.compile(r"(?<!\w)public\.")
+    extensions_re = re.compile(r'("extensions"|extensions)\.')
+
+    with (
+        open(src, "r", encoding="utf-8") as fin,
+        open(dst, "w", encoding="utf-8") as fout,
+    ):
+        for line in fin:
+            if line.startswith(SKIP_PREFIXES) or any(x in line for x in SKIP_CONTAINS):
+                continue
+            if "SCHEMA public" in line:
+                continue
+            line = public_quoted_re.sub(f'"{new_schema}"', line)
+            line = public_unquoted_re.sub(f"{new_schema}.", line)
+            line = extensions_re.sub("public.", line)
+            line = line.replace("search_path = public", f"search_path = {new_schema}")
+            line = line.replace("extensions.uuid_generate_v4()", "gen_random_uuid()")
+            line = line.replace("'extensions'", f"'{new_schema}'")
+            fout.write(line)
+
+
+def legacy_remap_data_file(src: str, dst: str, new_schema: str) -> None:
+    public_re = re.compile(r"(?<!\w)public\.")
+    with (
+        open(src, "r", encoding="utf-8") as fin,
+        open(dst, "w", encoding="utf-8") as fout,
+    ):
+        for line in fin:
+            fout.write(public_re.sub(f"{new_schema}.", line))
+
+
+def stream_remap_file(src: str, dst: str, new_schema: str) -> None:
+    """The line-stream engine as used by the streaming pipeline."""
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        fout.writelines(Remapper(new_schema).remap(fin))
+
+
+# ---------------------------------------------------------------------
+# Synthetic dumps
+# ---------------------------------------------------------------------
+
+
+def write_schema_dump(path: str, tables: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("SET search_path = public, pg_catalog;\n")
+        f.write("CREATE SCHEMA public;\n")
+        for i in range(tables):
+            f.write(DDL_TEMPLATE.format(i=i))
+
+
+def write_data_dump(path: str, tables: int, size_mb: int) -> None:
+    target = size_mb * 1024 * 1024
+    rows_per_block = 10_000
+    written = 0
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("SET statement_timeout = 0;\n")
+        while written < target:
+            table = n % tables
+            f.write(
+                f"COPY public.t{table} (id, parent_id, body, created_at) "
+                "FROM stdin;\n"
+            )
+            block = "".join(ROW.format(n=n + k) for k in range(rows_per_block))
+            f.write(block)
+            f.write("\\.\n\n")
+            written += len(block)
+            n += rows_per_block
+
+
+def _timed(label: str, fn, src: str, dst: str) -> float:
+    start = time.perf_counter()
+    fn(src, dst, NEW_SCHEMA)
+    elapsed = time.perf_counter() - start
+    mb = os.path.getsize(src) / (1024 * 1024)
+    print(f"  {label:<28} {elapsed:8.2f}s  {mb / elapsed:8.1f} MB/s")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--dir", default=None, help="Scratch directory")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        schema = os.path.join(tmp, "schema.sql")
+        data = os.path.join(tmp, "data.sql")
+        print(f"Generating {args.size_mb} MB data dump, {args.tables} tables...")
+        write_schema_dump(schema, args.tables)
+        write_data_dump(data, args.tables, args.size_mb)
+
+        print("Schema dump:")
+        _timed("legacy", legacy_remap_schema_file, schema, schema + ".legacy")
+        _timed("engine", remap_schema_file, schema, schema + ".engine")
+        identical = filecmp.cmp(schema + ".legacy", schema + ".engine", shallow=False)
+        print(f"  DDL output byte-identical: {identical}")
+
+        print("Data dump:")
+        legacy = _timed("legacy", legacy_remap_data_file, data, data + ".legacy")
+        _timed("engine (line stream)", stream_remap_file, data, data + ".stream")
+        engine = _timed("engine (mmap)", remap_data_file, data, data + ".engine")
+        print(f"  speedup: {legacy / engine:.1f}x")
+        if not filecmp.cmp(data + ".stream", data + ".engine", shallow=False):
+            raise SystemExit("mmap and line-stream engines disagree")
+
+        if not identical:
+            raise SystemExit("DDL output differs from the legacy remapper")
+
+
+if __name__ == "__main__":
+    main()
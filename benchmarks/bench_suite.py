@@ -0,0 +1,377 @@
+"""End-to-end benchmarks against a local PostgreSQL.
+
+Starts a throwaway cluster (``initdb`` + ``pg_ctl``, no fsync) or uses the
+server at ``$BENCH_PG_URL``, fills a source database with a Supabase-shaped
+schema (``extensions`` schema with uuid-ossp, the anon/authenticated/
+service_role roles, RLS policies, grants, foreign keys and secondary
+indexes) and times:
+
+- ``remap_schema_file`` / ``remap_data_file`` on real ``pg_dump`` output
+- a full ``backup.run()`` into a second database, per backup mode
+- ``run_healthcheck`` (exact, and fast with sampling) on the result
+
+Each run is appended to a JSON history file together with the commit and
+the generator parameters, and compared with the previous run that used the
+same parameters.
+
+    python benchmarks/bench_suite.py --tables 50 --rows 20000
+    BENCH_PG_URL=postgresql://postgres@localhost:5432/postgres \\
+        python benchmarks/bench_suite.py --modes stream,copy
+
+``initdb`` refuses to run as root; use ``$BENCH_PG_URL`` there.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from typing import Callable, Iterator
+from urllib.parse import urlparse, urlunparse
+
+import psycopg
+from psycopg import sql
+
+from supaneon_sync import backup, db
+from supaneon_sync.healthcheck import run_healthcheck
+
+SOURCE_DB = "bench_source"
+TARGET_DB = "bench_target"
+NEW_SCHEMA = "backup_20260101t000000z"
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), "history.json")
+
+SUPABASE_ROLES = ("anon", "authenticated", "service_role")
+
+
+# ---------------------------------------------------------------------
+# Local PostgreSQL
+# ---------------------------------------------------------------------
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pg_bin(name: str, bindir: str | None) -> str:
+    path = os.path.join(bindir, name) if bindir else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise SystemExit(
+            f"{name} not found; pass --pg-bin or set BENCH_PG_URL to an "
+            "existing server"
+        )
+    return path
+
+
+@contextlib.contextmanager
+def local_postgres(bindir: str | None) -> Iterator[str]:
+    """Yield a superuser URL to a temporary cluster, removed afterwards."""
+    if os.environ.get("BENCH_PG_URL"):
+        yield os.environ["BENCH_PG_URL"]
+        return
+
+    initdb, pg_ctl = _pg_bin("initdb", bindir), _pg_bin("pg_ctl", bindir)
+    with tempfile.TemporaryDirectory(prefix="supaneon-bench-pg-") as tmp:
+        data = os.path.join(tmp, "data")
+        port = _free_port()
+        subprocess.run(
+            [initdb, "-D", data, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        options = (
+            f"-p {port} -k {tmp} -c listen_addresses='' -c fsync=off "
+            "-c synchronous_commit=off -c full_page_writes=off "
+            "-c max_connections=100"
+        )
+        subprocess.run(
+            [pg_ctl, "-D", data, "-o", options, "-l", os.path.join(tmp, "log"), "-w"]
+            + ["start"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            yield f"postgresql://postgres@/postgres?host={tmp}&port={port}"
+        finally:
+            db.close_all()
+            subprocess.run(
+                [pg_ctl, "-D", data, "-m", "fast", "stop"],
+                check=False,
+                stdout=subprocess.DEVNULL,
+            )
+
+
+def database_url(server_url: str, dbname: str) -> str:
+    return urlunparse(urlparse(server_url)._replace(path=f"/{dbname}"))
+
+
+def recreate_database(server_url: str, dbname: str) -> str:
+    with psycopg.connect(server_url, autocommit=True) as conn:
+        conn.execute(
+            sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(
+                sql.Identifier(dbname)
+            )
+        )
+        conn.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(dbname)))
+    return database_url(server_url, dbname)
+
+
+# ---------------------------------------------------------------------
+# Supabase-shaped source schema
+# ---------------------------------------------------------------------
+
+
+def supabase_schema_sql(tables: int, indexes: int, policies: int) -> Iterator[str]:
+    """DDL for ``tables`` tables shaped like a Supabase ``public`` schema."""
+    for role in SUPABASE_ROLES:
+        yield (
+            f"DO $$ BEGIN CREATE ROLE {role} NOLOGIN; "
+            "EXCEPTION WHEN duplicate_object THEN NULL; END $$"
+        )
+    yield "CREATE SCHEMA IF NOT EXISTS extensions"
+    yield 'CREATE EXTENSION IF NOT EXISTS "uuid-ossp" SCHEMA extensions'
+
+    for i in range(tables):
+        t = f"public.t{i}"
+        parent = f"public.t{i - 1}" if i else None
+        yield f"""
+            CREATE TABLE {t} (
+                id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                uid uuid NOT NULL DEFAULT extensions.uuid_generate_v4(),
+                parent_id bigint {f"REFERENCES {parent}(id)" if parent else ""},
+                owner uuid,
+                title text NOT NULL,
+                body text,
+                score double precision,
+                tags text[],
+                created_at timestamptz NOT NULL DEFAULT now()
+            )"""
+        for k in range(indexes):
+            column = ("uid", "owner", "created_at", "score", "title")[k % 5]
+            yield f"CREATE INDEX t{i}_idx{k} ON {t} ({column})"
+        yield f"ALTER TABLE {t} ENABLE ROW LEVEL SECURITY"
+        for k in range(policies):
+            role = SUPABASE_ROLES[k % len(SUPABASE_ROLES)]
+            yield f'CREATE POLICY "p{i}_{k}" ON {t} TO {role} USING (true)'
+        yield f"GRANT ALL ON TABLE {t} TO anon, authenticated, service_role"
+
+
+def populate(url: str, tables: int, rows: int) -> None:
+    with psycopg.connect(url, autocommit=True) as conn:
+        for i in range(tables):
+            parent = "NULL" if i == 0 else f"1 + (g % {min(rows, 100)})"
+            conn.execute(f"""
+                INSERT INTO public.t{i} (parent_id, owner, title, body, score, tags)
+                SELECT {parent}, extensions.uuid_generate_v4(),
+                       'title ' || g,
+                       repeat(md5(g::text), 4) || ' see public.docs',
+                       random() * 1000,
+                       ARRAY['a' || (g % 7), 'b' || (g % 11)]
+                FROM generate_series(1, {rows}) AS g
+                """)
+        conn.execute("ANALYZE")
+
+
+def build_source(url: str, tables: int, rows: int, indexes: int, policies: int):
+    with psycopg.connect(url, autocommit=True) as conn:
+        for statement in supabase_schema_sql(tables, indexes, policies):
+            conn.execute(statement)
+    populate(url, tables, rows)
+
+
+# ---------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------
+
+
+def _timed(results: dict, name: str, fn: Callable[[], object], nbytes: int = 0):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    entry: dict = {"seconds": round(elapsed, 3)}
+    if nbytes:
+        entry["mb_per_s"] = round(nbytes / (1024 * 1024) / elapsed, 1)
+    results[name] = entry
+    rate = f"  {entry['mb_per_s']:8.1f} MB/s" if nbytes else ""
+    print(f"  {name:<32} {elapsed:8.2f}s{rate}")
+    return entry
+
+
+def bench_remap(results: dict, source_url: str, tmp: str) -> None:
+    schema, data = os.path.join(tmp, "schema.sql"), os.path.join(tmp, "data.sql")
+    with open(schema, "wb") as f:
+        subprocess.run(backup._schema_dump_cmd(source_url), check=True, stdout=f)
+    with open(data, "wb") as f:
+        subprocess.run(backup._data_dump_cmd(source_url), check=True, stdout=f)
+
+    _timed(
+        results,
+        "remap_schema_file",
+        lambda: backup.remap_schema_file(schema, schema + ".out", NEW_SCHEMA),
+        os.path.getsize(schema),
+    )
+    _timed(
+        results,
+        "remap_data_file",
+        lambda: backup.remap_data_file(data, data + ".out", NEW_SCHEMA),
+        os.path.getsize(data),
+    )
+
+
+def bench_backup(
+    results: dict, source_url: str, target_url: str, mode: str, workers: int, tmp: str
+) -> str:
+    metrics_file = os.path.join(tmp, f"metrics-{mode}.jsonl")
+    options = backup.BackupOptions(
+        mode=mode, workers=workers, metrics_file=metrics_file
+    )
+    # Plain mode writes its dump files into the working directory.
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        entry = _timed(
+            results,
+            f"backup_run[{mode}]",
+            lambda: backup.run(source_url, target_url, options),
+        )
+    finally:
+        os.chdir(cwd)
+
+    with open(metrics_file, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    entry["phases"] = {
+        r["phase"]: r["seconds"] for r in records if r["event"] == "phase"
+    }
+    return backup.list_backup_schemas(target_url)[-1]
+
+
+def bench_healthcheck(results: dict, target_url: str, schema: str) -> None:
+    _timed(results, "healthcheck[exact]", lambda: run_healthcheck(target_url, schema))
+    _timed(
+        results,
+        "healthcheck[fast,sample=5]",
+        lambda: run_healthcheck(target_url, schema, fast=True, sample=5),
+    )
+
+
+# ---------------------------------------------------------------------
+# History
+# ---------------------------------------------------------------------
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record_history(path: str, params: dict, results: dict) -> None:
+    history: list[dict] = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            history = json.load(f)
+
+    previous = next((h for h in reversed(history) if h["params"] == params), None)
+    if previous:
+        print(f"Compared with {previous['commit']} ({previous['timestamp']}):")
+        for name, entry in results.items():
+            before = previous["results"].get(name)
+            if before:
+                change = (
+                    entry["seconds"] / before["seconds"] - 1 if before["seconds"] else 0
+                )
+                print(
+                    f"  {name:<32} {before['seconds']:8.2f}s -> {entry['seconds']:8.2f}s  ({change:+.0%})"
+                )
+
+    history.append(
+        {
+            "commit": _commit(),
+            "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+            "params": params,
+            "results": results,
+        }
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+        f.write("\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=10_000, help="Rows per table")
+    parser.add_argument("--indexes", type=int, default=2, help="Indexes per table")
+    parser.add_argument("--policies", type=int, default=2, help="Policies per table")
+    parser.add_argument(
+        "--modes",
+        default="plain,stream,copy,directory,async",
+        help="Backup modes to run",
+    )
+    parser.add_argument("--workers", type=int, default=backup.DEFAULT_WORKERS)
+    parser.add_argument("--pg-bin", default=None, help="Directory of initdb/pg_ctl")
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--dir", default=None, help="Scratch directory")
+    args = parser.parse_args()
+
+    params = {
+        "tables": args.tables,
+        "rows": args.rows,
+        "indexes": args.indexes,
+        "policies": args.policies,
+        "workers": args.workers,
+    }
+    results: dict = {}
+
+    with (
+        local_postgres(args.pg_bin) as server,
+        tempfile.TemporaryDirectory(dir=args.dir) as tmp,
+    ):
+        print(f"Generating source: {args.tables} tables x {args.rows} rows...")
+        source_url = recreate_database(server, SOURCE_DB)
+        _timed(
+            results,
+            "generate_source",
+            lambda: build_source(
+                source_url, args.tables, args.rows, args.indexes, args.policies
+            ),
+        )
+
+        print("Remap:")
+        bench_remap(results, source_url, tmp)
+
+        schema = None
+        for mode in args.modes.split(","):
+            print(f"Backup ({mode}):")
+            # A fresh target per mode keeps runs independent of rotation.
+            target_url = recreate_database(server, f"{TARGET_DB}_{mode}")
+            schema = bench_backup(
+                results, source_url, target_url, mode, args.workers, tmp
+            )
+
+        if schema is not None:
+            print("Healthcheck:")
+            bench_healthcheck(results, target_url, schema)
+        db.close_all()
+
+    record_history(args.history, params, results)
+    print(f"Results appended to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
+import datetime
+from typing import Optional
+
 import typer
 from . import config
 from . import backup
+from . import cdc
+from . import db
+from . import fanout
+from . import healthcheck
 from . import restore
+from .filters import TableFilter
+from .rotation import DEFAULT_KEEP, RetentionPolicy
+from .verify import DEFAULT_CHUNK_ROWS
 
 app = typer.Typer()
 
@@ -13,11 +23,9 @@ def validate_config():
     typer.echo("Configuration format looks good.")
 
     # Proactively check Neon connectivity
-    import psycopg
-
     typer.echo("Checking connection to Neon database...")
     try:
-        with psycopg.connect(cfg.neon_database_url) as conn:
+        with db.connection(cfg.neon_database_url) as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1")
         typer.echo("Successfully connected to Neon database.")
@@ -27,15 +35,265 @@ def validate_config():
 
 
 @app.command()
-def backup_run():
+def backup_run(
+    mode: str = typer.Option(
+        "plain",
+        help="Backup mode: 'plain' (intermediate SQL files), 'stream' "
+        "(pipe pg_dump through the remapper straight into psql), 'copy' "
+        "(parallel per-table COPY), 'directory' (pg_dump --format=directory "
+        "with a parallel load), 'async' ('copy' run as an asyncio task graph) "
+        "or 'branch' (refresh one rolling schema and snapshot it as a Neon "
+        "branch; needs NEON_API_KEY and NEON_PROJECT_ID)",
+    ),
+    workers: int = typer.Option(
+        backup.DEFAULT_WORKERS,
+        help="Parallel table copies in 'copy' mode, or pg_dump/load jobs in "
+        "'directory' mode; also the connections building indexes and "
+        "constraints after the data load",
+    ),
+    incremental: bool = typer.Option(
+        False,
+        help="In 'copy' mode, clone tables unchanged since the previous "
+        "backup on Neon instead of copying them from Supabase",
+    ),
+    split_gb: float = typer.Option(
+        backup.DEFAULT_SPLIT_BYTES / 1024**3,
+        help="In 'copy' mode, copy tables larger than this many GiB in "
+        "parallel page ranges of about that size (PostgreSQL 14+; 0 never "
+        "splits a table)",
+    ),
+    copy_format: str = typer.Option(
+        "text",
+        help="In 'copy' mode, move rows in COPY's 'text' or 'binary' format; "
+        "binary saves converting values to text and back, and falls back to "
+        "text for tables with types that have no portable binary form",
+    ),
+    artifact_dir: Optional[str] = typer.Option(
+        None,
+        help="Keep compressed, checksummed dumps under this directory "
+        "('plain' and 'stream' modes)",
+    ),
+    compression: str = typer.Option("gzip", help="Artifact compression: gzip or zstd"),
+    compression_level: Optional[int] = typer.Option(
+        None, help="Artifact compression level (default: codec default)"
+    ),
+    keep: int = typer.Option(
+        DEFAULT_KEEP,
+        help="Backup schemas to keep, counting the new one (0: no count limit)",
+    ),
+    max_age_days: Optional[float] = typer.Option(
+        None, help="Drop backup schemas older than this many days"
+    ),
+    max_size_gb: Optional[float] = typer.Option(
+        None, help="Drop the oldest backup schemas until the rest fit in this size"
+    ),
+    min_keep: int = typer.Option(
+        1, help="Never let age or size limits rotate below this many backups"
+    ),
+    metrics_file: Optional[str] = typer.Option(
+        None, help="Append per-phase metrics to this file as JSON lines"
+    ),
+    prometheus_file: Optional[str] = typer.Option(
+        None,
+        help="Write run metrics to this Prometheus textfile (e.g. for "
+        "node_exporter's textfile collector)",
+    ),
+    resume: bool = typer.Option(
+        False,
+        help="Continue the latest interrupted backup of this mode, skipping "
+        "the tables it already loaded",
+    ),
+    schemas: list[str] = typer.Option(
+        ["public"],
+        "--schema",
+        help="Supabase schema to back up; repeat for several. The first goes "
+        "into backup_<timestamp>, each other one into backup_<timestamp>__<name>",
+    ),
+    include_tables: list[str] = typer.Option(
+        [],
+        "--include-table",
+        help="Back up only tables matching this pattern (e.g. 'users', "
+        "'billing.*'); repeat for several",
+    ),
+    exclude_tables: list[str] = typer.Option(
+        [],
+        "--exclude-table",
+        help="Leave tables matching this pattern out of the backup",
+    ),
+    exclude_table_data: list[str] = typer.Option(
+        [],
+        "--exclude-table-data",
+        help="Back up tables matching this pattern without their rows",
+    ),
+    first: list[str] = typer.Option(
+        [], help="Copy tables matching this pattern first, in the order given"
+    ),
+    last: list[str] = typer.Option(
+        [], help="Copy tables matching this pattern last, in the order given"
+    ),
+    budget_gb: Optional[float] = typer.Option(
+        None,
+        help="Copy the rows of tables, in copy order, only while their total "
+        "size on Supabase fits in this many GiB; the rest are backed up "
+        "without rows and reported",
+    ),
+    all_projects: bool = typer.Option(
+        False,
+        "--all",
+        help="Back up every project listed in --projects instead of the one "
+        "in SUPABASE_DATABASE_URL / NEON_DATABASE_URL",
+    ),
+    projects: str = typer.Option(
+        "supaneon.toml", help="Projects file (TOML) read by --all"
+    ),
+    processes: int = typer.Option(
+        fanout.DEFAULT_PROCESSES, help="Projects backed up at once with --all"
+    ),
+    summary_file: Optional[str] = typer.Option(
+        None, help="With --all, also write the per-project results as JSON here"
+    ),
+):
     """Run a backup and restore to Neon branch."""
-    backup.run()
+    retention = RetentionPolicy(
+        keep=keep or None,
+        max_age=datetime.timedelta(days=max_age_days) if max_age_days else None,
+        max_bytes=int(max_size_gb * 1024**3) if max_size_gb else None,
+        min_keep=min_keep,
+    )
+    options = backup.BackupOptions(
+        mode=mode,
+        workers=workers,
+        incremental=incremental,
+        split_bytes=int(split_gb * 1024**3) or None,
+        copy_format=copy_format,
+        artifact_dir=artifact_dir,
+        compression=compression,
+        compression_level=compression_level,
+        retention=retention,
+        metrics_file=metrics_file,
+        prometheus_file=prometheus_file,
+        resume=resume,
+        schemas=schemas,
+        tables=TableFilter(
+            include=include_tables,
+            exclude=exclude_tables,
+            exclude_data=exclude_table_data,
+            first=first,
+            last=last,
+            budget_bytes=int(budget_gb * 1024**3) if budget_gb is not None else None,
+        ),
+    )
+    if not all_projects:
+        backup.run(options=options)
+        return
+
+    results = fanout.run_all(config.load_projects(projects), options, processes)
+    typer.echo(fanout.summary(results))
+    if summary_file:
+        fanout.write_summary(results, summary_file)
+    if not all(r.ok for r in results):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def sync_stream(
+    slot: str = typer.Option(
+        cdc.DEFAULT_SLOT,
+        help="Replication slot (and publication) to create and read on Supabase",
+    ),
+    schema: str = typer.Option("public", help="Supabase schema to follow"),
+    target_schema: str = typer.Option(cdc.LIVE_SCHEMA, help="Neon schema kept in sync"),
+    batch_changes: int = typer.Option(
+        cdc.DEFAULT_BATCH_CHANGES,
+        help="Changes applied per Neon transaction (whole transactions only)",
+    ),
+    poll_interval: float = typer.Option(
+        cdc.DEFAULT_POLL_INTERVAL,
+        help="Seconds to wait for new changes once caught up",
+    ),
+    workers: int = typer.Option(
+        backup.DEFAULT_WORKERS, help="Parallel table copies of the full load"
+    ),
+    resync: bool = typer.Option(
+        False,
+        help="Reload the target schema from scratch (e.g. after DDL changes "
+        "on Supabase)",
+    ),
+    once: bool = typer.Option(
+        False, help="Apply the changes made so far, then exit (e.g. from cron)"
+    ),
+    metrics_file: Optional[str] = typer.Option(
+        None, help="Append the full load's metrics to this file as JSON lines"
+    ),
+):
+    """Continuously apply Supabase's changes to a live Neon schema."""
+    applied = backup.sync_stream(
+        options=backup.SyncOptions(
+            slot=slot,
+            source_schema=schema,
+            target_schema=target_schema,
+            batch_changes=batch_changes,
+            poll_interval=poll_interval,
+            workers=workers,
+            resync=resync,
+            once=once,
+            metrics_file=metrics_file,
+        )
+    )
+    typer.echo(f"Applied {applied} changes.")
+
+
+@app.command()
+def restore_artifact(
+    artifact_dir: str = typer.Argument(..., help="Directory holding manifest.json"),
+    schema: Optional[str] = typer.Option(
+        None, help="Target schema (default: the schema recorded in the manifest)"
+    ),
+):
+    """Replay a kept backup artifact into Neon without touching Supabase."""
+    target = backup.restore_artifact(artifact_dir, target_schema=schema)
+    typer.echo(f"Artifact restored into schema {target}.")
 
 
 @app.command()
-def restore_test():
+def restore_test(
+    fast: bool = typer.Option(
+        False,
+        help="Use row estimates from one catalog query (after ANALYZE) instead "
+        "of counting every table",
+    ),
+    sample: int = typer.Option(
+        0, help="With --fast, count this many randomly chosen tables exactly"
+    ),
+    workers: int = typer.Option(
+        healthcheck.DEFAULT_WORKERS, help="Concurrent exact counts with --fast"
+    ),
+    budget: Optional[float] = typer.Option(
+        None, help="Seconds allowed for the exact counts of --sample"
+    ),
+):
     """Run a restore test using the latest backup."""
-    restore.run_restore_test()
+    restore.run_restore_test(fast=fast, sample=sample, workers=workers, budget=budget)
+
+
+@app.command()
+def verify(
+    schema: Optional[str] = typer.Option(
+        None, help="Backup schema to verify (default: the latest)"
+    ),
+    workers: int = typer.Option(
+        backup.DEFAULT_WORKERS, help="Concurrent range checks per database"
+    ),
+    chunk_rows: int = typer.Option(
+        DEFAULT_CHUNK_ROWS, help="Approximate rows per primary-key range"
+    ),
+):
+    """Compare row counts and checksums of a backup against Supabase."""
+    reports = restore.run_verify(schema, workers=workers, chunk_rows=chunk_rows)
+    if not all(report.ok for report in reports):
+        typer.echo("Verification failed.")
+        raise typer.Exit(code=1)
+    typer.echo("Backup matches Supabase.")
 
 
 @app.command()
@@ -43,13 +301,11 @@ def enable_uuid_extension(
     schema: str = typer.Option("public", help="Schema to create the extension in")
 ):
     """Enable uuid-ossp extension in the specified schema."""
-    import psycopg
-
     cfg = config.validate_env()
 
     typer.echo(f"Enabling uuid-ossp extension in schema '{schema}'...")
     try:
-        with psycopg.connect(cfg.neon_database_url) as conn:
+        with db.connection(cfg.neon_database_url) as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     f'CREATE EXTENSION IF NOT EXISTS "uuid-ossp" SCHEMA {schema}'
@@ -0,0 +1,264 @@
+"""Compressed, checksummed on-disk copies of backup dumps.
+
+Dump bytes are compressed and hashed as they stream past on their way to
+Neon (see ``tee``), so keeping an artifact never costs a second read of the
+data. Each backup gets a directory with one compressed file per dump and a
+``manifest.json`` recording SHA-256 sums of the compressed files and of the
+raw dump bytes.
+
+Artifacts hold the original, un-remapped dump, so they can be replayed into
+any schema later without touching Supabase.
+"""
+
+from __future__ import annotations
+
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+from .exceptions import BackupError, RestoreError
+
+COMPRESSIONS = ("gzip", "zstd")
+MANIFEST_NAME = "manifest.json"
+
+_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+_HASH_CHUNK = 1024 * 1024
+# Lines are batched before hitting the compressor to keep per-call overhead
+# off the hot path.
+_WRITE_BATCH = 1024 * 1024
+
+
+@dataclass
+class ArtifactFile:
+    name: str
+    sha256: str
+    bytes: int
+    raw_sha256: str
+    raw_bytes: int
+
+
+class _HashingWriter:
+    """Minimal binary sink that hashes and counts what is written to it."""
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+
+def _zstandard():
+    try:
+        import zstandard  # type: ignore[import-not-found]
+    except ImportError as exc:
+        raise BackupError(
+            "zstd compression requires the 'zstandard' package "
+            "(pip install 'supaneon-sync[zstd]')"
+        ) from exc
+    return zstandard
+
+
+class ArtifactWriter:
+    """Compress and checksum a dump into ``path`` while it is being written.
+
+    ``threads`` only applies to zstd (``-1`` uses every core); gzip is always
+    single-threaded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compression: str = "gzip",
+        level: int | None = None,
+        threads: int = -1,
+    ):
+        if compression not in COMPRESSIONS:
+            raise BackupError(
+                f"Unknown compression '{compression}' "
+                f"(expected one of: {', '.join(COMPRESSIONS)})"
+            )
+        self.path = path
+        self._raw = open(path, "wb")
+        self._hashed = _HashingWriter(self._raw)
+        self._raw_sha256 = hashlib.sha256()
+        self._raw_bytes = 0
+        self._pending = bytearray()
+
+        self._compressor: io.BufferedIOBase
+        if compression == "gzip":
+            self._compressor = gzip.GzipFile(
+                fileobj=self._hashed,  # type: ignore[arg-type]
+                mode="wb",
+                compresslevel=6 if level is None else level,
+            )
+        else:
+            zstandard = _zstandard()
+            cctx = zstandard.ZstdCompressor(
+                level=3 if level is None else level, threads=threads
+            )
+            self._compressor = cctx.stream_writer(self._hashed, closefd=False)
+
+    def write(self, data: bytes) -> None:
+        self._pending += data
+        if len(self._pending) >= _WRITE_BATCH:
+            self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        if self._pending:
+            self._raw_sha256.update(self._pending)
+            self._raw_bytes += len(self._pending)
+            self._compressor.write(self._pending)
+            self._pending.clear()
+
+    def close(self) -> ArtifactFile:
+        self._flush_pending()
+        self._compressor.close()
+        self._raw.close()
+        return ArtifactFile(
+            name=os.path.basename(self.path),
+            sha256=self._hashed.sha256.hexdigest(),
+            bytes=self._hashed.bytes,
+            raw_sha256=self._raw_sha256.hexdigest(),
+            raw_bytes=self._raw_bytes,
+        )
+
+    def abort(self) -> None:
+        try:
+            self._compressor.close()
+        finally:
+            self._raw.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def artifact_path(artifact_dir: str, name: str, compression: str) -> str:
+    return os.path.join(artifact_dir, name + _EXTENSIONS[compression])
+
+
+def tee(lines: Iterable[bytes], writer: ArtifactWriter) -> Iterator[bytes]:
+    """Generator stage copying every line into ``writer`` on its way through."""
+    for line in lines:
+        writer.write(line)
+        yield line
+
+
+def write_manifest(
+    artifact_dir: str,
+    backup_schema: str,
+    compression: str,
+    files: list[ArtifactFile],
+    schemas: list[str] | None = None,
+    excluded: list[tuple[str, str]] | None = None,
+    without_data: list[tuple[str, str]] | None = None,
+) -> str:
+    path = os.path.join(artifact_dir, MANIFEST_NAME)
+    manifest = {
+        "backup_schema": backup_schema,
+        # Supabase schemas in the dumps, the one restored as ``backup_schema``
+        # first.
+        "schemas": schemas or ["public"],
+        # (schema, table)s left out of the dumps, or dumped without rows.
+        "excluded_tables": [list(name) for name in excluded or []],
+        "tables_without_data": [list(name) for name in without_data or []],
+        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "compression": compression,
+        "files": [asdict(f) for f in files],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    return path
+
+
+def read_manifest(artifact_dir: str) -> dict:
+    with open(os.path.join(artifact_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify_artifact(artifact_dir: str) -> dict:
+    """Check every file against the manifest; raises RestoreError on mismatch."""
+    manifest = read_manifest(artifact_dir)
+    for entry in manifest["files"]:
+        digest = hashlib.sha256()
+        with open(os.path.join(artifact_dir, entry["name"]), "rb") as f:
+            while chunk := f.read(_HASH_CHUNK):
+                digest.update(chunk)
+        if digest.hexdigest() != entry["sha256"]:
+            raise RestoreError(f"Checksum mismatch for artifact {entry['name']}")
+    return manifest
+
+
+def open_artifact(path: str, compression: str) -> io.BufferedIOBase:
+    """Open a compressed artifact for reading its raw dump bytes."""
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    reader = _zstandard().ZstdDecompressor().stream_reader(open(path, "rb"))
+    # The zstd reader has no readline; buffering it makes it line-iterable.
+    return io.BufferedReader(reader)
+
+
+class ArtifactRecorder:
+    """Collects the artifacts of one backup under ``<root>/<backup_schema>``."""
+
+    def __init__(
+        self,
+        root: str,
+        backup_schema: str,
+        compression: str = "gzip",
+        level: int | None = None,
+        schemas: list[str] | None = None,
+        excluded: list[tuple[str, str]] | None = None,
+        without_data: list[tuple[str, str]] | None = None,
+    ):
+        self.dir = os.path.join(root, backup_schema)
+        self.backup_schema = backup_schema
+        self.compression = compression
+        self.level = level
+        self.schemas = schemas
+        self.excluded = excluded
+        self.without_data = without_data
+        self._writers: list[ArtifactWriter] = []
+        os.makedirs(self.dir, exist_ok=True)
+
+    def stage(self, name: str) -> Callable[[Iterable[bytes]], Iterator[bytes]]:
+        """Generator stage recording the lines passing through as ``name``."""
+        writer = ArtifactWriter(
+            artifact_path(self.dir, name, self.compression),
+            self.compression,
+            self.level,
+        )
+        self._writers.append(writer)
+        return lambda lines: tee(lines, writer)
+
+    def finish(self) -> str:
+        files = [w.close() for w in self._writers]
+        return write_manifest(
+            self.dir,
+            self.backup_schema,
+            self.compression,
+            files,
+            self.schemas,
+            self.excluded,
+            self.without_data,
+        )
+
+    def abort(self) -> None:
+        for writer in self._writers:
+            writer.abort()
+        manifest = os.path.join(self.dir, MANIFEST_NAME)
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        if not os.listdir(self.dir):
+            os.rmdir(self.dir)
@@ -1,54 +1,221 @@
 """
 Backup orchestration:
-- Dump Supabase schema (schema-only)
+- Dump Supabase schema (pre-data and post-data sections)
 - Dump Supabase data (data-only)
-- Remap public -> backup_<timestamp>
-- Restore into timestamped Neon schema
+- Remap public -> backup_<timestamp> (further schemas, see
+  ``BackupOptions.schemas``, to companion schemas ``backup_<timestamp>__<name>``)
+- Restore tables, then data, into timestamped Neon schema
+- Build indexes, constraints and triggers in parallel (see ``postdata``)
+
+Modes:
+- ``plain``: dump to files, remap into new files, restore with psql
+- ``stream``: pipe pg_dump -> remapper -> psql with no intermediate files
+- ``copy``: parallel per-table COPY under one exported snapshot, optionally
+  incremental (unchanged tables are cloned from the previous backup on Neon)
+- ``directory``: ``pg_dump --format=directory --jobs=N`` with a parallel load
+- ``async``: the steps of ``copy`` as an asyncio DAG (see ``orchestrator``),
+  so dumps, remaps and table copies run as soon as their inputs are ready
+- ``branch``: refresh one rolling schema in place and snapshot it as a Neon
+  branch per backup (see ``branches``)
+
+``sync_stream`` is not a backup: it keeps one live schema continuously up to
+date from Supabase's change stream (see ``cdc``).
+
+Every schema mode records its progress per table (see ``checkpoint``), so an
+interrupted backup can be resumed with ``BackupOptions.resume``.
+
+``BackupOptions.tables`` leaves tables out of a backup, or their rows, and
+orders the table copies (see ``filters``).
 """
 
 from __future__ import annotations
 
+import asyncio
 import datetime
+import re
 import subprocess
-import psycopg
 import os
-import re
-from typing import Optional
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Iterable, Iterator, Optional, Sequence
 
+from . import cdc, db, orchestrator
+from .artifacts import ArtifactRecorder, open_artifact, verify_artifact
+from .branches import (
+    ROLLING_SCHEMA,
+    branch_name,
+    ddl_hash,
+    forget_load,
+    loaded_ddl_hash,
+    record_load,
+    refresh_tables,
+    rotate_branches,
+)
+from .checkpoint import (
+    STATUS_RUNNING,
+    STEP_TABLES,
+    Checkpoint,
+    finish_run,
+    forget_run,
+    incomplete_runs,
+    record_watermark,
+    start_run,
+)
 from .config import validate_env
+from .copier import (
+    COPY_FORMATS,
+    DEFAULT_SPLIT_BYTES,
+    DEFAULT_WORKERS,
+    copy_sequences,
+    copy_tables,
+    stall_seconds,
+)
+from .directory import dump_directory, load_directory
+from .exceptions import BackupError
+from .filters import TableFilter, TableSelection, select_tables
+from .incremental import (
+    IncrementalPlan,
+    clone_tables,
+    plan_incremental,
+    table_fingerprints,
+    xmin_watermark,
+)
+from .metrics import RunMetrics, count_bytes, file_size
+from .manifest import (
+    ACTION_CLONED,
+    ACTION_COPIED,
+    ACTION_EXCLUDED,
+    ACTION_SKIPPED,
+    META_SCHEMA,
+    ManifestEntry,
+    forget_manifest,
+    load_manifest,
+    record_manifest,
+)
+from .neon import NeonClient
+from .postdata import apply_post_data
+from .remap import Remapper, remap_file
+from .rotation import RetentionPolicy
+from .stream import Stage, iter_source, run_pipeline, run_sink, run_source
+from .utils import schema_flag
 
 SCHEMA_DUMP = "schema.sql"
 SCHEMA_REMAPPED = "schema.remapped.sql"
 DATA_DUMP = "data.sql"
 DATA_REMAPPED = "data.remapped.sql"
+POSTDATA_DUMP = "postdata.sql"
+POSTDATA_REMAPPED = "postdata.remapped.sql"
+# Artifact files in the order they are replayed: tables, their rows, then the
+# indexes, constraints and triggers.
+REPLAY_ORDER = (SCHEMA_DUMP, DATA_DUMP, POSTDATA_DUMP)
+
+
+# Joins a backup schema and the source schema of one of its companions.
+COMPANION_SEPARATOR = "__"
+# Longest identifier Postgres keeps (NAMEDATALEN - 1).
+MAX_IDENTIFIER = 63
 
 
 def _timestamp() -> str:
     return datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%SZ").lower()
 
 
+def companion_schema(backup_schema: str, source_schema: str) -> str:
+    """Schema holding ``source_schema``'s tables in backup ``backup_schema``."""
+    name = re.sub(r"[^a-z0-9_]", "_", source_schema.lower())
+    return f"{backup_schema}{COMPANION_SEPARATOR}{name}"[:MAX_IDENTIFIER]
+
+
+def target_schemas(backup_schema: str, sources: Sequence[str]) -> dict[str, str]:
+    """Map each source schema to its schema on Neon.
+
+    The first source is restored into ``backup_schema`` itself, every other
+    one into a companion schema that is listed, rotated and dropped together
+    with it.
+    """
+    targets = {sources[0]: backup_schema}
+    for source in sources[1:]:
+        targets[source] = companion_schema(backup_schema, source)
+    return targets
+
+
 # ---------------------------------------------------------------------
 # Schema rotation helpers
 # ---------------------------------------------------------------------
 
 
 def list_backup_schemas(conn_url: str) -> list[str]:
-    with psycopg.connect(conn_url) as conn:
+    """Completed backup schemas, oldest first.
+
+    Schemas of backups still running, or interrupted, are not listed, nor
+    are companion schemas (see ``target_schemas``).
+    """
+    with db.connection(conn_url) as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT schema_name
-                FROM information_schema.schemata
-                WHERE schema_name LIKE 'backup_%'
-                ORDER BY schema_name ASC
-            """)
+            cur.execute("SELECT to_regclass(%s)", (f'"{META_SCHEMA}".backup_runs',))
+            row = cur.fetchone()
+            if row is None or row[0] is None:
+                cur.execute("""
+                    SELECT schema_name
+                    FROM information_schema.schemata
+                    WHERE schema_name LIKE 'backup_%'
+                      AND position('__' IN schema_name) = 0
+                    ORDER BY schema_name ASC
+                """)
+            else:
+                cur.execute(
+                    f"""
+                    SELECT schema_name
+                    FROM information_schema.schemata
+                    WHERE schema_name LIKE 'backup_%%'
+                      AND position('__' IN schema_name) = 0
+                      AND schema_name NOT IN (
+                          SELECT backup_schema FROM "{META_SCHEMA}".backup_runs
+                          WHERE status = %s
+                      )
+                    ORDER BY schema_name ASC
+                    """,
+                    (STATUS_RUNNING,),
+                )
             return [row[0] for row in cur.fetchall()]
 
 
-def delete_schema(conn_url: str, schema_name: str) -> None:
-    with psycopg.connect(conn_url) as conn:
-        conn.autocommit = True
+def schema_sizes(conn_url: str, schemas: list[str]) -> dict[str, int]:
+    """Bytes used on disk by each schema, indexes and TOAST included.
+
+    A backup schema's companions count towards its size.
+    """
+    with db.connection(conn_url) as conn:
+        rows = conn.execute(
+            """
+            SELECT s.name, coalesce(sum(pg_total_relation_size(c.oid)), 0)
+            FROM unnest(%s::text[]) AS s(name)
+            JOIN pg_namespace n
+              ON n.nspname = s.name OR starts_with(n.nspname, s.name || '__')
+            LEFT JOIN pg_class c
+              ON c.relnamespace = n.oid AND c.relkind IN ('r', 'm', 'p')
+            GROUP BY s.name
+            """,
+            (schemas,),
+        ).fetchall()
+    return {name: int(size) for name, size in rows}
+
+
+def delete_schema(conn_url: str, schema_name: str) -> list[str]:
+    """Drop ``schema_name`` and its companion schemas; returns their names."""
+    with db.connection(conn_url, autocommit=True) as conn:
         with conn.cursor() as cur:
-            cur.execute(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE')
+            cur.execute(
+                "SELECT nspname FROM pg_namespace WHERE starts_with(nspname, %s)",
+                (schema_name + COMPANION_SEPARATOR,),
+            )
+            names = [schema_name, *(row[0] for row in cur.fetchall())]
+            quoted = ", ".join(f'"{name}"' for name in names)
+            cur.execute(f"DROP SCHEMA IF EXISTS {quoted} CASCADE")
+    return names
 
 
 # ---------------------------------------------------------------------
@@ -56,183 +223,1303 @@ def delete_schema(conn_url: str, schema_name: str) -> None:
 # ---------------------------------------------------------------------
 
 
-def remap_schema_file(src: str, dst: str, new_schema: str) -> None:
-    """Robust regex-based schema remapper for PostgreSQL dumps."""
-
-    SKIP_PREFIXES = (
-        "GRANT ",
-        "REVOKE ",
-        "ALTER DEFAULT PRIVILEGES",
-        "SET ROLE",
-        "CREATE POLICY",
-        "ALTER POLICY",
-        "DROP POLICY",
-    )
-
-    SKIP_CONTAINS = (
-        "ROW LEVEL SECURITY",
-        "TO anon",
-        "TO authenticated",
-        "TO service_role",
-        "EXTENSION ",
-    )
-
-    public_quoted_re = re.compile(r'"public"')
-    public_unquoted_re = re.compile(r"(?<!\w)public\.")
-    extensions_re = re.compile(r'("extensions"|extensions)\.')
+def remap_schema_lines(lines: Iterable[bytes], new_schema: str) -> Iterator[bytes]:
+    """Generator stage rewriting schema-only dump lines to ``new_schema``."""
+    return Remapper(new_schema).remap(lines)
 
-    with (
-        open(src, "r", encoding="utf-8") as fin,
-        open(dst, "w", encoding="utf-8") as fout,
-    ):
-        for line in fin:
-            if line.startswith(SKIP_PREFIXES) or any(x in line for x in SKIP_CONTAINS):
-                continue
 
-            if "SCHEMA public" in line:
-                continue
+def remap_data_lines(lines: Iterable[bytes], new_schema: str) -> Iterator[bytes]:
+    """Generator stage rewriting data-only dump lines to ``new_schema``.
 
-            line = public_quoted_re.sub(f'"{new_schema}"', line)
-            line = public_unquoted_re.sub(f"{new_schema}.", line)
-            line = extensions_re.sub("public.", line)
+    COPY data rows are passed through untouched.
+    """
+    return Remapper(new_schema).remap(lines)
 
-            line = line.replace("search_path = public", f"search_path = {new_schema}")
-            line = line.replace("extensions.uuid_generate_v4()", "gen_random_uuid()")
-            line = line.replace("'extensions'", f"'{new_schema}'")
 
-            fout.write(line)
+def remap_schema_file(src: str, dst: str, new_schema: str) -> None:
+    """Rewrite a schema-only dump so DDL targets the backup schema."""
+    remap_file(src, dst, new_schema)
 
 
 def remap_data_file(src: str, dst: str, new_schema: str) -> None:
-    """Rewrite data-only dump so INSERT/COPY target backup schema."""
-    public_re = re.compile(r"(?<!\w)public\.")
-    with (
-        open(src, "r", encoding="utf-8") as fin,
-        open(dst, "w", encoding="utf-8") as fout,
-    ):
-        for line in fin:
-            fout.write(public_re.sub(f"{new_schema}.", line))
+    """Rewrite data-only dump so INSERT/COPY target backup schema.
+
+    COPY payloads are written straight from a memory map of ``src``.
+    """
+    remap_file(src, dst, new_schema)
 
 
 # ---------------------------------------------------------------------
-# Main
+# Dump / restore commands
 # ---------------------------------------------------------------------
 
 
-def run(supabase_url: Optional[str] = None, neon_url: Optional[str] = None):
-    cfg = validate_env()
-    supabase_url = supabase_url or cfg.supabase_database_url
-    neon_url = neon_url or cfg.neon_database_url
+def _schema_flags(schemas: Sequence[str]) -> list[str]:
+    return [schema_flag(schema) for schema in schemas]
+
+
+def _schema_dump_cmd(
+    supabase_url: str,
+    section: str | None = None,
+    snapshot: str | None = None,
+    schemas: Sequence[str] = ("public",),
+    extra: Sequence[str] = (),
+) -> list[str]:
+    # All schemas in one dump, so pg_dump orders DDL across them.
+    return [
+        "pg_dump",
+        f"--section={section}" if section else "--schema-only",
+        *_schema_flags(schemas),
+        *extra,
+        "--no-owner",
+        "--no-acl",
+        *([f"--snapshot={snapshot}"] if snapshot else []),
+        supabase_url,
+    ]
+
+
+def _data_dump_cmd(
+    supabase_url: str, schemas: Sequence[str] = ("public",), extra: Sequence[str] = ()
+) -> list[str]:
+    return [
+        "pg_dump",
+        "--data-only",
+        *_schema_flags(schemas),
+        *extra,
+        supabase_url,
+    ]
 
+
+def _psql_cmd(neon_url: str, *extra: str) -> list[str]:
+    return ["psql", neon_url, "-v", "ON_ERROR_STOP=1", *extra]
+
+
+def _record(recorder: ArtifactRecorder | None, name: str) -> list[Stage]:
+    """Artifact tee stage for ``name``, if artifacts are being kept."""
+    return [recorder.stage(name)] if recorder else []
+
+
+def _dump_to_file(
+    cmd: list[str], path: str, recorder: ArtifactRecorder | None, name: str
+) -> None:
+    if recorder is None:
+        with open(path, "wb") as fout:
+            subprocess.run(cmd, check=True, stdout=fout)
+    else:
+        run_source(cmd, path, *_record(recorder, name))
+
+
+def _no_wait() -> None:
+    pass
+
+
+@dataclass
+class BackupJob:
+    """Everything a backup mode needs to run one backup."""
+
+    supabase_url: str
+    neon_url: str
+    schema: str
+    options: BackupOptions
+    metrics: RunMetrics
+    checkpoint: Checkpoint
+    recorder: ArtifactRecorder | None = None
+    # Blocks until the new schema exists on Neon. Modes
+    # call it right before their first write to Neon, so that Supabase work
+    # done before that point overlaps with the preparation.
+    neon_ready: Callable[[], None] = _no_wait
+    # Tables filtered by ``options.tables``, if it filters any.
+    selection: TableSelection | None = None
+
+    @property
+    def source(self) -> str:
+        """The Supabase schema restored into ``schema`` itself."""
+        return self.options.schemas[0]
+
+    @property
+    def targets(self) -> dict[str, str]:
+        """Every Supabase schema backed up, mapped to its Neon schema."""
+        return target_schemas(self.schema, self.options.schemas)
+
+    @property
+    def companions(self) -> dict[str, str]:
+        """``targets`` but for ``source``."""
+        return {s: t for s, t in self.targets.items() if s != self.source}
+
+    @property
+    def excluded(self) -> list[tuple[str, str]]:
+        return self.selection.excluded if self.selection else []
+
+    @property
+    def without_data(self) -> list[tuple[str, str]]:
+        return self.selection.without_data if self.selection else []
+
+    @property
+    def dump_flags(self) -> list[str]:
+        return self.selection.dump_flags() if self.selection else []
+
+    def remapper(self) -> Remapper:
+        return Remapper(self.schema, self.targets, self.excluded, self.without_data)
+
+    def schema_dump_cmd(
+        self, section: str | None = None, snapshot: str | None = None
+    ) -> list[str]:
+        return _schema_dump_cmd(
+            self.supabase_url, section, snapshot, self.options.schemas, self.dump_flags
+        )
+
+    def data_dump_cmd(self) -> list[str]:
+        return _data_dump_cmd(self.supabase_url, self.options.schemas, self.dump_flags)
+
+
+def _create_tables(job: BackupJob, apply: Callable[[], object]) -> None:
+    """Run ``apply`` to create the backup's tables, unless already done."""
+    if job.checkpoint.done(STEP_TABLES):
+        print("Tables were created by an earlier attempt; skipping.")
+        return
+    if job.checkpoint.resumed:
+        _recreate_schema(job)
+    apply()
+    job.checkpoint.mark_now(STEP_TABLES)
+
+
+def _recreate_schema(job: BackupJob) -> None:
+    # A partly applied pre-data section cannot be told from a complete one,
+    # so the schema starts over; no data has been loaded into it yet.
+    print(f"Recreating schema {job.schema}...")
+    delete_schema(job.neon_url, job.schema)
+    for target in job.targets.values():
+        _create_schema(job.neon_url, target)
+
+
+def _run_plain(job: BackupJob) -> None:
+    """Dump to files, remap into new files, then restore each into Neon.
+
+    Tables are created before the data is loaded, and indexes, constraints
+    and triggers only after it, so the load does not maintain them row by row.
+    """
     # ---------------------------
-    # Rotation policy
+    # Dump schema (pre-data section)
     # ---------------------------
-    max_schemas = 6
-    backup_schemas = list_backup_schemas(neon_url)
+    print("Dumping Supabase schema (pre-data)...")
 
-    while len(backup_schemas) >= max_schemas:
-        oldest = backup_schemas.pop(0)
-        print(f"Rotation: deleting old schema {oldest}...")
-        delete_schema(neon_url, oldest)
+    with job.metrics.phase("dump_schema") as m:
+        _dump_to_file(
+            job.schema_dump_cmd("pre-data"),
+            SCHEMA_DUMP,
+            job.recorder,
+            SCHEMA_DUMP,
+        )
+        m.bytes_out = file_size(SCHEMA_DUMP)
 
-    new_schema = f"backup_{_timestamp()}".lower()
-    print(f"Creating backup schema {new_schema}...")
+    # ---------------------------
+    # Dump data-only
+    # ---------------------------
+    print("Dumping Supabase data (data-only)...")
+
+    with job.metrics.phase("dump_data") as m:
+        _dump_to_file(
+            job.data_dump_cmd(),
+            DATA_DUMP,
+            job.recorder,
+            DATA_DUMP,
+        )
+        m.bytes_out = file_size(DATA_DUMP)
+
+    # ---------------------------
+    # Dump post-data, last: artifacts keep the files in dump order
+    # ---------------------------
+    print("Dumping Supabase indexes, constraints and triggers (post-data)...")
+
+    with job.metrics.phase("dump_post_data") as m:
+        _dump_to_file(
+            job.schema_dump_cmd("post-data"),
+            POSTDATA_DUMP,
+            job.recorder,
+            POSTDATA_DUMP,
+        )
+        m.bytes_out = file_size(POSTDATA_DUMP)
+
+    # ---------------------------
+    # Remap schema + data
+    # ---------------------------
+    filtered = job.targets, job.excluded, job.without_data
+    print(f"Remapping schema to {job.schema}...")
+    with job.metrics.phase("remap_schema") as m:
+        remap_file(SCHEMA_DUMP, SCHEMA_REMAPPED, job.schema, *filtered)
+        remap_file(POSTDATA_DUMP, POSTDATA_REMAPPED, job.schema, *filtered)
+        m.bytes_in = file_size(SCHEMA_DUMP) + file_size(POSTDATA_DUMP)
+        m.bytes_out = file_size(SCHEMA_REMAPPED) + file_size(POSTDATA_REMAPPED)
+
+    print(f"Remapping data to {job.schema}...")
+    with job.metrics.phase("remap_data") as m:
+        remap_file(DATA_DUMP, DATA_REMAPPED, job.schema, *filtered)
+        m.bytes_in, m.bytes_out = file_size(DATA_DUMP), file_size(DATA_REMAPPED)
+
+    job.neon_ready()
+
+    # ---------------------------
+    # Restore schema
+    # ---------------------------
+    print("Restoring tables into Neon...")
+
+    with job.metrics.phase("restore_schema") as m:
+        _create_tables(
+            job,
+            lambda: subprocess.run(
+                _psql_cmd(job.neon_url, "-f", SCHEMA_REMAPPED), check=True
+            ),
+        )
+        m.bytes_in = file_size(SCHEMA_REMAPPED)
+
+    # ---------------------------
+    # Restore data
+    # ---------------------------
+    print("Restoring data into Neon...")
+
+    with job.metrics.phase("restore_data") as m:
+        with open(DATA_REMAPPED, "rb") as f:
+            run_sink(f, _psql_cmd(job.neon_url), job.checkpoint.resume_stage)
+        m.bytes_in = file_size(DATA_REMAPPED)
 
     # ---------------------------
-    # Prepare Neon schema
+    # Indexes, constraints, triggers
     # ---------------------------
-    with psycopg.connect(neon_url) as conn:
-        conn.autocommit = True
+    with open(POSTDATA_REMAPPED, "rb") as f:
+        _post_data_section(job, f)
+
+
+def _stream_section(
+    job: BackupJob,
+    phase: str,
+    source_cmd: list[str],
+    artifact: str | None = None,
+    *after_remap: Stage,
+) -> None:
+    """Pipe ``source_cmd`` through the remapper into psql as one phase."""
+    with job.metrics.phase(phase) as m:
+        run_pipeline(
+            source_cmd,
+            _psql_cmd(job.neon_url),
+            lambda lines: count_bytes(lines, m, "in"),
+            *(_record(job.recorder, artifact) if artifact else []),
+            job.remapper().remap,
+            *after_remap,
+            lambda lines: count_bytes(lines, m, "out"),
+        )
+
+
+def _post_data_section(job: BackupJob, lines: Iterable[bytes]) -> None:
+    """Apply remapped post-data SQL over ``options.workers`` Neon connections."""
+    workers = job.options.workers
+    print(f"Building indexes, constraints and triggers with {workers} workers...")
+    with job.metrics.phase("post_data") as m:
+        created = apply_post_data(
+            job.neon_url, count_bytes(lines, m, "in"), workers, job.checkpoint
+        )
+    print(f"Created {created} post-data objects.")
+
+
+def _post_data_source(
+    job: BackupJob, source_cmd: list[str], artifact: str | None = None
+) -> Iterator[bytes]:
+    """Remapped post-data SQL read from ``source_cmd``."""
+    return iter_source(
+        source_cmd,
+        *(_record(job.recorder, artifact) if artifact else []),
+        job.remapper().remap,
+    )
+
+
+def _run_stream(job: BackupJob) -> None:
+    """Pipe pg_dump -> remapper -> psql without touching the disk."""
+    job.neon_ready()
+
+    print(f"Streaming Supabase schema into Neon as {job.schema}...")
+    created_before = job.checkpoint.done(STEP_TABLES)
+    _create_tables(
+        job,
+        lambda: _stream_section(
+            job,
+            "stream_schema",
+            job.schema_dump_cmd("pre-data"),
+            SCHEMA_DUMP,
+        ),
+    )
+    if created_before and job.recorder is not None:
+        # Not applied again, but restoring the artifact starts with it.
+        with job.metrics.phase("dump_schema"):
+            run_source(
+                job.schema_dump_cmd("pre-data"),
+                os.devnull,
+                *_record(job.recorder, SCHEMA_DUMP),
+            )
+
+    print(f"Streaming Supabase data into Neon as {job.schema}...")
+    _stream_section(
+        job,
+        "stream_data",
+        job.data_dump_cmd(),
+        DATA_DUMP,
+        job.checkpoint.resume_stage,
+    )
+
+    _post_data_section(
+        job,
+        _post_data_source(job, job.schema_dump_cmd("post-data"), POSTDATA_DUMP),
+    )
+
+
+def _run_copy(job: BackupJob) -> None:
+    """Load pre-data DDL, copy tables in parallel, then add post-data DDL.
+
+    Constraints and indexes are created after the copy so that tables can be
+    loaded in any order without tripping foreign keys. With
+    ``options.incremental`` tables unchanged since the previous backup are
+    cloned on Neon instead of copied from Supabase; companion schemas are
+    always copied in full.
+    """
+    supabase_url, neon_url, new_schema = job.supabase_url, job.neon_url, job.schema
+    options, metrics, checkpoint = job.options, job.metrics, job.checkpoint
+    source = job.source
+    job.neon_ready()
+
+    print(f"Streaming Supabase pre-data schema into Neon as {new_schema}...")
+    _create_tables(
+        job,
+        lambda: _stream_section(job, "pre_data", job.schema_dump_cmd("pre-data")),
+    )
+    # Tables loaded by an earlier attempt of this backup: (target, table).
+    loaded_before = []
+    for step in checkpoint.steps("table:"):
+        name = step.removeprefix("table:")
+        target = next(
+            (t for t in job.companions.values() if name.startswith(t + ".")), None
+        )
+        if target is None:
+            loaded_before.append((new_schema, name))
+        else:
+            loaded_before.append((target, name.removeprefix(target + ".")))
+
+    # Fingerprints are always recorded so the next incremental run has a
+    # baseline; they must be read before copy_tables takes its snapshot.
+    with metrics.phase("plan"):
+        if options.incremental:
+            previous = [s for s in list_backup_schemas(neon_url) if s != new_schema]
+            plan = plan_incremental(
+                supabase_url,
+                neon_url,
+                new_schema,
+                previous[-1] if previous else None,
+                source,
+            )
+        else:
+            watermark = xmin_watermark(supabase_url)
+            plan = IncrementalPlan(
+                fingerprints=table_fingerprints(supabase_url, source),
+                watermark=watermark,
+            )
+        if job.selection is not None:
+            # Left out, or backed up without rows, this time.
+            plan.unchanged = [
+                t for t in plan.unchanged if job.selection.copies(source, t)
+            ]
+        if plan.watermark is not None:
+            record_watermark(neon_url, new_schema, plan.watermark)
+
+    entries: list[ManifestEntry] = []
+    if plan.previous_schema and plan.unchanged:
+        print(
+            f"Cloning {len(plan.unchanged)} unchanged tables "
+            f"from {plan.previous_schema}..."
+        )
+        with metrics.phase("clone") as m:
+            cloned = clone_tables(
+                neon_url, plan.unchanged, plan.previous_schema, new_schema, checkpoint
+            )
+            m.rows = sum(cloned.values())
+        entries += [
+            ManifestEntry(
+                table_name=table,
+                action=ACTION_CLONED,
+                source=plan.previous_schema,
+                fingerprint=plan.fingerprints[table],
+                rows=rows,
+            )
+            for table, rows in cloned.items()
+        ]
+
+    print(f"Copying Supabase tables with {options.workers} workers...")
+    with metrics.phase("copy") as m:
+        results = copy_tables(
+            supabase_url,
+            neon_url,
+            new_schema,
+            workers=options.workers,
+            source_schema=source,
+            only=plan.changed if options.incremental else None,
+            checkpoint=checkpoint,
+            schemas=job.companions,
+            selection=job.selection,
+            split_bytes=options.split_bytes,
+            copy_format=options.copy_format,
+        )
+        m.rows = sum(r.rows for r in results)
+        m.bytes_in = m.bytes_out = sum(r.bytes for r in results)
+        m.stall_seconds = stall_seconds(results)
+    print(f"Copied {len(results)} tables ({m.rows} rows).")
+    # Manifests are kept per Neon schema; only the backup schema's own tables
+    # have fingerprints.
+    manifests: dict[str, list[ManifestEntry]] = {new_schema: entries}
+    sources = {target: src for src, target in job.targets.items()}
+    for r in results:
+        manifests.setdefault(r.schema or new_schema, []).append(
+            ManifestEntry(
+                table_name=r.table,
+                action=ACTION_COPIED,
+                source=sources[r.schema or new_schema],
+                fingerprint=None if r.schema else plan.fingerprints.get(r.table),
+                rows=r.rows,
+            )
+        )
+    # Their data predates this attempt's fingerprints, so none is recorded and
+    # the next incremental backup copies them again.
+    for target, table in loaded_before:
+        was_cloned = target == new_schema and table in plan.unchanged
+        manifests.setdefault(target, []).append(
+            ManifestEntry(
+                table_name=table,
+                action=ACTION_CLONED if was_cloned else ACTION_COPIED,
+                source=(
+                    plan.previous_schema
+                    if was_cloned and plan.previous_schema
+                    else sources[target]
+                ),
+                rows=checkpoint.rows(checkpoint.table_step(table, target)),
+            )
+        )
+
+    with metrics.phase("sequences"):
+        for src, target in job.targets.items():
+            copy_sequences(supabase_url, neon_url, target, src, job.selection)
+    with metrics.phase("manifest"):
+        for target, target_entries in manifests.items():
+            record_manifest(neon_url, target, target_entries)
+
+    _post_data_section(job, _post_data_source(job, job.schema_dump_cmd("post-data")))
+
+
+def _run_directory(job: BackupJob) -> None:
+    """Parallel directory-format dump, remapped DDL and parallel data load."""
+    workers = job.options.workers
+    with tempfile.TemporaryDirectory(prefix="supaneon-") as tmp:
+        dump_dir = os.path.join(tmp, "dump")
+
+        print(f"Dumping Supabase (directory format, {workers} jobs)...")
+        with job.metrics.phase("dump") as m:
+            dump_directory(
+                job.supabase_url,
+                dump_dir,
+                jobs=workers,
+                schemas=job.options.schemas,
+                extra=job.dump_flags,
+            )
+            m.bytes_out = file_size(dump_dir)
+
+        def apply_section(restore_cmd: list[str]) -> None:
+            if "--section=post-data" in restore_cmd:
+                _post_data_section(job, _post_data_source(job, restore_cmd))
+            else:
+                _create_tables(
+                    job, lambda: _stream_section(job, "pre_data", restore_cmd)
+                )
+
+        job.neon_ready()
+
+        print(f"Restoring into Neon schema {job.schema} with {workers} jobs...")
+        with job.metrics.phase("load") as m:
+            results = load_directory(
+                job.neon_url,
+                dump_dir,
+                job.schema,
+                workers,
+                apply_section,
+                job.checkpoint,
+                job.targets,
+                job.selection,
+            )
+            m.rows = sum(r.rows for r in results)
+            m.bytes_in = sum(r.bytes for r in results)
+        print(f"Loaded {len(results)} tables ({m.rows} rows).")
+
+    # pg_restore's SEQUENCE SET entries are not loaded with the table data;
+    # positions are read from Supabase as in ``copy`` mode, after the data.
+    with job.metrics.phase("sequences"):
+        for src, target in job.targets.items():
+            copy_sequences(job.supabase_url, job.neon_url, target, src, job.selection)
+
+
+def _run_async(job: BackupJob) -> None:
+    """Copy-mode backup run as an asyncio DAG of tasks.
+
+    Both schema sections are dumped under the snapshot the tables are copied
+    from, and remapped, while Neon is still being prepared; each table is
+    copied as soon as the tables exist, and post-data objects are built once
+    every copy is done. Incremental backups are not supported in this mode.
+    """
+    asyncio.run(_async_backup(job))
+
+
+async def _async_backup(job: BackupJob) -> None:
+    supabase_url, neon_url, new_schema = job.supabase_url, job.neon_url, job.schema
+    workers, metrics, checkpoint = job.options.workers, job.metrics, job.checkpoint
+    remapper = job.remapper()
+    targets = job.targets
+    sections: dict[str, bytes] = {}
+
+    async with orchestrator.AsyncPools(max_size=workers + 1) as pools:
+        async with orchestrator.exported_snapshot(
+            pools, supabase_url, job.options.schemas
+        ) as (
+            snapshot,
+            tables,
+        ):
+
+            async def dump(section: str) -> None:
+                phase = section.replace("-", "_")
+                with metrics.phase(f"dump_{phase}") as m:
+                    sections[section] = await orchestrator.read_command(
+                        job.schema_dump_cmd(section, snapshot)
+                    )
+                    m.bytes_out = len(sections[section])
+
+            async def remap(section: str) -> None:
+                phase = section.replace("-", "_")
+                with metrics.phase(f"remap_{phase}") as m:
+                    m.bytes_in = len(sections[section])
+                    lines = sections[section].splitlines(keepends=True)
+                    sections[section] = await asyncio.to_thread(
+                        lambda: b"".join(remapper.remap(lines))
+                    )
+                    m.bytes_out = len(sections[section])
+
+            async def create_tables() -> None:
+                if checkpoint.done(STEP_TABLES):
+                    print("Tables were created by an earlier attempt; skipping.")
+                    return
+                if checkpoint.resumed:
+                    await asyncio.to_thread(_recreate_schema, job)
+                print(f"Creating tables in {new_schema}...")
+                with metrics.phase("pre_data") as m:
+                    await orchestrator.feed_command(
+                        _psql_cmd(neon_url), sections["pre-data"]
+                    )
+                    m.bytes_in = len(sections["pre-data"])
+                async with pools.connection(neon_url) as conn:
+                    await checkpoint.amark(conn, STEP_TABLES)
+
+            def label(schema: str, table: str) -> str:
+                return table if schema == job.source else f"{schema}.{table}"
+
+            async def copy(schema: str, table: str) -> None:
+                with metrics.phase(f"copy:{label(schema, table)}") as m:
+                    result = await orchestrator.copy_table(
+                        pools,
+                        supabase_url,
+                        neon_url,
+                        table,
+                        targets[schema],
+                        snapshot,
+                        checkpoint,
+                        schema,
+                    )
+                    m.rows, m.bytes_in = result.rows, result.bytes
+                print(f"  Copied {label(schema, table)}: {result.rows} rows")
+
+            async def sequences() -> None:
+                with metrics.phase("sequences"):
+                    for source, target in targets.items():
+                        await orchestrator.copy_sequences(
+                            pools, supabase_url, neon_url, target, source, job.selection
+                        )
+
+            async def post_data() -> None:
+                print(
+                    "Building indexes, constraints and triggers "
+                    f"with {workers} workers..."
+                )
+                with metrics.phase("post_data") as m:
+                    m.bytes_in = len(sections["post-data"])
+                    created = await orchestrator.apply_post_data(
+                        pools,
+                        neon_url,
+                        sections["post-data"].splitlines(keepends=True),
+                        workers,
+                        checkpoint,
+                    )
+                print(f"Created {created} post-data objects.")
+
+            dag = orchestrator.Dag()
+            dag.add("neon", lambda: asyncio.to_thread(job.neon_ready), bounded=False)
+            for section in ("pre-data", "post-data"):
+                dag.add(f"dump {section}", partial(dump, section))
+                dag.add(
+                    f"remap {section}",
+                    partial(remap, section),
+                    after=[f"dump {section}"],
+                )
+            dag.add("create tables", create_tables, after=["neon", "remap pre-data"])
+            pending = [
+                (schema, table)
+                for schema, table in tables
+                if not checkpoint.done(checkpoint.table_step(table, targets[schema]))
+            ]
+            if job.selection is not None:
+                selection = job.selection
+                tables = [t for t in tables if selection.copies(*t)]
+                pending = sorted(
+                    (t for t in pending if selection.copies(*t)),
+                    key=lambda t: selection.position(*t),
+                )
+            copies = [
+                dag.add(
+                    f"copy {label(schema, table)}",
+                    partial(copy, schema, table),
+                    after=["create tables"],
+                )
+                for schema, table in pending
+            ]
+            dag.add("sequences", sequences, after=["create tables"])
+            dag.add(
+                "post-data",
+                post_data,
+                after=[*copies, "sequences", "remap post-data"],
+                # Limits its own concurrency to ``workers``.
+                bounded=False,
+            )
+
+            print(
+                f"Running backup DAG: {len(pending)} of {len(tables)} tables "
+                f"with {workers} workers..."
+            )
+            await dag.run(limit=workers)
+
+
+BACKUP_MODES: dict[str, Callable[[BackupJob], None]] = {
+    "plain": _run_plain,
+    "stream": _run_stream,
+    "copy": _run_copy,
+    "directory": _run_directory,
+    "async": _run_async,
+}
+
+
+@dataclass
+class BackupOptions:
+    mode: str = "plain"
+    # Parallel table copies in ``copy`` mode; pg_dump/load jobs in
+    # ``directory`` mode; Neon connections building indexes and constraints
+    # in every mode.
+    workers: int = DEFAULT_WORKERS
+    # Clone tables unchanged since the previous backup (``copy`` mode).
+    incremental: bool = False
+    # Copy tables larger than this in page ranges, in parallel (``copy``
+    # mode); None copies every table whole.
+    split_bytes: int | None = DEFAULT_SPLIT_BYTES
+    # COPY format of the table copies (``copy`` mode): text or binary.
+    copy_format: str = "text"
+    # Keep compressed, checksummed dumps under this directory (``plain`` and
+    # ``stream`` modes).
+    artifact_dir: str | None = None
+    compression: str = "gzip"
+    compression_level: int | None = None
+    retention: RetentionPolicy = field(default_factory=RetentionPolicy)
+    # Append per-phase metrics as JSON lines to this file.
+    metrics_file: str | None = None
+    # Write run metrics in the Prometheus textfile format to this file.
+    prometheus_file: str | None = None
+    # Continue the latest interrupted backup of the same mode, if any.
+    resume: bool = False
+    # Supabase schemas to back up. The first is restored into the backup
+    # schema, the others into its companion schemas (see ``target_schemas``).
+    schemas: list[str] = field(default_factory=lambda: ["public"])
+    # Tables (or rows) left out, copy order and size budget.
+    tables: TableFilter = field(default_factory=TableFilter)
+
+
+# Modes whose dumps pass through Python as SQL and can be kept as artifacts.
+ARTIFACT_MODES = ("plain", "stream")
+
+
+def _create_schema(neon_url: str, schema: str) -> None:
+    with db.connection(neon_url, autocommit=True) as conn:
         with conn.cursor() as cur:
-            cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{new_schema}"')
+            cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
             cur.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
 
-    try:
-        # ---------------------------
-        # Dump schema-only
-        # ---------------------------
-        print("Dumping Supabase schema (schema-only)...")
-
-        subprocess.run(
-            [
-                "pg_dump",
-                "--schema-only",
-                "--schema=public",
-                "--no-owner",
-                "--no-acl",
-                supabase_url,
-            ],
-            check=True,
-            stdout=open(SCHEMA_DUMP, "w"),
+
+def _prepare_neon(
+    neon_url: str, new_schema: str, mode: str, schemas: Sequence[str] = ("public",)
+) -> None:
+    print(f"Creating backup schema {new_schema}...")
+    # Registered first, so the schema is never mistaken for a finished backup.
+    start_run(neon_url, new_schema, mode, schemas)
+    for schema in target_schemas(new_schema, schemas).values():
+        _create_schema(neon_url, schema)
+
+
+def _forget_backup(neon_url: str, schema: str) -> None:
+    """Drop backup ``schema``, its companions and their bookkeeping."""
+    dropped = delete_schema(neon_url, schema)
+    forget_run(neon_url, schema)
+    forget_manifest(neon_url, dropped)
+
+
+def _drop_abandoned(neon_url: str, current: str, mode: str) -> None:
+    """Drop interrupted backups that can no longer be resumed.
+
+    ``resume`` picks up the newest interrupted backup of its mode, so the
+    finished ``current`` backup supersedes every one of ``mode``; of each
+    other mode only the newest is kept.
+    """
+    resumable = set()
+    for other in BACKUP_MODES:
+        runs = incomplete_runs(neon_url, other) if other != mode else []
+        if runs:
+            resumable.add(runs[-1])
+    for schema in incomplete_runs(neon_url):
+        if schema != current and schema not in resumable:
+            print(f"Dropping interrupted backup {schema}...")
+            _forget_backup(neon_url, schema)
+
+
+def _rotate(neon_url: str, policy: RetentionPolicy, schemas: list[str]) -> list[str]:
+    """Drop what ``policy`` expires from ``schemas``; returns the survivors."""
+    sizes = schema_sizes(neon_url, schemas) if policy.needs_sizes else None
+    expired = policy.expired(schemas, sizes)
+    for schema in expired:
+        print(f"Rotation: deleting old schema {schema}...")
+        _forget_backup(neon_url, schema)
+    return [s for s in schemas if s not in expired]
+
+
+def _rotate_existing(
+    neon_url: str, policy: RetentionPolicy, new_schema: str
+) -> list[str]:
+    # The new schema may already exist by now; it is not a backup yet.
+    existing = [s for s in list_backup_schemas(neon_url) if s != new_schema]
+    return _rotate(neon_url, policy, existing)
+
+
+# ---------------------------------------------------------------------
+# Branch backups
+# ---------------------------------------------------------------------
+
+BRANCH_MODE = "branch"
+
+
+def _neon_client() -> tuple[NeonClient, str | None]:
+    """Neon API client from the environment, and the branch to snapshot."""
+    cfg = validate_env()
+    if not cfg.neon_api_key or not cfg.neon_project_id:
+        raise BackupError(
+            f"'{BRANCH_MODE}' mode needs NEON_API_KEY and NEON_PROJECT_ID"
         )
+    return NeonClient(cfg.neon_api_key, cfg.neon_project_id), cfg.neon_branch_id
 
-        # ---------------------------
-        # Dump data-only
-        # ---------------------------
-        print("Dumping Supabase data (data-only)...")
 
-        subprocess.run(
-            [
-                "pg_dump",
-                "--data-only",
-                "--schema=public",
-                supabase_url,
-            ],
-            check=True,
-            stdout=open(DATA_DUMP, "w"),
+def _dump_ddl(
+    supabase_url: str,
+    schema: str,
+    source_schema: str,
+    metrics: RunMetrics,
+    snapshot: str | None = None,
+) -> tuple[bytes, bytes]:
+    """Pre-data and post-data DDL of ``source_schema``, remapped to ``schema``."""
+    print("Dumping Supabase schema (pre-data and post-data)...")
+    with metrics.phase("dump_schema") as m:
+        pre_data, post_data = (
+            b"".join(
+                iter_source(
+                    _schema_dump_cmd(
+                        supabase_url, section, snapshot, schemas=[source_schema]
+                    ),
+                    Remapper(schema, {source_schema: schema}).remap,
+                )
+            )
+            for section in ("pre-data", "post-data")
+        )
+        m.bytes_out = len(pre_data) + len(post_data)
+    return pre_data, post_data
+
+
+def _reload_schema(
+    supabase_url: str,
+    neon_url: str,
+    schema: str,
+    pre_data: bytes,
+    post_data: bytes,
+    workers: int,
+    metrics: RunMetrics,
+    source_schema: str = "public",
+    snapshot: str | None = None,
+) -> dict[str, int]:
+    """Drop ``schema`` and load it from scratch; returns rows per table.
+
+    The tables are read under ``snapshot`` if given.
+    """
+    with metrics.phase("pre_data") as m:
+        delete_schema(neon_url, schema)
+        _create_schema(neon_url, schema)
+        subprocess.run(_psql_cmd(neon_url), input=pre_data, check=True)
+        m.bytes_in = len(pre_data)
+
+    print(f"Copying Supabase tables with {workers} workers...")
+    with metrics.phase("copy") as m:
+        results = copy_tables(
+            supabase_url,
+            neon_url,
+            schema,
+            workers=workers,
+            source_schema=source_schema,
+            snapshot=snapshot,
         )
+        m.rows = sum(r.rows for r in results)
+        m.bytes_in = m.bytes_out = sum(r.bytes for r in results)
+        m.stall_seconds = stall_seconds(results)
+
+    print(f"Building indexes, constraints and triggers with {workers} workers...")
+    with metrics.phase("post_data") as m:
+        m.bytes_in = len(post_data)
+        apply_post_data(neon_url, post_data.splitlines(keepends=True), workers)
+    return {r.table: r.rows for r in results}
+
 
-        # ---------------------------
-        # Remap schema + data
-        # ---------------------------
-        print(f"Remapping schema to {new_schema}...")
-        remap_schema_file(SCHEMA_DUMP, SCHEMA_REMAPPED, new_schema)
+def _run_branch(
+    supabase_url: str,
+    neon_url: str,
+    options: BackupOptions,
+    client: NeonClient,
+    parent_id: str | None = None,
+) -> str:
+    """Bring the rolling schema up to date and snapshot it as a Neon branch.
 
-        print(f"Remapping data to {new_schema}...")
-        remap_data_file(DATA_DUMP, DATA_REMAPPED, new_schema)
+    Returns the name of the new branch.
+    """
+    name = branch_name(_timestamp())
+    source = options.schemas[0]
+    metrics = RunMetrics(BRANCH_MODE, name, options.metrics_file)
+    ok = False
+    try:
+        pre_data, post_data = _dump_ddl(supabase_url, ROLLING_SCHEMA, source, metrics)
+        ddl = ddl_hash(pre_data, post_data)
 
-        # ---------------------------
-        # Restore schema
-        # ---------------------------
-        print("Restoring schema into Neon...")
+        # Fingerprints are read before any copy takes its snapshot; see
+        # ``incremental``.
+        with metrics.phase("plan"):
+            fingerprints = table_fingerprints(supabase_url, source)
+            rebuild = loaded_ddl_hash(neon_url) != ddl
+            manifest = {} if rebuild else load_manifest(neon_url, ROLLING_SCHEMA)
 
-        subprocess.run(
-            [
-                "psql",
+        if rebuild:
+            print(
+                "Supabase DDL changed since the last load; "
+                f"rebuilding {ROLLING_SCHEMA}..."
+            )
+            forget_load(neon_url)
+            rows = _reload_schema(
+                supabase_url,
                 neon_url,
-                "-v",
-                "ON_ERROR_STOP=1",
-                "-f",
-                SCHEMA_REMAPPED,
-            ],
-            check=True,
-        )
-
-        # ---------------------------
-        # Restore data
-        # ---------------------------
-        print("Restoring data into Neon...")
-
-        subprocess.run(
-            [
-                "psql",
+                ROLLING_SCHEMA,
+                pre_data,
+                post_data,
+                options.workers,
+                metrics,
+                source,
+            )
+        else:
+            changed = sorted(
+                table
+                for table, fingerprint in fingerprints.items()
+                if table not in manifest or manifest[table].fingerprint != fingerprint
+            )
+            print(
+                f"Refreshing {len(changed)} of {len(fingerprints)} tables "
+                f"changed since the last backup..."
+            )
+            rows = {}
+            if changed:
+                with metrics.phase("refresh") as m:
+                    rows = refresh_tables(
+                        supabase_url, neon_url, changed, source_schema=source
+                    )
+                    m.rows = sum(rows.values())
+
+        with metrics.phase("sequences"):
+            copy_sequences(supabase_url, neon_url, ROLLING_SCHEMA, source)
+        with metrics.phase("manifest"):
+            record_manifest(
                 neon_url,
-                "-v",
-                "ON_ERROR_STOP=1",
-                "-f",
-                DATA_REMAPPED,
-            ],
-            check=True,
+                ROLLING_SCHEMA,
+                [
+                    ManifestEntry(
+                        table_name=table,
+                        action=ACTION_COPIED,
+                        source=source,
+                        fingerprint=fingerprints.get(table),
+                        rows=count,
+                    )
+                    for table, count in rows.items()
+                ],
+            )
+            record_load(neon_url, ddl)
+
+        print(f"Creating Neon branch {name}...")
+        with metrics.phase("branch"):
+            client.create_branch(name, parent_id)
+        with metrics.phase("rotation"):
+            rotate_branches(client, options.retention)
+
+        print(f"Backup completed successfully in branch {name}.")
+        ok = True
+    finally:
+        metrics.finish(ok)
+        if options.prometheus_file:
+            metrics.write_prometheus(options.prometheus_file)
+
+    print(f"backup.branch={name}")
+    return name
+
+
+# ---------------------------------------------------------------------
+# Continuous sync
+# ---------------------------------------------------------------------
+
+SYNC_MODE = "sync"
+
+
+@dataclass
+class SyncOptions:
+    # Replication slot and publication on Supabase.
+    slot: str = cdc.DEFAULT_SLOT
+    source_schema: str = "public"
+    target_schema: str = cdc.LIVE_SCHEMA
+    batch_changes: int = cdc.DEFAULT_BATCH_CHANGES
+    poll_interval: float = cdc.DEFAULT_POLL_INTERVAL
+    # Parallel table copies and post-data connections of the full load.
+    workers: int = DEFAULT_WORKERS
+    # Reload the live schema from scratch, with a new slot.
+    resync: bool = False
+    # Return once every change made so far has been applied.
+    once: bool = False
+    # Append the full load's metrics as JSON lines to this file.
+    metrics_file: str | None = None
+
+
+def _load_live(supabase_url: str, neon_url: str, options: SyncOptions) -> cdc.SyncState:
+    """Full load of the live schema, from a new replication slot."""
+    source, target = options.source_schema, options.target_schema
+    metrics = RunMetrics(SYNC_MODE, target, options.metrics_file)
+    ok = False
+    try:
+        cdc.forget_state(neon_url, options.slot)
+        print(f"Creating replication slot {options.slot} on Supabase...")
+        with cdc.create_slot(supabase_url, options.slot, source) as (start, snapshot):
+            pre_data, post_data = _dump_ddl(
+                supabase_url, target, source, metrics, snapshot
+            )
+            print(f"Loading {target}; changes from {start} on follow...")
+            rows = _reload_schema(
+                supabase_url,
+                neon_url,
+                target,
+                pre_data,
+                post_data,
+                options.workers,
+                metrics,
+                source,
+                snapshot,
+            )
+        with metrics.phase("sequences"):
+            copy_sequences(supabase_url, neon_url, target, source)
+
+        state = cdc.SyncState(options.slot, source, target)
+        with db.connection(neon_url) as conn:
+            cdc.save_state(conn, state)
+        print(f"Loaded {len(rows)} tables ({sum(rows.values())} rows).")
+        ok = True
+    finally:
+        metrics.finish(ok)
+    return state
+
+
+def sync_stream(
+    supabase_url: Optional[str] = None,
+    neon_url: Optional[str] = None,
+    options: Optional[SyncOptions] = None,
+) -> int:
+    """Keep ``options.target_schema`` in sync with Supabase; see ``cdc``.
+
+    Runs until interrupted or, with ``options.once``, until caught up.
+    Returns the number of changes applied.
+    """
+    options = options or SyncOptions()
+    slot = cdc.check_slot_name(options.slot)
+    if supabase_url is None or neon_url is None:
+        cfg = validate_env()
+        supabase_url = supabase_url or cfg.supabase_database_url
+        neon_url = neon_url or cfg.neon_database_url
+    db.warm_up(neon_url)
+
+    state = cdc.load_state(neon_url, slot)
+    if (
+        state is None
+        or options.resync
+        or state.source_schema != options.source_schema
+        or state.target_schema != options.target_schema
+    ):
+        state = _load_live(supabase_url, neon_url, options)
+
+    applied = 0
+    try:
+        while True:
+            rows = cdc.peek_changes(supabase_url, slot, options.batch_changes)
+            transactions = cdc.PgOutputDecoder().decode(rows)
+            # Ones Neon already has, if the last run stopped before the slot
+            # was advanced.
+            pending = [
+                tx for tx in transactions if state.lsn is None or tx.end_lsn > state.lsn
+            ]
+            if pending:
+                state.lsn = pending[-1].end_lsn
+                with db.connection(neon_url) as conn:
+                    count = cdc.apply_transactions(conn, pending, state.target_schema)
+                    cdc.save_state(conn, state)
+                if count:
+                    copy_sequences(
+                        supabase_url, neon_url, state.target_schema, state.source_schema
+                    )
+                applied += count
+                print(
+                    f"Applied {count} changes from {len(pending)} transactions "
+                    f"(up to {cdc.lsn_text(state.lsn)})."
+                )
+            if transactions:
+                cdc.advance_slot(supabase_url, slot, transactions[-1].end_lsn)
+            if len(rows) < options.batch_changes:
+                if options.once:
+                    break
+                time.sleep(options.poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped; the next run continues after the last applied change.")
+    return applied
+
+
+# ---------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------
+
+
+def _record_filtered(job: BackupJob, selection: TableSelection) -> None:
+    """Record the tables ``selection`` left out, so checks expect them."""
+    entries: dict[str, list[ManifestEntry]] = {}
+    for action, names in (
+        (ACTION_EXCLUDED, selection.excluded),
+        (ACTION_SKIPPED, selection.without_data),
+    ):
+        for source, table in names:
+            entries.setdefault(job.targets[source], []).append(
+                ManifestEntry(table_name=table, action=action, source=source)
+            )
+    for target, target_entries in entries.items():
+        record_manifest(job.neon_url, target, target_entries)
+
+
+def _check_schemas(schemas: list[str], mode: str) -> None:
+    if not schemas:
+        raise BackupError("No Supabase schema to back up")
+    if len(set(schemas)) != len(schemas):
+        raise BackupError(f"Schemas listed twice: {', '.join(schemas)}")
+    if mode == BRANCH_MODE and len(schemas) > 1:
+        raise BackupError(f"'{BRANCH_MODE}' mode backs up a single schema")
+    companions = target_schemas(f"backup_{_timestamp()}", schemas)
+    if len(set(companions.values())) != len(schemas):
+        raise BackupError(
+            f"Schemas {', '.join(schemas)} would share a companion schema name"
         )
 
+
+def run(
+    supabase_url: Optional[str] = None,
+    neon_url: Optional[str] = None,
+    options: Optional[BackupOptions] = None,
+    neon_client: Optional[NeonClient] = None,
+) -> str:
+    """Take one backup; returns its schema (or, in branch mode, branch)."""
+    options = options or BackupOptions()
+    mode = options.mode
+    if mode not in BACKUP_MODES and mode != BRANCH_MODE:
+        raise BackupError(
+            f"Unknown backup mode '{mode}' (expected one of: "
+            f"{', '.join([*BACKUP_MODES, BRANCH_MODE])})"
+        )
+    if options.artifact_dir and mode not in ARTIFACT_MODES:
+        raise BackupError(
+            f"Artifacts are only kept in {' and '.join(ARTIFACT_MODES)} modes"
+        )
+    if options.copy_format not in COPY_FORMATS:
+        raise BackupError(
+            f"Unknown COPY format '{options.copy_format}' (expected one of: "
+            f"{', '.join(COPY_FORMATS)})"
+        )
+    if options.copy_format != "text" and mode != "copy":
+        raise BackupError(f"COPY format '{options.copy_format}' needs 'copy' mode")
+    if options.incremental and mode != "copy":
+        raise BackupError("--incremental requires mode 'copy'")
+    if mode == BRANCH_MODE and options.resume:
+        raise BackupError(
+            f"'{BRANCH_MODE}' mode does not resume: an interrupted run takes no "
+            "branch, so just run it again"
+        )
+    if mode == BRANCH_MODE and options.retention.needs_sizes:
+        raise BackupError(f"Size limits do not apply in '{BRANCH_MODE}' mode")
+    if mode == BRANCH_MODE and options.tables.active:
+        raise BackupError(f"Table filters do not apply in '{BRANCH_MODE}' mode")
+    _check_schemas(options.schemas, mode)
+
+    if supabase_url is None or neon_url is None:
+        cfg = validate_env()
+        supabase_url = supabase_url or cfg.supabase_database_url
+        neon_url = neon_url or cfg.neon_database_url
+
+    # Start the Neon compute now; it comes up while Supabase is dumped.
+    db.warm_up(neon_url)
+
+    if mode == BRANCH_MODE:
+        parent_id = None
+        if neon_client is None:
+            neon_client, parent_id = _neon_client()
+        return _run_branch(supabase_url, neon_url, options, neon_client, parent_id)
+
+    checkpoint: Checkpoint | None = None
+    if options.resume:
+        interrupted = incomplete_runs(neon_url, mode)
+        if interrupted:
+            checkpoint = Checkpoint.load(neon_url, interrupted[-1])
+            print(
+                f"Resuming backup {checkpoint.backup_schema} "
+                f"({len(checkpoint.steps('table:'))} tables already loaded)."
+            )
+        else:
+            print(f"No interrupted {mode} backup to resume; starting a new one.")
+
+    if checkpoint is not None:
+        new_schema = checkpoint.backup_schema
+    else:
+        new_schema = f"backup_{_timestamp()}".lower()
+        checkpoint = Checkpoint(neon_url, new_schema)
+
+    selection = None
+    if options.tables.active:
+        selection = select_tables(supabase_url, options.schemas, options.tables)
+        print(selection.summary())
+
+    recorder = None
+    if options.artifact_dir:
+        recorder = ArtifactRecorder(
+            options.artifact_dir,
+            new_schema,
+            options.compression,
+            options.compression_level,
+            options.schemas,
+            selection.excluded if selection else None,
+            selection.without_data if selection else None,
+        )
+
+    metrics = RunMetrics(mode, new_schema, options.metrics_file)
+    ok = False
+
+    # Schema creation and the first rotation step both run alongside the
+    # Supabase dump; only the former has to finish before loading starts.
+    prep = ThreadPoolExecutor(max_workers=2, thread_name_prefix="neon-prep")
+    try:
+        prepared = prep.submit(
+            metrics.timed,
+            "create_schema",
+            _prepare_neon,
+            neon_url,
+            new_schema,
+            mode,
+            options.schemas,
+        )
+        rotation = prep.submit(
+            metrics.timed,
+            "rotation",
+            _rotate_existing,
+            neon_url,
+            options.retention,
+            new_schema,
+        )
+
+        def neon_ready() -> None:
+            if prepared.done():
+                prepared.result()
+                return
+            # Time the mode spends blocked on Neon rather than working.
+            with metrics.phase("neon_wait"):
+                prepared.result()
+
+        job = BackupJob(
+            supabase_url,
+            neon_url,
+            new_schema,
+            options,
+            metrics,
+            checkpoint,
+            recorder,
+            neon_ready=neon_ready,
+            selection=selection,
+        )
+        BACKUP_MODES[mode](job)
+        # Surface preparation errors even if the mode never reached Neon.
+        job.neon_ready()
+        if selection is not None:
+            _record_filtered(job, selection)
+        finish_run(neon_url, new_schema)
+
+        # The new backup is good: it now counts towards retention. It stays
+        # good if rotation fails, which the next backup will retry.
+        try:
+            with metrics.phase("rotation_final"):
+                _rotate(neon_url, options.retention, rotation.result() + [new_schema])
+                _drop_abandoned(neon_url, new_schema, mode)
+        except Exception as e:
+            print(f"Rotation failed, keeping old backups for now: {e}")
+        if recorder is not None:
+            with metrics.phase("artifacts"):
+                manifest = recorder.finish()
+            print(f"Backup artifacts written to {os.path.dirname(manifest)}.")
+
         print(f"Backup completed successfully in schema {new_schema}.")
+        ok = True
+
+    except BaseException:
+        if recorder is not None:
+            recorder.abort()
+        raise
 
     finally:
+        prep.shutdown(wait=True)
+        metrics.finish(ok)
+        if options.prometheus_file:
+            metrics.write_prometheus(options.prometheus_file)
         for f in (
             SCHEMA_DUMP,
             SCHEMA_REMAPPED,
             DATA_DUMP,
             DATA_REMAPPED,
+            POSTDATA_DUMP,
+            POSTDATA_REMAPPED,
         ):
             if os.path.exists(f):
                 os.remove(f)
@@ -240,6 +1527,48 @@ def run(supabase_url: Optional[str] = None, neon_url: Optional[str] = None):
         print(f"backup.schema={new_schema}")
         print("backup.timestamp=" + _timestamp())
 
+    return new_schema
+
+
+def restore_artifact(
+    artifact_dir: str,
+    neon_url: Optional[str] = None,
+    target_schema: Optional[str] = None,
+) -> str:
+    """Replay a kept backup artifact into Neon without touching Supabase.
+
+    Every file is checked against the manifest before anything is loaded.
+    Files are replayed in ``REPLAY_ORDER``, whatever order they were
+    recorded in. Returns the schema the artifact was restored into.
+    """
+    manifest = verify_artifact(artifact_dir)
+    if neon_url is None:
+        neon_url = validate_env().neon_database_url
+    target_schema = target_schema or manifest["backup_schema"]
+    targets = target_schemas(target_schema, manifest.get("schemas", ["public"]))
+    remapper = Remapper(
+        target_schema,
+        targets,
+        [tuple(name) for name in manifest.get("excluded_tables", [])],
+        [tuple(name) for name in manifest.get("tables_without_data", [])],
+    )
+
+    for schema in targets.values():
+        _create_schema(neon_url, schema)
+
+    def position(entry: dict) -> int:
+        # "schema.sql.gz" -> "schema.sql"
+        dump = entry["name"].partition(".sql")[0] + ".sql"
+        return REPLAY_ORDER.index(dump) if dump in REPLAY_ORDER else len(REPLAY_ORDER)
+
+    for entry in sorted(manifest["files"], key=position):
+        print(f"Replaying {entry['name']} into {target_schema}...")
+        path = os.path.join(artifact_dir, entry["name"])
+        with open_artifact(path, manifest["compression"]) as fin:
+            run_sink(fin, _psql_cmd(neon_url), remapper.remap)
+
+    return target_schema
+
 
 if __name__ == "__main__":
     run()
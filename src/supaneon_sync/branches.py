@@ -0,0 +1,207 @@
+"""Backups as copy-on-write Neon branches of one rolling target schema.
+
+Instead of loading every backup into a schema of its own, ``branch`` mode
+keeps a single copy of Supabase in ``ROLLING_SCHEMA`` on the Neon branch that
+``NEON_DATABASE_URL`` points at, brings it up to date, and then snapshots the
+database as a new branch ``backup-<timestamp>``. A branch shares every page
+its parent has not rewritten since, so each retained backup only costs what
+changed after it was taken.
+
+To keep that delta small, a run writes as little as it can:
+
+- tables whose fingerprint (see ``incremental``) matches the one recorded at
+  the last load are not touched;
+- changed tables are truncated and reloaded in a single transaction, so no
+  branch ever sees a half-refreshed target;
+- the schema is dropped and rebuilt only when Supabase's DDL has changed.
+
+Old backups are rotated by deleting their branches.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Iterable
+
+import psycopg
+from psycopg import sql
+
+from . import db
+from .buffers import pump
+from .manifest import META_SCHEMA
+from .neon import NeonClient
+from .rotation import RetentionPolicy
+
+ROLLING_SCHEMA = "supaneon_rolling"
+BRANCH_PREFIX = "backup-"
+
+# Foreign keys from or to any of the named tables of a schema. Constraints
+# inherited by partitions go with their parent's.
+FOREIGN_KEYS_QUERY = """
+    SELECT t.relname, c.conname, pg_get_constraintdef(c.oid)
+    FROM pg_constraint c
+    JOIN pg_namespace n ON n.oid = c.connamespace
+    JOIN pg_class t ON t.oid = c.conrelid
+    JOIN pg_class r ON r.oid = c.confrelid
+    WHERE c.contype = 'f' AND c.conparentid = 0 AND n.nspname = %s
+      AND (t.relname = ANY(%s) OR r.relname = ANY(%s))
+    ORDER BY t.relname, c.conname
+"""
+
+
+def branch_name(timestamp: str) -> str:
+    return f"{BRANCH_PREFIX}{timestamp}"
+
+
+def ddl_hash(*sections: bytes) -> str:
+    """Fingerprint of remapped schema dumps.
+
+    Comments and psql meta-commands are left out: they carry pg_dump's
+    version and, in recent releases, a random ``\\restrict`` key.
+    """
+    digest = hashlib.sha256()
+    for section in sections:
+        for line in section.splitlines(keepends=True):
+            if not line.startswith((b"--", b"\\")):
+                digest.update(line)
+    return digest.hexdigest()
+
+
+def _ensure_rolling_table(conn: psycopg.Connection) -> None:
+    conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{META_SCHEMA}"')
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{META_SCHEMA}".rolling_target (
+            target_schema text PRIMARY KEY,
+            ddl_hash text NOT NULL,
+            loaded_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def loaded_ddl_hash(neon_url: str, schema: str = ROLLING_SCHEMA) -> str | None:
+    """``ddl_hash`` of the DDL ``schema`` was last built from, if it exists."""
+    with db.connection(neon_url) as conn:
+        _ensure_rolling_table(conn)
+        row = conn.execute(
+            f"""
+            SELECT t.ddl_hash
+            FROM "{META_SCHEMA}".rolling_target t
+            JOIN pg_namespace n ON n.nspname = t.target_schema
+            WHERE t.target_schema = %s
+            """,
+            (schema,),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def record_load(neon_url: str, ddl: str, schema: str = ROLLING_SCHEMA) -> None:
+    """Record that ``schema`` is complete and matches DDL ``ddl``."""
+    with db.connection(neon_url) as conn:
+        _ensure_rolling_table(conn)
+        conn.execute(
+            f"""
+            INSERT INTO "{META_SCHEMA}".rolling_target (target_schema, ddl_hash)
+            VALUES (%s, %s)
+            ON CONFLICT (target_schema) DO UPDATE SET
+                ddl_hash = EXCLUDED.ddl_hash,
+                loaded_at = now()
+            """,
+            (schema, ddl),
+        )
+
+
+def forget_load(neon_url: str, schema: str = ROLLING_SCHEMA) -> None:
+    """Forget what ``schema`` holds, before it is rebuilt.
+
+    Until ``record_load`` runs again, an interrupted rebuild is rebuilt from
+    scratch and every table counts as changed.
+    """
+    with db.connection(neon_url) as conn:
+        _ensure_rolling_table(conn)
+        conn.execute(
+            f'DELETE FROM "{META_SCHEMA}".rolling_target WHERE target_schema = %s',
+            (schema,),
+        )
+        row = conn.execute(
+            "SELECT to_regclass(%s)", (f'"{META_SCHEMA}".backup_manifest',)
+        ).fetchone()
+        if row is not None and row[0] is not None:
+            conn.execute(
+                f'DELETE FROM "{META_SCHEMA}".backup_manifest '
+                "WHERE backup_schema = %s",
+                (schema,),
+            )
+
+
+def refresh_tables(
+    source_url: str,
+    neon_url: str,
+    tables: Iterable[str],
+    schema: str = ROLLING_SCHEMA,
+    source_schema: str = "public",
+) -> dict[str, int]:
+    """Reload ``tables`` of ``schema`` from Supabase in one transaction.
+
+    Foreign keys from or to the tables are dropped for the reload and added
+    back, which validates them, before the commit. Returns rows per table.
+    """
+    tables = list(tables)
+    rows: dict[str, int] = {}
+    with db.connection(source_url) as src, db.connection(neon_url) as dst:
+        # All tables are read from one snapshot.
+        src.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+        src.read_only = True
+
+        foreign_keys = dst.execute(
+            FOREIGN_KEYS_QUERY, (schema, tables, tables)
+        ).fetchall()
+        for table, name, _ in foreign_keys:
+            dst.execute(
+                sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+                    sql.Identifier(schema, table), sql.Identifier(name)
+                )
+            )
+        dst.execute(
+            sql.SQL("TRUNCATE {}").format(
+                sql.SQL(", ").join(sql.Identifier(schema, t) for t in tables)
+            )
+        )
+
+        for table in tables:
+            copy_out = sql.SQL("COPY {} TO STDOUT").format(
+                sql.Identifier(source_schema, table)
+            )
+            copy_in = sql.SQL("COPY {} FROM STDIN").format(
+                sql.Identifier(schema, table)
+            )
+            with src.cursor() as scur, dst.cursor() as dcur:
+                with scur.copy(copy_out) as cin, dcur.copy(copy_in) as cout:
+                    pump(cin, cout.write)
+                rows[table] = dcur.rowcount
+            print(f"  Refreshed {table}: {rows[table]} rows")
+
+        for table, name, definition in foreign_keys:
+            dst.execute(
+                sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+                    sql.Identifier(schema, table),
+                    sql.Identifier(name),
+                    sql.SQL(definition),
+                )
+            )
+    return rows
+
+
+def rotate_branches(client: NeonClient, policy: RetentionPolicy) -> list[str]:
+    """Delete the backup branches ``policy`` expires; returns their names.
+
+    Only branches named ``backup-<timestamp>`` are considered. Size limits do
+    not apply: what a branch costs depends on the branches taken after it.
+    """
+    branches = {
+        b.name: b for b in client.list_branches() if b.name.startswith(BRANCH_PREFIX)
+    }
+    expired = policy.expired(list(branches))
+    for name in expired:
+        print(f"Rotation: deleting old branch {name}...")
+        client.delete_branch(branches[name].id)
+    return expired
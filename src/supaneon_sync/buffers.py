@@ -0,0 +1,184 @@
+"""Bounded buffering between a reader thread and a writer thread.
+
+A direct Supabase -> Neon stream runs at the speed of its slower side at
+every instant: while Neon is busy (e.g. its compute is scaling up) nothing is
+read from Supabase, and while Supabase is slow nothing is written to Neon.
+``pump`` decouples the two: a reader thread fills a fixed ring of reusable
+``bytearray`` slots from the source, and the calling thread writes filled
+slots to the sink. When every slot is full the reader waits (backpressure),
+so memory stays bounded by ``slots * slot_bytes`` however far ahead the
+source gets.
+
+Small chunks (COPY sends one row per chunk) are packed into slots, so the
+sink sees fewer, larger writes. A chunk larger than a slot is passed through
+as it is, still holding a slot's place in the ring.
+
+The time each side spent waiting for the other is recorded: time the reader
+waited for a free slot was lost to a slow sink, time the writer waited for a
+filled slot to a slow source.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Union
+
+from psycopg.abc import Buffer
+
+DEFAULT_SLOTS = 8
+DEFAULT_SLOT_BYTES = 512 * 1024
+
+
+class RingClosed(Exception):
+    """The writer gave up; the reader should stop."""
+
+
+@dataclass
+class RingStats:
+    bytes: int = 0
+    chunks: int = 0
+    # Filled slots (or oversized chunks) handed to the writer.
+    writes: int = 0
+    # Seconds the reader waited for a free slot, i.e. on the sink.
+    sink_wait: float = 0.0
+    # Seconds the writer waited for a filled slot, i.e. on the source.
+    source_wait: float = 0.0
+
+
+# What the writer receives: data and the slot to recycle once it is written,
+# the end of the stream (None) or the reader's exception.
+_Item = Union[tuple[memoryview, bytearray], BaseException, None]
+
+
+class RingBuffer:
+    """A ring of ``slots`` buffers of ``slot_bytes`` for one reader and one writer.
+
+    The reader calls ``put`` for every chunk, then ``close`` (or ``fail``);
+    the writer iterates over the ring and must be done with each view before
+    asking for the next one, as its slot is then refilled.
+    """
+
+    def __init__(
+        self, slots: int = DEFAULT_SLOTS, slot_bytes: int = DEFAULT_SLOT_BYTES
+    ):
+        self.slot_bytes = slot_bytes
+        self.stats = RingStats()
+        self._free: queue.SimpleQueue[bytearray | None] = queue.SimpleQueue()
+        self._full: queue.SimpleQueue[_Item] = queue.SimpleQueue()
+        for _ in range(max(1, slots)):
+            self._free.put(bytearray(slot_bytes))
+        self._slot: bytearray | None = None
+        self._fill = 0
+        self._aborted = False
+
+    # Reader side
+
+    def _acquire(self) -> bytearray:
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            t0 = time.perf_counter()
+            slot = self._free.get()
+            self.stats.sink_wait += time.perf_counter() - t0
+        if slot is None or self._aborted:
+            raise RingClosed()
+        return slot
+
+    def _publish(self, view: memoryview, slot: bytearray) -> None:
+        self._full.put((view, slot))
+        self.stats.writes += 1
+
+    def flush(self) -> None:
+        """Hand the slot being filled to the writer, even if not full."""
+        if self._slot is not None and self._fill:
+            self._publish(memoryview(self._slot)[: self._fill], self._slot)
+            self._slot, self._fill = None, 0
+
+    def put(self, chunk: Buffer) -> None:
+        if self._aborted:
+            raise RingClosed()
+        data = memoryview(chunk).cast("B")
+        size = len(data)
+        self.stats.bytes += size
+        self.stats.chunks += 1
+        if self._fill + size > self.slot_bytes:
+            self.flush()
+        if size > self.slot_bytes:
+            self._publish(data, self._acquire())
+            return
+        if self._slot is None:
+            self._slot = self._acquire()
+        self._slot[self._fill : self._fill + size] = data
+        self._fill += size
+
+    def close(self) -> None:
+        """End of the stream."""
+        self.flush()
+        self._full.put(None)
+
+    def fail(self, exc: BaseException) -> None:
+        """End the stream with ``exc``, raised to the writer."""
+        self._full.put(exc)
+
+    # Writer side
+
+    def abort(self) -> None:
+        """Make the reader stop at its next ``put``."""
+        self._aborted = True
+        self._free.put(None)
+
+    def __iter__(self) -> Iterator[memoryview]:
+        while True:
+            try:
+                item = self._full.get_nowait()
+            except queue.Empty:
+                t0 = time.perf_counter()
+                item = self._full.get()
+                self.stats.source_wait += time.perf_counter() - t0
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            view, slot = item
+            yield view
+            self._free.put(slot)
+
+
+def pump(
+    source: Iterable[Buffer],
+    write: Callable[[memoryview], object],
+    slots: int = DEFAULT_SLOTS,
+    slot_bytes: int = DEFAULT_SLOT_BYTES,
+) -> RingStats:
+    """Read ``source`` in a thread of its own and ``write`` it from this one.
+
+    ``write`` must be done with the data it is given when it returns. An
+    exception raised by either side stops both and is re-raised here.
+    """
+    ring = RingBuffer(slots, slot_bytes)
+
+    def read() -> None:
+        try:
+            for chunk in source:
+                ring.put(chunk)
+        except RingClosed:
+            return
+        except BaseException as e:
+            ring.fail(e)
+            return
+        ring.close()
+
+    reader = threading.Thread(target=read, name="ring-reader", daemon=True)
+    reader.start()
+    try:
+        for view in ring:
+            write(view)
+    except BaseException:
+        ring.abort()
+        raise
+    finally:
+        reader.join()
+    return ring.stats
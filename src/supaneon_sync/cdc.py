@@ -0,0 +1,552 @@
+"""Continuous change-data-capture of Supabase into a live Neon schema.
+
+``sync-stream`` keeps ``LIVE_SCHEMA`` on Neon a few seconds behind Supabase
+instead of a nightly snapshot behind it. After one full load, only the
+changes are carried over:
+
+- a publication lists the tables of the source schema, and a logical
+  replication slot with the built-in ``pgoutput`` plugin keeps their changes
+  on Supabase until they are confirmed;
+- changes are read in batches of whole transactions with
+  ``pg_logical_slot_peek_binary_changes`` (psycopg has no client for the
+  streaming replication protocol, but the SQL interface decodes the same
+  messages) and decoded by ``PgOutputDecoder``;
+- each batch is applied to Neon in one transaction, which also records the
+  end LSN of its last transaction in ``supaneon_sync.cdc_state``. The
+  transaction runs with ``session_replication_role = replica``, so the
+  triggers and foreign keys the live schema shares with Supabase do not act
+  a second time on changes Supabase already made them act on;
+- only then is the slot advanced past the batch.
+
+A crash between the Neon commit and the slot advance makes the next batch
+start with transactions Neon already has; they are recognised by their LSN
+and skipped, so no change is lost or applied twice.
+
+The slot is created over a replication connection that exports its
+snapshot, and the full load copies the tables under that snapshot: the copy
+holds exactly the changes from before the slot's start, and the slot exactly
+those after it. Inserts are still upserts where the table has a key, so a
+batch replayed by hand is harmless.
+
+Schema changes are not replicated: after DDL on Supabase, or to pick up new
+tables, reload with ``--resync``. Updates and deletes need a primary key
+(or another replica identity) on the table.
+"""
+
+from __future__ import annotations
+
+import re
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Container, Iterable, Iterator
+
+import psycopg
+from psycopg import sql
+
+from . import db
+from .db import CONNECT_TIMEOUT
+from .exceptions import BackupError
+from .manifest import META_SCHEMA
+
+LIVE_SCHEMA = "supaneon_live"
+# Name of both the replication slot and the publication.
+DEFAULT_SLOT = "supaneon_sync"
+# Changes read per batch; a batch always ends with a whole transaction.
+DEFAULT_BATCH_CHANGES = 10_000
+# Seconds to wait for new changes once caught up.
+DEFAULT_POLL_INTERVAL = 5.0
+
+# Slot names are limited to these characters by Postgres.
+_slot_name_re = re.compile(r"^[a-z0-9_]{1,63}$")
+
+# pgoutput replica identities.
+IDENTITY_DEFAULT, IDENTITY_NOTHING, IDENTITY_FULL, IDENTITY_INDEX = "dnfi"
+
+# A column an update did not send: an unchanged TOASTed value.
+UNCHANGED = object()
+
+PEEK_QUERY = """
+    SELECT lsn::text, data
+    FROM pg_logical_slot_peek_binary_changes(
+        %s, NULL, %s, 'proto_version', '1', 'publication_names', %s
+    )
+"""
+
+
+def lsn_value(lsn: str) -> int:
+    """``'16/B374D848'`` as an integer, for comparisons."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def lsn_text(value: int) -> str:
+    return f"{value >> 32:X}/{value & 0xFFFFFFFF:X}"
+
+
+def check_slot_name(name: str) -> str:
+    if not _slot_name_re.match(name):
+        raise BackupError(
+            f"Invalid slot name '{name}': use lower-case letters, digits and _"
+        )
+    return name
+
+
+# ---------------------------------------------------------------------
+# pgoutput decoding
+# ---------------------------------------------------------------------
+
+
+@dataclass
+class Relation:
+    id: int
+    schema: str
+    name: str
+    identity: str
+    columns: list[str]
+    # Columns of the replica identity (the primary key by default).
+    key: list[str]
+    # Type oid of each column.
+    types: list[int] = field(default_factory=list)
+
+
+@dataclass
+class Change:
+    # "insert", "update", "delete" or "truncate".
+    kind: str
+    relations: list[Relation]
+    new: dict[str, Any] | None = None
+    # Replica identity (or, with REPLICA IDENTITY FULL, the whole old row).
+    old: dict[str, Any] | None = None
+
+    @property
+    def relation(self) -> Relation:
+        return self.relations[0]
+
+
+@dataclass
+class Transaction:
+    xid: int
+    # Where the commit record ends: the slot's confirm position after it.
+    end_lsn: int = 0
+    changes: list[Change] = field(default_factory=list)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def byte(self) -> str:
+        return chr(self.unpack("!B")[0])
+
+    def string(self) -> str:
+        end = self.data.index(b"\0", self.pos)
+        text = self.data[self.pos : end].decode()
+        self.pos = end + 1
+        return text
+
+    def tuple_data(self, relation: Relation) -> dict[str, Any]:
+        (ncols,) = self.unpack("!H")
+        values: dict[str, Any] = {}
+        for column in relation.columns[:ncols]:
+            kind = self.byte()
+            if kind == "n":
+                values[column] = None
+            elif kind == "u":
+                values[column] = UNCHANGED
+            elif kind == "t":
+                (length,) = self.unpack("!i")
+                values[column] = self.data[self.pos : self.pos + length].decode()
+                self.pos += length
+            else:
+                raise BackupError(f"Unsupported pgoutput column kind '{kind}'")
+        return values
+
+
+class PgOutputDecoder:
+    """Turns pgoutput protocol version 1 messages into ``Transaction``s."""
+
+    def __init__(self) -> None:
+        self.relations: dict[int, Relation] = {}
+        self._current: Transaction | None = None
+
+    def decode(self, rows: Iterable[tuple[str, bytes]]) -> list[Transaction]:
+        """Transactions completed by ``rows`` of a slot, in commit order."""
+        done: list[Transaction] = []
+        for _lsn, data in rows:
+            committed = self._message(_Reader(data))
+            if committed is not None:
+                done.append(committed)
+        return done
+
+    def _message(self, r: _Reader) -> Transaction | None:
+        kind = r.byte()
+        if kind == "B":
+            _final_lsn, _timestamp, xid = r.unpack("!QqI")
+            self._current = Transaction(xid)
+        elif kind == "C":
+            _flags, _commit_lsn, end_lsn, _timestamp = r.unpack("!BQQq")
+            tx, self._current = self._current, None
+            if tx is None:
+                raise BackupError("pgoutput commit without a transaction")
+            tx.end_lsn = end_lsn
+            return tx
+        elif kind == "R":
+            (relid,) = r.unpack("!I")
+            schema, name = r.string(), r.string()
+            identity = r.byte()
+            (ncols,) = r.unpack("!H")
+            columns, key, types = [], [], []
+            for _ in range(ncols):
+                (flags,) = r.unpack("!B")
+                column = r.string()
+                type_oid, _typmod = r.unpack("!Ii")
+                columns.append(column)
+                types.append(type_oid)
+                if flags & 1:
+                    key.append(column)
+            self.relations[relid] = Relation(
+                relid, schema, name, identity, columns, key, types
+            )
+        elif kind in "IUD":
+            relation = self.relations[r.unpack("!I")[0]]
+            change = Change(
+                {"I": "insert", "U": "update", "D": "delete"}[kind], [relation]
+            )
+            while r.pos < len(r.data):
+                part = r.byte()
+                values = r.tuple_data(relation)
+                if part == "N":
+                    change.new = values
+                else:  # "K" (key only) or "O" (whole old row)
+                    change.old = values
+            self._add(change)
+        elif kind == "T":
+            nrels, _options = r.unpack("!IB")
+            relids = r.unpack(f"!{nrels}I")
+            self._add(Change("truncate", [self.relations[i] for i in relids]))
+        # Origin ("O"), type ("Y") and logical ("M") messages carry nothing
+        # to apply.
+        return None
+
+    def _add(self, change: Change) -> None:
+        if self._current is None:
+            raise BackupError("pgoutput change outside a transaction")
+        self._current.changes.append(change)
+
+
+# ---------------------------------------------------------------------
+# Applying changes
+# ---------------------------------------------------------------------
+
+
+# Built-in types (and their arrays) without a btree equality: json, xml and
+# the geometric types, whose "=" (if any) compares areas. Rows are matched on
+# their text form instead.
+NO_EQUALITY_TYPES = frozenset(
+    {114, 199, 142, 143, 600, 1017, 601, 1018, 602, 1019, 603, 1020}
+    | {604, 1027, 628, 629, 718, 719}
+)
+
+
+def _matches(
+    columns: Iterable[str], null_safe: bool = False, as_text: Container[str] = ()
+) -> sql.Composable:
+    op = sql.SQL(" IS NOT DISTINCT FROM ") if null_safe else sql.SQL(" = ")
+    return sql.SQL(" AND ").join(
+        (
+            sql.SQL("{}::text{}{}::text").format(
+                sql.Identifier(c), op, sql.Placeholder()
+            )
+            if c in as_text
+            else sql.Composed([sql.Identifier(c), op, sql.Placeholder()])
+        )
+        for c in columns
+    )
+
+
+def _identity(
+    change: Change, table: sql.Identifier
+) -> tuple[sql.Composable, list[Any]]:
+    """WHERE clause finding the row ``change`` is about, and its parameters."""
+    rel = change.relation
+    if rel.identity == IDENTITY_FULL and change.old is not None:
+        # No key: change one row with exactly the old values.
+        columns = [c for c, v in change.old.items() if v is not UNCHANGED]
+        as_text = {c for c, t in zip(rel.columns, rel.types) if t in NO_EQUALITY_TYPES}
+        where = sql.SQL("ctid = (SELECT ctid FROM {} WHERE {} LIMIT 1)").format(
+            table, _matches(columns, null_safe=True, as_text=as_text)
+        )
+        return where, [change.old[c] for c in columns]
+    if not rel.key:
+        raise BackupError(
+            f"Cannot apply {change.kind} on {rel.schema}.{rel.name}: "
+            "the table has no primary key or replica identity"
+        )
+    row = change.old or change.new or {}
+    return _matches(rel.key), [row[c] for c in rel.key]
+
+
+def change_statement(
+    change: Change, target_schema: str
+) -> tuple[sql.Composed, list[Any]] | None:
+    """SQL applying ``change`` to ``target_schema``, and its parameters.
+
+    Values stay in Postgres' text format; the server casts them to the
+    column types. Returns None for an update that changes nothing the
+    change carries.
+    """
+    table = sql.Identifier(target_schema, change.relation.name)
+    if change.kind == "truncate":
+        return (
+            sql.SQL("TRUNCATE {}").format(
+                sql.SQL(", ").join(
+                    sql.Identifier(target_schema, r.name) for r in change.relations
+                )
+            ),
+            [],
+        )
+    if change.kind == "delete":
+        where, params = _identity(change, table)
+        return sql.SQL("DELETE FROM {} WHERE {}").format(table, where), params
+
+    assert change.new is not None
+    columns = [c for c, v in change.new.items() if v is not UNCHANGED]
+    values = [change.new[c] for c in columns]
+    if change.kind == "update":
+        # Key columns are only set when they change: an identity column
+        # GENERATED ALWAYS cannot be set at all.
+        old = change.old or {}
+        changed = [
+            c
+            for c in columns
+            if c not in change.relation.key or (c in old and old[c] != change.new[c])
+        ]
+        if not changed:
+            # Only the unchanged key came along (the other columns are
+            # unchanged TOASTed values): there is nothing to set.
+            return None
+        where, params = _identity(change, table)
+        query = sql.SQL("UPDATE {} SET {} WHERE {}").format(
+            table,
+            sql.SQL(", ").join(
+                sql.SQL("{} = {}").format(sql.Identifier(c), sql.Placeholder())
+                for c in changed
+            ),
+            where,
+        )
+        return query, [change.new[c] for c in changed] + params
+
+    query = sql.SQL("INSERT INTO {} ({}) OVERRIDING SYSTEM VALUE VALUES ({})").format(
+        table,
+        sql.SQL(", ").join(map(sql.Identifier, columns)),
+        sql.SQL(", ").join(sql.Placeholder() * len(columns)),
+    )
+    rel = change.relation
+    if rel.identity in (IDENTITY_DEFAULT, IDENTITY_INDEX) and rel.key:
+        # Changes replayed over the initial copy may find their row there.
+        rest = [c for c in columns if c not in rel.key]
+        update = (
+            sql.SQL("DO UPDATE SET {}").format(
+                sql.SQL(", ").join(
+                    sql.SQL("{} = EXCLUDED.{}").format(
+                        sql.Identifier(c), sql.Identifier(c)
+                    )
+                    for c in rest
+                )
+            )
+            if rest
+            else sql.SQL("DO NOTHING")
+        )
+        query = sql.SQL("{} ON CONFLICT ({}) {}").format(
+            query, sql.SQL(", ").join(map(sql.Identifier, rel.key)), update
+        )
+    return query, values
+
+
+def apply_transactions(
+    conn: psycopg.Connection, transactions: list[Transaction], target_schema: str
+) -> int:
+    """Apply ``transactions`` in ``conn``'s current transaction.
+
+    The transaction runs as a replica: ordinary triggers, including those
+    enforcing foreign keys, do not fire. Statements are pipelined, so a batch
+    costs few round trips to Neon. Returns the number of changes applied.
+    """
+    count = 0
+    conn.execute("SET LOCAL session_replication_role = replica")
+    with conn.pipeline():
+        for tx in transactions:
+            for change in tx.changes:
+                statement = change_statement(change, target_schema)
+                if statement is None:
+                    continue
+                conn.execute(*statement)
+                count += 1
+    return count
+
+
+# ---------------------------------------------------------------------
+# Slot and publication (Supabase)
+# ---------------------------------------------------------------------
+
+
+@contextmanager
+def create_slot(
+    source_url: str, slot: str, source_schema: str = "public"
+) -> Iterator[tuple[str, str]]:
+    """(Re)create the publication and slot; yields its start LSN and snapshot.
+
+    Changes made from that LSN on are kept until the slot is advanced; the
+    snapshot sees exactly the changes made before it. The snapshot can be
+    imported (``SET TRANSACTION SNAPSHOT``, ``pg_dump --snapshot``) until the
+    block exits.
+    """
+    name = sql.Identifier(check_slot_name(slot))
+    with db.connection(source_url, autocommit=True) as conn:
+        drop_slot(conn, slot)
+        tables = [
+            sql.Identifier(source_schema, row[0])
+            for row in conn.execute(
+                """
+                SELECT c.relname FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relkind IN ('r', 'p')
+                  AND NOT c.relispartition
+                ORDER BY c.relname
+                """,
+                (source_schema,),
+            ).fetchall()
+        ]
+        exists = conn.execute(
+            "SELECT 1 FROM pg_publication WHERE pubname = %s", (slot,)
+        ).fetchone()
+        if not exists:
+            conn.execute(sql.SQL("CREATE PUBLICATION {}").format(name))
+        # Listed one by one: FOR TABLES IN SCHEMA needs a superuser.
+        if tables:
+            conn.execute(
+                sql.SQL("ALTER PUBLICATION {} SET TABLE {}").format(
+                    name, sql.SQL(", ").join(tables)
+                )
+            )
+    # Only the replication protocol's command exports the slot's snapshot.
+    with psycopg.connect(
+        source_url,
+        autocommit=True,
+        replication="database",
+        connect_timeout=int(CONNECT_TIMEOUT),
+    ) as repl:
+        row = repl.execute(
+            sql.SQL(
+                "CREATE_REPLICATION_SLOT {} LOGICAL pgoutput EXPORT_SNAPSHOT"
+            ).format(name)
+        ).fetchone()
+        assert row is not None
+        # slot_name, consistent_point, snapshot_name, output_plugin
+        yield row[1], row[2]
+
+
+def drop_slot(conn: psycopg.Connection, slot: str) -> None:
+    conn.execute(
+        """
+        SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots
+        WHERE slot_name = %s
+        """,
+        (slot,),
+    )
+
+
+def peek_changes(
+    source_url: str, slot: str, batch_changes: int
+) -> list[tuple[str, bytes]]:
+    """Up to about ``batch_changes`` changes of the slot, without consuming them."""
+    with db.connection(source_url, autocommit=True) as conn:
+        rows = conn.execute(PEEK_QUERY, (slot, batch_changes, slot)).fetchall()
+    return [(lsn, bytes(data)) for lsn, data in rows]
+
+
+def advance_slot(source_url: str, slot: str, lsn: int) -> None:
+    """Let Supabase discard the changes up to ``lsn``."""
+    with db.connection(source_url, autocommit=True) as conn:
+        conn.execute(
+            "SELECT pg_replication_slot_advance(%s, %s::pg_lsn)",
+            (slot, lsn_text(lsn)),
+        )
+
+
+# ---------------------------------------------------------------------
+# Sync state (Neon)
+# ---------------------------------------------------------------------
+
+
+@dataclass
+class SyncState:
+    slot: str
+    source_schema: str
+    target_schema: str
+    # End of the last transaction applied; None right after the full load.
+    lsn: int | None = None
+
+
+def _ensure_state_table(conn: psycopg.Connection) -> None:
+    conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{META_SCHEMA}"')
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{META_SCHEMA}".cdc_state (
+            slot text PRIMARY KEY,
+            source_schema text NOT NULL,
+            target_schema text NOT NULL,
+            lsn pg_lsn,
+            updated_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def load_state(neon_url: str, slot: str) -> SyncState | None:
+    with db.connection(neon_url) as conn:
+        _ensure_state_table(conn)
+        row = conn.execute(
+            f"""
+            SELECT source_schema, target_schema, lsn::text
+            FROM "{META_SCHEMA}".cdc_state WHERE slot = %s
+            """,
+            (slot,),
+        ).fetchone()
+    if row is None:
+        return None
+    return SyncState(slot, row[0], row[1], lsn_value(row[2]) if row[2] else None)
+
+
+def save_state(conn: psycopg.Connection, state: SyncState) -> None:
+    """Record ``state`` in ``conn``'s current transaction."""
+    _ensure_state_table(conn)
+    conn.execute(
+        f"""
+        INSERT INTO "{META_SCHEMA}".cdc_state
+            (slot, source_schema, target_schema, lsn)
+        VALUES (%s, %s, %s, %s::pg_lsn)
+        ON CONFLICT (slot) DO UPDATE SET
+            source_schema = EXCLUDED.source_schema,
+            target_schema = EXCLUDED.target_schema,
+            lsn = EXCLUDED.lsn,
+            updated_at = now()
+        """,
+        (
+            state.slot,
+            state.source_schema,
+            state.target_schema,
+            lsn_text(state.lsn) if state.lsn is not None else None,
+        ),
+    )
+
+
+def forget_state(neon_url: str, slot: str) -> None:
+    with db.connection(neon_url) as conn:
+        _ensure_state_table(conn)
+        conn.execute(f'DELETE FROM "{META_SCHEMA}".cdc_state WHERE slot = %s', (slot,))
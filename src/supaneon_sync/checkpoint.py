@@ -0,0 +1,321 @@
+"""Checkpoints that let an interrupted backup be resumed.
+
+Every backup is registered in ``supaneon_sync.backup_runs`` as ``running``
+before anything is written to its schema, and only marked ``complete`` once
+the whole backup has succeeded. Schemas of runs still marked ``running`` are
+not backups: ``list_backup_schemas`` (and so rotation, the restore test and
+``verify``) skips them.
+
+While a backup runs, each finished step is recorded in
+``supaneon_sync.backup_checkpoint``: the tables being created, every table
+whose data has been loaded and every post-data object. A step is recorded in
+the same transaction as the work it stands for wherever possible, so a
+checkpoint never claims a table that was rolled back, nor misses one that was
+committed. A resumed run skips the recorded steps.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Iterable, Iterator, Sequence
+
+import psycopg
+from psycopg import sql
+
+from . import db
+from .manifest import META_SCHEMA
+from .remap import copy_header_name, is_copy_end
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETE = "complete"
+
+# The backup schema's tables (pg_dump's pre-data section) exist.
+STEP_TABLES = "tables"
+
+
+def table_step(table: str, schema: str | None = None) -> str:
+    """Step recorded once ``table``'s data is loaded.
+
+    ``schema`` names the target schema of a table outside the backup schema
+    itself (see ``backup.target_schemas``).
+    """
+    return f"table:{schema}.{table}" if schema else f"table:{table}"
+
+
+def post_data_step(kind: str, name: str, schema: str = "") -> str:
+    """Step recorded once a post-data object is created.
+
+    Object names are only unique within a schema, so a backup spanning
+    several schemas needs ``schema`` to tell e.g. two ``users_pkey`` apart.
+    """
+    return f"post_data:{kind}:{schema}.{name}" if schema else f"post_data:{kind}:{name}"
+
+
+def ensure_checkpoint_tables(conn: psycopg.Connection) -> None:
+    conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{META_SCHEMA}"')
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{META_SCHEMA}".backup_runs (
+            backup_schema text PRIMARY KEY,
+            mode text NOT NULL,
+            status text NOT NULL,
+            started_at timestamptz NOT NULL DEFAULT now(),
+            finished_at timestamptz
+        )
+    """)
+    # The Supabase schemas backed up, in ``backup.target_schemas`` order.
+    conn.execute(f"""
+        ALTER TABLE "{META_SCHEMA}".backup_runs
+        ADD COLUMN IF NOT EXISTS schemas text[]
+    """)
+    # Source transaction id horizon when fingerprints were read (see
+    # ``incremental``).
+    conn.execute(f"""
+        ALTER TABLE "{META_SCHEMA}".backup_runs
+        ADD COLUMN IF NOT EXISTS xmin_watermark bigint
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{META_SCHEMA}".backup_checkpoint (
+            backup_schema text NOT NULL,
+            step text NOT NULL,
+            rows bigint,
+            recorded_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (backup_schema, step)
+        )
+    """)
+
+
+def _runs_table_exists(conn: psycopg.Connection) -> bool:
+    row = conn.execute(
+        "SELECT to_regclass(%s)", (f'"{META_SCHEMA}".backup_runs',)
+    ).fetchone()
+    return row is not None and row[0] is not None
+
+
+def start_run(
+    neon_url: str,
+    backup_schema: str,
+    mode: str,
+    schemas: Sequence[str] = ("public",),
+) -> None:
+    """Register ``backup_schema`` as a backup of ``schemas`` in progress."""
+    with db.connection(neon_url) as conn:
+        ensure_checkpoint_tables(conn)
+        conn.execute(
+            f"""
+            INSERT INTO "{META_SCHEMA}".backup_runs
+                (backup_schema, mode, status, schemas)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (backup_schema) DO NOTHING
+            """,
+            (backup_schema, mode, STATUS_RUNNING, list(schemas)),
+        )
+
+
+def run_schemas(neon_url: str, backup_schema: str) -> list[str]:
+    """The Supabase schemas ``backup_schema`` backed up.
+
+    Backups registered before the list was recorded backed up ``public``.
+    """
+    with db.connection(neon_url) as conn:
+        if not _runs_table_exists(conn):
+            return ["public"]
+        ensure_checkpoint_tables(conn)
+        row = conn.execute(
+            f'SELECT schemas FROM "{META_SCHEMA}".backup_runs WHERE backup_schema = %s',
+            (backup_schema,),
+        ).fetchone()
+    return list(row[0]) if row and row[0] else ["public"]
+
+
+def record_watermark(neon_url: str, backup_schema: str, watermark: int) -> None:
+    """Record the source xmin horizon ``backup_schema``'s fingerprints date from."""
+    with db.connection(neon_url) as conn:
+        conn.execute(
+            f"""
+            UPDATE "{META_SCHEMA}".backup_runs SET xmin_watermark = %s
+            WHERE backup_schema = %s
+            """,
+            (watermark, backup_schema),
+        )
+
+
+def run_watermark(neon_url: str, backup_schema: str) -> int | None:
+    """The watermark recorded by ``record_watermark``, if any."""
+    with db.connection(neon_url) as conn:
+        if not _runs_table_exists(conn):
+            return None
+        ensure_checkpoint_tables(conn)
+        row = conn.execute(
+            f"""
+            SELECT xmin_watermark FROM "{META_SCHEMA}".backup_runs
+            WHERE backup_schema = %s
+            """,
+            (backup_schema,),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def finish_run(neon_url: str, backup_schema: str) -> None:
+    """Mark ``backup_schema`` complete; its checkpoints are no longer needed."""
+    with db.connection(neon_url) as conn:
+        conn.execute(
+            f"""
+            UPDATE "{META_SCHEMA}".backup_runs
+            SET status = %s, finished_at = now()
+            WHERE backup_schema = %s
+            """,
+            (STATUS_COMPLETE, backup_schema),
+        )
+        conn.execute(
+            f'DELETE FROM "{META_SCHEMA}".backup_checkpoint WHERE backup_schema = %s',
+            (backup_schema,),
+        )
+
+
+def forget_run(neon_url: str, backup_schema: str) -> None:
+    """Delete all bookkeeping of an abandoned run."""
+    with db.connection(neon_url) as conn:
+        if not _runs_table_exists(conn):
+            return
+        for table in ("backup_checkpoint", "backup_runs"):
+            conn.execute(
+                f'DELETE FROM "{META_SCHEMA}".{table} WHERE backup_schema = %s',
+                (backup_schema,),
+            )
+
+
+def incomplete_runs(neon_url: str, mode: str | None = None) -> list[str]:
+    """Schemas of backups that started but never completed, oldest first."""
+    with db.connection(neon_url) as conn:
+        if not _runs_table_exists(conn):
+            return []
+        rows = conn.execute(
+            f"""
+            SELECT r.backup_schema
+            FROM "{META_SCHEMA}".backup_runs r
+            JOIN pg_namespace n ON n.nspname = r.backup_schema
+            WHERE r.status = %s AND (%s::text IS NULL OR r.mode = %s)
+            ORDER BY r.backup_schema
+            """,
+            (STATUS_RUNNING, mode, mode),
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+class Checkpoint:
+    """The recorded steps of one backup run; safe to use from several threads."""
+
+    def __init__(
+        self,
+        neon_url: str,
+        backup_schema: str,
+        steps: dict[str, int | None] | None = None,
+        resumed: bool = False,
+    ):
+        self.neon_url = neon_url
+        self.backup_schema = backup_schema
+        self.resumed = resumed
+        self._steps: dict[str, int | None] = dict(steps or {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, neon_url: str, backup_schema: str) -> Checkpoint:
+        """Steps already recorded for ``backup_schema``, for resuming it."""
+        with db.connection(neon_url) as conn:
+            ensure_checkpoint_tables(conn)
+            rows = conn.execute(
+                f"""
+                SELECT step, rows FROM "{META_SCHEMA}".backup_checkpoint
+                WHERE backup_schema = %s
+                """,
+                (backup_schema,),
+            ).fetchall()
+        return cls(neon_url, backup_schema, dict(rows), resumed=True)
+
+    def done(self, step: str) -> bool:
+        with self._lock:
+            return step in self._steps
+
+    def rows(self, step: str) -> int | None:
+        with self._lock:
+            return self._steps.get(step)
+
+    def steps(self, prefix: str = "") -> list[str]:
+        with self._lock:
+            return sorted(s for s in self._steps if s.startswith(prefix))
+
+    def _insert(self, step: str, rows: int | None) -> sql.Composed:
+        return sql.SQL(
+            "INSERT INTO {} (backup_schema, step, rows) VALUES ({}, {}, {}) "
+            "ON CONFLICT (backup_schema, step) DO UPDATE SET rows = EXCLUDED.rows, "
+            "recorded_at = now()"
+        ).format(
+            sql.Identifier(META_SCHEMA, "backup_checkpoint"),
+            sql.Literal(self.backup_schema),
+            sql.Literal(step),
+            sql.Literal(rows),
+        )
+
+    def table_step(self, table: str, schema: str) -> str:
+        """``table_step`` of ``table`` loaded into ``schema``."""
+        return table_step(table, None if schema == self.backup_schema else schema)
+
+    def mark(
+        self, conn: psycopg.Connection, step: str, rows: int | None = None
+    ) -> None:
+        """Record ``step`` in ``conn``'s current transaction.
+
+        The caller commits; the step counts as done from then on.
+        """
+        conn.execute(self._insert(step, rows))
+        with self._lock:
+            self._steps[step] = rows
+
+    async def amark(
+        self, conn: psycopg.AsyncConnection, step: str, rows: int | None = None
+    ) -> None:
+        """``mark`` for an asyncio connection."""
+        await conn.execute(self._insert(step, rows))
+        with self._lock:
+            self._steps[step] = rows
+
+    def mark_now(self, step: str, rows: int | None = None) -> None:
+        """Record ``step`` in a transaction of its own."""
+        with db.connection(self.neon_url) as conn:
+            self.mark(conn, step, rows)
+
+    def resume_stage(self, lines: Iterable[bytes]) -> Iterator[bytes]:
+        """Generator stage making a data-only dump for psql resumable.
+
+        Each ``COPY`` block is wrapped in a transaction together with the
+        insert of its checkpoint, and blocks of tables already loaded are
+        dropped.
+        """
+        in_copy = skipping = False
+        step = ""
+        for line in lines:
+            if in_copy:
+                if not skipping:
+                    yield line
+                if is_copy_end(line):
+                    in_copy = False
+                    if not skipping:
+                        # Rows are not known in psql; the checkpoint records
+                        # only that the table is complete.
+                        yield self._insert(step, None).as_string(None).encode()
+                        yield b";\nCOMMIT;\n"
+                continue
+
+            name = copy_header_name(line)
+            if name is None:
+                yield line
+                continue
+            schema, table = name
+            in_copy = True
+            step = self.table_step(table, schema or self.backup_schema)
+            skipping = self.done(step)
+            if skipping:
+                print(f"  Skipping {table}: loaded by an earlier attempt")
+                continue
+            yield b"BEGIN;\n"
+            yield line
@@ -1,10 +1,14 @@
 import os
 import re
-from dataclasses import dataclass
+import tomllib
+from dataclasses import dataclass, field
+from typing import Any
 from urllib.parse import urlparse
 
 from dotenv import load_dotenv
 
+from .exceptions import ConfigError
+
 load_dotenv()
 
 REQUIRED_ENVS = ["SUPABASE_DATABASE_URL", "NEON_DATABASE_URL"]
@@ -20,6 +24,8 @@ class Config:
     neon_project_id: str | None = None
     neon_db_password: str | None = None
     neon_db_user: str | None = None
+    # Branch NEON_DATABASE_URL points at; backup branches are taken from it.
+    neon_branch_id: str | None = None
 
 
 def validate_env() -> Config:
@@ -49,6 +55,10 @@ def validate_env() -> Config:
     if neon_project:
         neon_project = neon_project.strip()
 
+    neon_branch = os.environ.get("NEON_BRANCH_ID")
+    if neon_branch:
+        neon_branch = neon_branch.strip()
+
     neon_password = os.environ.get("NEON_DB_PASSWORD")
     neon_user = os.environ.get("NEON_DB_USER")
 
@@ -69,4 +79,106 @@ def validate_env() -> Config:
         neon_project_id=neon_project,
         neon_db_password=neon_password,
         neon_db_user=neon_user,
+        neon_branch_id=neon_branch,
+    )
+
+
+# Per-project settings a projects file may override; see ``load_projects``.
+PROJECT_OVERRIDES = ("mode", "workers", "incremental", "keep", "schemas")
+# Branch backups take the Neon API settings from the environment, so every
+# project would branch, and rotate the branches of, the same Neon project.
+SINGLE_PROJECT_MODES = ("branch",)
+
+
+@dataclass
+class ProjectConfig:
+    """One Supabase project and the Neon database it is backed up into."""
+
+    name: str
+    supabase_database_url: str
+    neon_database_url: str
+    # Backup options that differ from the command line's.
+    overrides: dict[str, Any] = field(default_factory=dict)
+
+
+def _project_url(entry: dict[str, Any], key: str, where: str) -> str:
+    # A URL is given either inline or, to keep secrets out of the file, as
+    # the name of the environment variable holding it.
+    env_name = entry.get(f"{key}_env")
+    if env_name:
+        url = os.environ.get(env_name, "").strip()
+        if not url:
+            raise ConfigError(f"{where}: environment variable {env_name} is not set")
+    else:
+        url = str(entry.get(key, "")).strip()
+        if not url:
+            raise ConfigError(f"{where}: {key} or {key}_env is required")
+    if not DB_URL_RE.search(url):
+        raise ConfigError(f"{where}: {key} must include sslmode=require")
+    return url
+
+
+def load_projects(path: str) -> list[ProjectConfig]:
+    """Read the projects to back up from a TOML file.
+
+    Each ``[[project]]`` table has a ``name``, a ``supabase_url`` and a
+    ``neon_url`` (or ``supabase_url_env`` / ``neon_url_env`` naming
+    environment variables), plus any of ``PROJECT_OVERRIDES``. Values in an
+    optional ``[defaults]`` table apply to every project. Raises ConfigError
+    on an invalid file.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise ConfigError(f"Cannot read projects file {path}: {e}") from e
+
+    defaults = data.get("defaults", {})
+    unknown = set(defaults) - set(PROJECT_OVERRIDES)
+    if unknown:
+        raise ConfigError(f"{path}: unknown defaults {', '.join(sorted(unknown))}")
+
+    projects: list[ProjectConfig] = []
+    for i, entry in enumerate(data.get("project", [])):
+        name = str(entry.get("name") or f"project-{i + 1}")
+        where = f"{path}: project {name}"
+        known = {"name", "supabase_url", "supabase_url_env", "neon_url"}
+        known |= {"neon_url_env", *PROJECT_OVERRIDES}
+        unknown = set(entry) - known
+        if unknown:
+            raise ConfigError(f"{where}: unknown keys {', '.join(sorted(unknown))}")
+        overrides = {
+            **defaults,
+            **{k: entry[k] for k in PROJECT_OVERRIDES if k in entry},
+        }
+        if overrides.get("mode") in SINGLE_PROJECT_MODES:
+            raise ConfigError(
+                f"{where}: '{overrides['mode']}' mode backs up a single project"
+            )
+        projects.append(
+            ProjectConfig(
+                name=name,
+                supabase_database_url=_project_url(entry, "supabase_url", where),
+                neon_database_url=_project_url(entry, "neon_url", where),
+                overrides=overrides,
+            )
+        )
+
+    if not projects:
+        raise ConfigError(f"{path}: no [[project]] entries")
+    names = [p.name for p in projects]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ConfigError(f"{path}: duplicate project names {', '.join(duplicates)}")
+    # Backup schemas and their rotation are per database, so two projects
+    # writing to one Neon database would rotate each other's backups away.
+    targets = [p.neon_database_url for p in projects]
+    shared = sorted(
+        {p.name for p in projects if targets.count(p.neon_database_url) > 1}
     )
+    if shared:
+        raise ConfigError(
+            f"{path}: projects {', '.join(shared)} share a Neon database; "
+            "each project needs its own"
+        )
+    return projects
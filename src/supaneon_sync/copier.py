@@ -0,0 +1,461 @@
+"""Parallel per-table data copy from Supabase into a Neon backup schema.
+
+Each table is streamed with ``COPY ... TO STDOUT`` on the source and
+``COPY ... FROM STDIN`` on the target. All source workers attach to one
+snapshot exported by a coordinator transaction (``pg_export_snapshot``), so
+the copied tables are mutually consistent even though they are read over
+separate connections.
+Each copy reads from Supabase and writes to Neon in two threads, through a
+bounded ring of buffers (``buffers.pump``), so neither side idles while the
+other is briefly slow.
+
+Tables larger than a size threshold are split into ranges of their pages
+(``ctid`` ranges, read with a TID range scan), which are copied concurrently
+like tables of their own. Every row version visible to the snapshot lives at
+exactly one ``ctid``, so the ranges partition the table's rows exactly; the
+last range is open-ended. The table is recorded as loaded once all its
+ranges are, and on a resumed backup it is emptied before its ranges are
+copied again.
+
+In the ``binary`` format, rows travel in COPY's binary format, which both
+servers produce and consume without converting every value to and from text;
+the chunks are passed through unparsed. Binary values are not portable in
+general, so a table falls back to text when one of its columns has a type
+created in the database (domains, enums, composite and extension types) or
+an array of one, whose binary form embeds database-specific OIDs or depends
+on the extension's version. All tables fall back to text when Neon runs an
+older major version than Supabase, which may not read every value the newer
+one writes (e.g. numeric infinities, new in PostgreSQL 14).
+"""
+
+from __future__ import annotations
+
+import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Collection, Iterable, Mapping
+
+import psycopg
+from psycopg import sql
+from psycopg.abc import Query
+
+from . import db
+
+from .buffers import pump
+from .checkpoint import Checkpoint
+from .filters import TableSelection
+
+DEFAULT_WORKERS = 4
+# Tables above this size are copied in ranges of about this size each.
+DEFAULT_SPLIT_BYTES = 2 * 1024**3
+# TID range scans, without which every range would scan the whole table.
+TID_RANGE_SCAN_VERSION = 140000
+COPY_FORMATS = ("text", "binary")
+# OIDs below this are the system's own objects.
+FIRST_NORMAL_OID = 16384
+
+
+@dataclass
+class TableCopyResult:
+    table: str
+    rows: int
+    bytes: int
+    # Target schema, if not the backup schema itself.
+    schema: str | None = None
+    # Seconds the copy waited on Supabase and on Neon.
+    source_wait: float = 0.0
+    target_wait: float = 0.0
+
+
+# Ordinary tables of a schema, largest first.
+TABLES_QUERY = """
+    SELECT c.relname
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %s AND c.relkind = 'r'
+    ORDER BY pg_relation_size(c.oid) DESC, c.relname ASC
+"""
+
+# Tables of a schema larger than a size, with the pages of their main fork.
+LARGE_TABLES_QUERY = """
+    SELECT c.relname,
+           pg_table_size(c.oid),
+           pg_relation_size(c.oid) / current_setting('block_size')::int
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %s AND c.relkind = 'r' AND pg_table_size(c.oid) > %s
+"""
+
+# Columns COPY reads and writes when it is not given a column list.
+COLUMNS_QUERY = """
+    SELECT attname
+    FROM pg_attribute
+    WHERE attrelid = %s::regclass AND attnum > 0
+        AND NOT attisdropped AND attgenerated = ''
+    ORDER BY attnum
+"""
+
+# Tables of a schema with a column COPY's binary format cannot carry over.
+TEXT_ONLY_TABLES_QUERY = """
+    SELECT DISTINCT c.relname
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_type t ON t.oid = a.atttypid
+    LEFT JOIN pg_type e ON e.oid = t.typelem AND t.typcategory = 'A'
+    WHERE n.nspname = %s AND c.relkind = 'r' AND a.attnum > 0
+        AND NOT a.attisdropped
+        AND (t.oid >= %s OR t.typtype = 'c' OR e.oid >= %s OR e.typtype = 'c')
+"""
+
+# With the table owning each sequence (serial and identity columns), if any.
+SEQUENCES_QUERY = """
+    SELECT s.sequencename, s.last_value, tn.nspname, t.relname
+    FROM pg_sequences s
+    LEFT JOIN pg_depend d
+        ON d.classid = 'pg_class'::regclass
+        AND d.objid = format('%%I.%%I', s.schemaname, s.sequencename)::regclass
+        AND d.refclassid = 'pg_class'::regclass
+        AND d.deptype IN ('a', 'i')
+    LEFT JOIN pg_class t ON t.oid = d.refobjid
+    LEFT JOIN pg_namespace tn ON tn.oid = t.relnamespace
+    WHERE s.schemaname = %s AND s.last_value IS NOT NULL
+"""
+
+
+def list_tables(conn: psycopg.Connection, schema: str = "public") -> list[str]:
+    """Return ordinary tables in ``schema``, largest first.
+
+    Starting the biggest tables first keeps the worker pool busy until the end
+    instead of leaving one long copy running alone.
+    """
+    cur = conn.execute(TABLES_QUERY, (schema,))
+    return [row[0] for row in cur.fetchall()]
+
+
+@dataclass(frozen=True)
+class PageRange:
+    """Rows stored in pages ``lo <= page < hi``; None means unbounded."""
+
+    lo: int | None = None
+    hi: int | None = None
+
+    def condition(self) -> sql.Composable:
+        parts = []
+        if self.lo is not None:
+            parts.append(
+                sql.SQL("ctid >= {}::tid").format(sql.Literal(f"({self.lo},0)"))
+            )
+        if self.hi is not None:
+            parts.append(
+                sql.SQL("ctid < {}::tid").format(sql.Literal(f"({self.hi},0)"))
+            )
+        return sql.SQL(" AND ").join(parts) if parts else sql.SQL("true")
+
+
+def page_ranges(pages: int, chunks: int) -> list[PageRange]:
+    """Split ``pages`` pages into ``chunks`` ranges, the outer ones open-ended."""
+    width = max(1, math.ceil(pages / max(1, chunks)))
+    edges: list[int | None] = [None, *range(width, pages, width), None]
+    return [PageRange(lo, hi) for lo, hi in zip(edges, edges[1:])]
+
+
+def split_tables(
+    conn: psycopg.Connection, schema: str, split_bytes: int
+) -> dict[str, list[PageRange]]:
+    """Page ranges of the tables of ``schema`` larger than ``split_bytes``."""
+    if conn.info.server_version < TID_RANGE_SCAN_VERSION:
+        return {}
+    rows = conn.execute(LARGE_TABLES_QUERY, (schema, split_bytes)).fetchall()
+    return {
+        table: page_ranges(pages, math.ceil(size / split_bytes))
+        for table, size, pages in rows
+        if pages > 1
+    }
+
+
+def text_only_tables(conn: psycopg.Connection, schema: str) -> set[str]:
+    """Tables of ``schema`` to copy in text even in the binary format."""
+    rows = conn.execute(
+        TEXT_ONLY_TABLES_QUERY, (schema, FIRST_NORMAL_OID, FIRST_NORMAL_OID)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def _begin_snapshot(conn: psycopg.Connection, snapshot: str | None) -> None:
+    conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+    conn.read_only = True
+    if snapshot:
+        # Must be the first statement of the transaction; utility statements
+        # cannot take bind parameters, hence the literal.
+        conn.execute(
+            sql.SQL("SET TRANSACTION SNAPSHOT {}").format(sql.Literal(snapshot))
+        )
+
+
+def copy_table(
+    source_url: str,
+    target_url: str,
+    table: str,
+    target_schema: str,
+    source_schema: str = "public",
+    snapshot: str | None = None,
+    checkpoint: Checkpoint | None = None,
+    pages: PageRange | None = None,
+    binary: bool = False,
+) -> TableCopyResult:
+    """Stream one table from ``source_schema`` into ``target_schema``.
+
+    With ``checkpoint`` the table is recorded as loaded in the same
+    transaction as its data. With ``pages`` only the rows stored in that
+    range of pages are copied, and nothing is recorded. With ``binary`` the
+    rows are moved in COPY's binary format.
+    """
+    fmt = sql.SQL(" (FORMAT binary)" if binary else "")
+    copy_out: Query = sql.SQL("COPY {} TO STDOUT{}").format(
+        sql.Identifier(source_schema, table), fmt
+    )
+    copy_in: Query = sql.SQL("COPY {} FROM STDIN{}").format(
+        sql.Identifier(target_schema, table), fmt
+    )
+
+    with db.connection(source_url) as src, db.connection(target_url) as dst:
+        _begin_snapshot(src, snapshot)
+        if pages is not None:
+            relation = sql.Identifier(source_schema, table).as_string(src)
+            columns = sql.SQL(", ").join(
+                sql.Identifier(row[0])
+                for row in src.execute(COLUMNS_QUERY, (relation,)).fetchall()
+            )
+            copy_out = sql.SQL("COPY (SELECT {} FROM {} WHERE {}) TO STDOUT{}").format(
+                columns, sql.Identifier(source_schema, table), pages.condition(), fmt
+            )
+            copy_in = sql.SQL("COPY {} ({}) FROM STDIN{}").format(
+                sql.Identifier(target_schema, table), columns, fmt
+            )
+        with src.cursor() as scur, dst.cursor() as dcur:
+            with scur.copy(copy_out) as cin, dcur.copy(copy_in) as cout:
+                stats = pump(cin, cout.write)
+            rows = dcur.rowcount
+        if checkpoint is not None and pages is None:
+            checkpoint.mark(dst, checkpoint.table_step(table, target_schema), rows)
+        dst.commit()
+
+    return TableCopyResult(
+        table=table,
+        rows=rows,
+        bytes=stats.bytes,
+        source_wait=stats.source_wait,
+        target_wait=stats.sink_wait,
+    )
+
+
+def stall_seconds(results: Iterable[TableCopyResult]) -> dict[str, float]:
+    """Total time ``results`` waited on Supabase ("source") and Neon ("target")."""
+    results = list(results)
+    return {
+        "source": sum(r.source_wait for r in results),
+        "target": sum(r.target_wait for r in results),
+    }
+
+
+def _text_only(
+    coord: psycopg.Connection,
+    target_url: str,
+    tables: list[tuple[str, str, str]],
+) -> set[tuple[str, str]]:
+    """``(source schema, table)`` of the ``tables`` to copy in text."""
+    with db.connection(target_url) as dst:
+        target_major = dst.info.server_version // 10000
+    source_major = coord.info.server_version // 10000
+    if target_major < source_major:
+        print(
+            f"Neon runs PostgreSQL {target_major}, older than Supabase's "
+            f"{source_major}; copying in text format."
+        )
+        return {(source, t) for source, _, t in tables}
+    sources = dict.fromkeys(source for source, _, _ in tables)
+    text_only = {
+        (source, t) for source in sources for t in text_only_tables(coord, source)
+    }
+    names = [f"{s}.{t}" for s, _, t in tables if (s, t) in text_only]
+    if names:
+        print(f"Copying in text format (no portable binary form): {', '.join(names)}")
+    return text_only
+
+
+def copy_tables(
+    source_url: str,
+    target_url: str,
+    target_schema: str,
+    workers: int = DEFAULT_WORKERS,
+    source_schema: str = "public",
+    only: Collection[str] | None = None,
+    checkpoint: Checkpoint | None = None,
+    schemas: Mapping[str, str] | None = None,
+    selection: TableSelection | None = None,
+    split_bytes: int | None = None,
+    copy_format: str = "text",
+    snapshot: str | None = None,
+) -> list[TableCopyResult]:
+    """Copy every table of ``source_schema`` across a pool of ``workers``.
+
+    ``schemas`` maps further source schemas to their target schemas; their
+    tables are copied by the same pool, under the same snapshot. ``only``
+    restricts the copy of ``source_schema`` to the named tables, and tables
+    ``checkpoint`` already has as loaded are skipped. With ``selection``
+    only the tables whose rows it copies are copied, in its order. Tables
+    larger than ``split_bytes`` are copied in page ranges of about that size.
+    Tables are read under ``snapshot`` if given (it must stay exported until
+    the copy returns), or else under one the coordinator exports.
+    In the ``binary`` ``copy_format``, tables whose columns allow it are
+    moved in COPY's binary format, the others in text. The first failing
+    table (or range) cancels all that have not started yet and its exception
+    is re-raised.
+    """
+    results: list[TableCopyResult] = []
+    # Every worker holds a source and a target connection; the source pool
+    # also holds the coordinator.
+    db.get_pool(source_url, max_size=workers + 1)
+    db.get_pool(target_url, max_size=workers)
+
+    with db.connection(source_url) as coord:
+        _begin_snapshot(coord, snapshot)
+        # (source schema, target schema, table)
+        tables = [
+            (source_schema, target_schema, t)
+            for t in list_tables(coord, source_schema)
+            if only is None or t in only
+        ]
+        for source, target in (schemas or {}).items():
+            if source != source_schema:
+                tables += [(source, target, t) for t in list_tables(coord, source)]
+        if checkpoint is not None:
+            tables = [
+                (source, target, t)
+                for source, target, t in tables
+                if not checkpoint.done(checkpoint.table_step(t, target))
+            ]
+        if selection is not None:
+            tables = sorted(
+                (name for name in tables if selection.copies(name[0], name[2])),
+                key=lambda name: selection.position(name[0], name[2]),
+            )
+        # (source schema, table) -> page ranges, for the tables split up.
+        ranges: dict[tuple[str, str], list[PageRange]] = {}
+        if split_bytes:
+            for source in dict.fromkeys(source for source, _, _ in tables):
+                for t, table_ranges in split_tables(coord, source, split_bytes).items():
+                    ranges[source, t] = table_ranges
+        # (source schema, table) of the tables copied in text.
+        text_only: set[tuple[str, str]] = set()
+        if copy_format == "binary":
+            text_only = _text_only(coord, target_url, tables)
+        split = [(target, t) for source, target, t in tables if (source, t) in ranges]
+        if split and checkpoint is not None and checkpoint.resumed:
+            # Ranges are committed one by one; an earlier attempt may have
+            # left some of them behind.
+            with db.connection(target_url) as dst:
+                dst.execute(
+                    sql.SQL("TRUNCATE {}").format(
+                        sql.SQL(", ").join(sql.Identifier(*name) for name in split)
+                    )
+                )
+        if snapshot is None:
+            row = coord.execute("SELECT pg_export_snapshot()").fetchone()
+            snapshot = row[0] if row else None
+
+        # The exported snapshot stays valid only while this transaction is
+        # open, so the coordinator connection outlives every worker.
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            futures = {
+                pool.submit(
+                    copy_table,
+                    source_url,
+                    target_url,
+                    table,
+                    target,
+                    source,
+                    snapshot,
+                    checkpoint,
+                    pages,
+                    copy_format == "binary" and (source, table) not in text_only,
+                ): (source, target, table)
+                for source, target, table in tables
+                for pages in ranges.get((source, table), [None])
+            }
+            # Ranges still being copied, and the totals so far, per table.
+            left = Counter(futures.values())
+            totals: dict[tuple[str, str, str], TableCopyResult] = {}
+            for fut in as_completed(futures):
+                source, target, table = key = futures[fut]
+                part = fut.result()
+                result = totals.setdefault(key, TableCopyResult(table, 0, 0))
+                result.rows += part.rows
+                result.bytes += part.bytes
+                result.source_wait += part.source_wait
+                result.target_wait += part.target_wait
+                left[key] -= 1
+                if left[key]:
+                    continue
+                parts = len(ranges.get((source, table), []))
+                if parts and checkpoint is not None:
+                    checkpoint.mark_now(
+                        checkpoint.table_step(table, target), result.rows
+                    )
+                name = table
+                if target != target_schema:
+                    result.schema = target
+                    name = f"{target}.{table}"
+                print(
+                    f"  Copied {name}: {result.rows} rows"
+                    + (f" in {parts} ranges" if parts else "")
+                )
+                results.append(result)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    return results
+
+
+def backed_up_sequences(
+    rows: Iterable[tuple], selection: TableSelection | None = None
+) -> list[tuple[str, int]]:
+    """``(name, last_value)`` of ``SEQUENCES_QUERY`` rows the backup has.
+
+    pg_dump only creates a sequence owned by a table together with the table,
+    so those of tables ``selection`` excludes are left out.
+    """
+    excluded = set(selection.excluded) if selection is not None else set()
+    return [
+        (name, last_value)
+        for name, last_value, owner_schema, owner in rows
+        if (owner_schema, owner) not in excluded
+    ]
+
+
+def copy_sequences(
+    source_url: str,
+    target_url: str,
+    target_schema: str,
+    source_schema: str = "public",
+    selection: TableSelection | None = None,
+) -> int:
+    """Carry sequence positions over, as pg_dump's ``SEQUENCE SET`` would."""
+    with db.connection(source_url) as src:
+        rows = backed_up_sequences(
+            src.execute(SEQUENCES_QUERY, (source_schema,)).fetchall(), selection
+        )
+
+    if not rows:
+        return 0
+
+    with db.connection(target_url) as dst:
+        for name, last_value in rows:
+            dst.execute(
+                "SELECT pg_catalog.setval(%s::regclass, %s, true)",
+                (sql.Identifier(target_schema, name).as_string(dst), last_value),
+            )
+    return len(rows)
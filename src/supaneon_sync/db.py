@@ -0,0 +1,97 @@
+"""Shared connection pools.
+
+Every database URL gets one small pool, created on first use and kept for the
+life of the process. The many short metadata queries of a run (listing and
+dropping backup schemas, creating the new one, manifests, healthchecks) then
+reuse a few sessions instead of each paying for TLS setup and, on Neon, a
+possible compute cold start.
+
+Pools open their connections from background threads, so ``warm_up`` returns
+immediately and the Neon compute starts while Supabase is being dumped.
+"""
+
+from __future__ import annotations
+
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+import psycopg
+from psycopg_pool import ConnectionPool
+
+DEFAULT_POOL_SIZE = 4
+# Seconds to wait for a connection. Long enough to ride out a Neon compute
+# start; unreachable databases fail with psycopg_pool.PoolTimeout, and the
+# underlying connection errors are logged by the "psycopg.pool" logger.
+CONNECT_TIMEOUT = 60.0
+
+_pools: dict[str, ConnectionPool] = {}
+_lock = threading.Lock()
+
+
+def _reset(conn: psycopg.Connection) -> None:
+    # Connections come back idle (the pool rolls back open transactions), so
+    # per-use settings can be put back to the psycopg defaults. These are all
+    # client-side and cost no round trip.
+    conn.autocommit = False
+    conn.isolation_level = None
+    conn.read_only = None
+
+
+def get_pool(url: str, max_size: int = DEFAULT_POOL_SIZE) -> ConnectionPool:
+    """Return the pool for ``url``, growing it to at least ``max_size``."""
+    with _lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = ConnectionPool(
+                url,
+                min_size=1,
+                max_size=max_size,
+                open=False,
+                reset=_reset,
+                timeout=CONNECT_TIMEOUT,
+                name=f"supaneon-{len(_pools)}",
+            )
+            pool.open(wait=False)
+            _pools[url] = pool
+        elif pool.max_size < max_size:
+            pool.resize(pool.min_size, max_size)
+        return pool
+
+
+@contextmanager
+def connection(url: str, autocommit: bool = False) -> Iterator[psycopg.Connection]:
+    """Borrow a pooled connection to ``url``.
+
+    Like ``psycopg.connect`` used as a context manager, the transaction is
+    committed on success and rolled back on error.
+    """
+    with get_pool(url).connection() as conn:
+        if autocommit:
+            conn.autocommit = True
+        yield conn
+
+
+def warm_up(url: str) -> None:
+    """Start connecting to ``url`` in the background without waiting."""
+    get_pool(url)
+
+
+def close_pool(url: str) -> None:
+    """Close the pool for ``url``, if there is one."""
+    with _lock:
+        pool = _pools.pop(url, None)
+    if pool is not None:
+        pool.close()
+
+
+def close_all() -> None:
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all)
@@ -0,0 +1,216 @@
+"""Directory-format dump and parallel load.
+
+``pg_dump --format=directory --jobs=N`` writes one data file per table next to
+a binary table of contents. The DDL sections are rendered back to SQL with
+``pg_restore --section=... -f -`` and pushed through the schema remapper, while
+each table's data file is loaded with ``COPY ... FROM STDIN`` into the backup
+schema across a pool of workers.
+
+``pg_restore`` itself cannot rename a schema (the name lives inside the binary
+TOC), so data files are streamed by this module instead of by
+``pg_restore --jobs`` directly.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Iterable, Mapping, Sequence
+
+from psycopg import sql
+
+from . import db
+from .checkpoint import Checkpoint
+from .copier import TableCopyResult
+from .filters import TableSelection
+from .utils import schema_flag
+
+CHUNK_SIZE = 1024 * 1024
+
+# "3344; 0 16390 TABLE DATA public users postgres"
+_toc_data_re = re.compile(
+    r"^(?P<id>\d+);\s+\d+\s+\d+\s+TABLE DATA\s+(?P<schema>\S+)\s+"
+    r"(?P<name>.+?)\s+(?P<owner>\S+)$"
+)
+
+
+@dataclass
+class TocEntry:
+    dump_id: int
+    schema: str
+    name: str
+
+
+def dump_directory(
+    supabase_url: str,
+    dump_dir: str,
+    jobs: int,
+    schemas: Sequence[str] = ("public",),
+    extra: Sequence[str] = (),
+) -> None:
+    """Run a parallel, uncompressed directory-format dump of ``schemas``.
+
+    ``extra`` are further pg_dump options, e.g. table exclusions.
+    """
+    subprocess.run(
+        [
+            "pg_dump",
+            "--format=directory",
+            f"--jobs={jobs}",
+            "--compress=0",
+            *(schema_flag(schema) for schema in schemas),
+            *extra,
+            "--no-owner",
+            "--no-acl",
+            "--file",
+            dump_dir,
+            supabase_url,
+        ],
+        check=True,
+    )
+
+
+def section_cmd(dump_dir: str, section: str) -> list[str]:
+    """pg_restore command rendering one section of the dump as SQL on stdout."""
+    return [
+        "pg_restore",
+        f"--section={section}",
+        "--no-owner",
+        "--no-acl",
+        "--file=-",
+        dump_dir,
+    ]
+
+
+def parse_toc(listing: Iterable[str], schemas: Iterable[str] = ()) -> list[TocEntry]:
+    """Extract TABLE DATA entries from ``pg_restore --list`` output.
+
+    Names are listed unquoted; a schema name containing spaces is only told
+    from the table name if it is one of ``schemas``.
+    """
+    known = sorted((s for s in schemas if " " in s), key=len, reverse=True)
+    entries = []
+    for line in listing:
+        m = _toc_data_re.match(line.strip())
+        if m:
+            schema, name = m.group("schema"), m.group("name")
+            full = f"{schema} {name}"
+            for candidate in known:
+                if full.startswith(candidate + " "):
+                    schema, name = candidate, full[len(candidate) + 1 :]
+                    break
+            entries.append(TocEntry(int(m.group("id")), schema, name))
+    return entries
+
+
+def read_toc(dump_dir: str, schemas: Iterable[str] = ()) -> list[TocEntry]:
+    proc = subprocess.run(
+        ["pg_restore", "--list", dump_dir],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return parse_toc(proc.stdout.splitlines(), schemas)
+
+
+def _open_data_file(dump_dir: str, dump_id: int) -> io.BufferedIOBase:
+    path = os.path.join(dump_dir, f"{dump_id}.dat")
+    if os.path.exists(path):
+        return open(path, "rb")
+    return gzip.open(path + ".gz", "rb")
+
+
+def load_table_data(
+    neon_url: str,
+    dump_dir: str,
+    entry: TocEntry,
+    target_schema: str,
+    checkpoint: Checkpoint | None = None,
+) -> TableCopyResult:
+    """Stream one table's data file into ``target_schema``.
+
+    With ``checkpoint`` the table is recorded as loaded in the same
+    transaction as its data.
+    """
+    copy_in = sql.SQL("COPY {} FROM STDIN").format(
+        sql.Identifier(target_schema, entry.name)
+    )
+    nbytes = 0
+    with (
+        _open_data_file(dump_dir, entry.dump_id) as fin,
+        db.connection(neon_url) as conn,
+    ):
+        with conn.cursor() as cur:
+            with cur.copy(copy_in) as cout:
+                while chunk := fin.read(CHUNK_SIZE):
+                    cout.write(chunk)
+                    nbytes += len(chunk)
+            rows = cur.rowcount
+        if checkpoint is not None:
+            checkpoint.mark(
+                conn, checkpoint.table_step(entry.name, target_schema), rows
+            )
+        conn.commit()
+    return TableCopyResult(table=entry.name, rows=rows, bytes=nbytes)
+
+
+def load_directory(
+    neon_url: str,
+    dump_dir: str,
+    target_schema: str,
+    jobs: int,
+    apply_section: Callable[[list[str]], None],
+    checkpoint: Checkpoint | None = None,
+    schemas: Mapping[str, str] | None = None,
+    selection: TableSelection | None = None,
+) -> list[TableCopyResult]:
+    """Load a directory dump: pre-data DDL, parallel data, post-data DDL.
+
+    ``apply_section`` receives the pg_restore command for a DDL section and is
+    responsible for remapping and applying its SQL output. Tables of a dumped
+    schema ``schemas`` maps are loaded into its target, all others into
+    ``target_schema``. Tables ``checkpoint`` already has as loaded are skipped.
+    Tables are loaded in ``selection``'s copy order, if given.
+    """
+    apply_section(section_cmd(dump_dir, "pre-data"))
+
+    results: list[TableCopyResult] = []
+    targets = [
+        (entry, (schemas or {}).get(entry.schema, target_schema))
+        for entry in read_toc(dump_dir, schemas or ())
+    ]
+    if checkpoint is not None:
+        targets = [
+            (entry, target)
+            for entry, target in targets
+            if not checkpoint.done(checkpoint.table_step(entry.name, target))
+        ]
+    if selection is not None:
+        targets.sort(key=lambda t: selection.position(t[0].schema, t[0].name))
+    db.get_pool(neon_url, max_size=jobs)
+    pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+    try:
+        futures = {
+            pool.submit(
+                load_table_data, neon_url, dump_dir, entry, target, checkpoint
+            ): target
+            for entry, target in targets
+        }
+        for fut in as_completed(futures):
+            result = fut.result()
+            name = result.table
+            if futures[fut] != target_schema:
+                result.schema = futures[fut]
+                name = f"{result.schema}.{name}"
+            print(f"  Loaded {name}: {result.rows} rows")
+            results.append(result)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    apply_section(section_cmd(dump_dir, "post-data"))
+    return results
@@ -0,0 +1,166 @@
+"""Back up many Supabase projects in one run (``backup-run --all``).
+
+The projects of a projects file (see ``config.load_projects``) are backed up
+across a bounded pool of worker processes, so Python starts and the package
+is imported once per worker instead of once per project. Workers are spawned
+rather than forked: a fork would copy the parent's connection pools, and the
+threads behind them, in a broken state.
+
+As soon as the run starts, the parent opens a pooled connection to every
+Neon target, so computes that have scaled to zero come up while earlier
+projects are still being backed up. Each target's pool is closed once its
+project is done.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from . import backup, db
+from .backup import BackupOptions
+from .config import SINGLE_PROJECT_MODES, ProjectConfig
+from .exceptions import ConfigError
+from .utils import redact
+
+DEFAULT_PROCESSES = 4
+
+
+@dataclass
+class ProjectResult:
+    name: str
+    ok: bool
+    seconds: float
+    # The backup schema (or branch) taken.
+    backup: str | None = None
+    error: str | None = None
+
+
+def project_options(base: BackupOptions, project: ProjectConfig) -> BackupOptions:
+    """``base`` with ``project``'s overrides applied.
+
+    Files written per backup (artifacts, the Prometheus textfile) get a path
+    of their own per project, and all paths are made absolute: every backup
+    runs in its own working directory.
+    """
+    overrides = dict(project.overrides)
+    retention = base.retention
+    if "keep" in overrides:
+        retention = dataclasses.replace(retention, keep=overrides.pop("keep") or None)
+    options = dataclasses.replace(base, retention=retention, **overrides)
+
+    if base.artifact_dir:
+        options.artifact_dir = os.path.join(
+            os.path.abspath(base.artifact_dir), project.name
+        )
+    if base.metrics_file:
+        options.metrics_file = os.path.abspath(base.metrics_file)
+    if base.prometheus_file:
+        root, ext = os.path.splitext(os.path.abspath(base.prometheus_file))
+        options.prometheus_file = f"{root}.{project.name}{ext}"
+    return options
+
+
+def backup_project(project: ProjectConfig, options: BackupOptions) -> ProjectResult:
+    """Back up one project in a scratch working directory; never raises."""
+    started = time.monotonic()
+    cwd = os.getcwd()
+    print(f"[{project.name}] Starting {options.mode} backup...")
+    try:
+        with tempfile.TemporaryDirectory(prefix="supaneon-") as tmp:
+            # The plain mode writes its dumps to the working directory.
+            os.chdir(tmp)
+            try:
+                taken = backup.run(
+                    project.supabase_database_url,
+                    project.neon_database_url,
+                    options,
+                )
+            finally:
+                os.chdir(cwd)
+                # The next project this worker runs has other databases.
+                db.close_all()
+    except (Exception, SystemExit) as e:
+        error = redact(f"{type(e).__name__}: {e}")
+        print(f"[{project.name}] Backup failed: {error}")
+        return ProjectResult(
+            project.name, False, time.monotonic() - started, error=error
+        )
+    return ProjectResult(project.name, True, time.monotonic() - started, taken)
+
+
+def run_all(
+    projects: list[ProjectConfig],
+    options: BackupOptions,
+    processes: int = DEFAULT_PROCESSES,
+) -> list[ProjectResult]:
+    """Back up every project over at most ``processes`` worker processes.
+
+    A failing project does not stop the others. Returns one result per
+    project, in the order of ``projects``. Raises ConfigError if a project
+    would be backed up in a mode that backs up a single project.
+    """
+    options_by_project = {p.name: project_options(options, p) for p in projects}
+    for project in projects:
+        mode = options_by_project[project.name].mode
+        if mode in SINGLE_PROJECT_MODES:
+            raise ConfigError(
+                f"project {project.name}: '{mode}' mode backs up a single project"
+            )
+
+    for project in projects:
+        db.warm_up(project.neon_database_url)
+
+    results: dict[str, ProjectResult] = {}
+    pool = ProcessPoolExecutor(
+        max_workers=max(1, min(processes, len(projects))),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    try:
+        futures = {
+            pool.submit(backup_project, p, options_by_project[p.name]): p
+            for p in projects
+        }
+        for fut in as_completed(futures):
+            project = futures[fut]
+            try:
+                results[project.name] = fut.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed for using too much memory).
+                results[project.name] = ProjectResult(
+                    project.name, False, 0.0, error=f"{type(e).__name__}: {e}"
+                )
+            db.close_pool(project.neon_database_url)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for project in projects:
+            db.close_pool(project.neon_database_url)
+
+    return [results[p.name] for p in projects if p.name in results]
+
+
+def summary(results: list[ProjectResult]) -> str:
+    """Human-readable report of a ``run_all``."""
+    failed = [r for r in results if not r.ok]
+    lines = [
+        f"Backed up {len(results) - len(failed)} of {len(results)} projects"
+        + (f"; {len(failed)} failed:" if failed else "."),
+    ]
+    width = max((len(r.name) for r in results), default=0)
+    for r in sorted(results, key=lambda r: (r.ok, r.name)):
+        outcome = r.backup if r.ok else f"FAILED {r.error}"
+        lines.append(f"  {r.name:<{width}}  {r.seconds:8.1f}s  {outcome}")
+    return "\n".join(lines)
+
+
+def write_summary(results: list[ProjectResult], path: str) -> None:
+    """Write ``results`` to ``path`` as JSON."""
+    with open(path, "w") as f:
+        json.dump([dataclasses.asdict(r) for r in results], f, indent=2)
+        f.write("\n")
@@ -0,0 +1,204 @@
+"""Which tables a backup takes, with or without their data, and in which order.
+
+Patterns are shell-style globs (``audit_*``, ``session?``) matched against
+table names; a pattern containing a dot is matched against ``schema.table``
+instead, so ``billing.*`` selects the tables of one schema.
+
+``select_tables`` resolves a ``TableFilter`` against the Supabase catalog once
+per backup:
+
+- tables matching ``exclude`` (or, if ``include`` is given, not matching it)
+  are left out of the backup entirely (``pg_dump --exclude-table``);
+- tables matching ``exclude_data`` are backed up without their rows
+  (``pg_dump --exclude-table-data``);
+- the others are copied in this order: tables matching a ``first`` pattern
+  (in pattern order, smallest first), then the unmatched ones (largest
+  first, which keeps a pool of workers busy until the end), then those
+  matching a ``last`` pattern;
+- with a size budget, tables are taken in that order while their total size
+  (``pg_total_relation_size`` on Supabase) fits in it. Tables that do not fit
+  are backed up without their rows, like ``exclude_data`` ones, and reported.
+
+Like pg_dump's ``--table`` and ``--exclude-table``, ``include`` and
+``exclude`` match views too, so a view over an excluded table can be left out
+with it. Tables created on Supabase after the selection was made are judged
+by the patterns alone.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Sequence
+
+from . import db
+from .utils import table_flag
+
+# (schema, table)
+TableName = tuple[str, str]
+
+SIZES_QUERY = """
+    SELECT n.nspname, c.relname, c.relkind, pg_total_relation_size(c.oid)
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = ANY(%s) AND c.relkind IN ('r', 'v', 'm')
+"""
+
+# Copy order groups, see ``TableFilter.rank``.
+GROUP_FIRST, GROUP_DEFAULT, GROUP_LAST = 0, 1, 2
+
+
+def _size(nbytes: float) -> str:
+    if nbytes >= 1024**3:
+        return f"{nbytes / 1024**3:.1f} GiB"
+    return f"{nbytes / 1024**2:.1f} MiB"
+
+
+def _match(patterns: Sequence[str], schema: str, table: str) -> int | None:
+    """Index of the first of ``patterns`` matching the table, if any."""
+    for i, pattern in enumerate(patterns):
+        name = f"{schema}.{table}" if "." in pattern else table
+        if fnmatchcase(name, pattern):
+            return i
+    return None
+
+
+@dataclass
+class TableFilter:
+    include: list[str] = field(default_factory=list)
+    exclude: list[str] = field(default_factory=list)
+    exclude_data: list[str] = field(default_factory=list)
+    first: list[str] = field(default_factory=list)
+    last: list[str] = field(default_factory=list)
+    # Total size of the tables whose rows are copied, in bytes.
+    budget_bytes: int | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.budget_bytes is not None or any(
+            (self.include, self.exclude, self.exclude_data, self.first, self.last)
+        )
+
+    def backs_up(self, schema: str, table: str) -> bool:
+        if self.include and _match(self.include, schema, table) is None:
+            return False
+        return _match(self.exclude, schema, table) is None
+
+    def copies_data(self, schema: str, table: str) -> bool:
+        return (
+            self.backs_up(schema, table)
+            and _match(self.exclude_data, schema, table) is None
+        )
+
+    def rank(self, schema: str, table: str) -> tuple[int, int]:
+        """``(group, pattern index)`` of the table in the copy order."""
+        index = _match(self.first, schema, table)
+        if index is not None:
+            return GROUP_FIRST, index
+        index = _match(self.last, schema, table)
+        if index is not None:
+            return GROUP_LAST, index
+        return GROUP_DEFAULT, 0
+
+
+@dataclass
+class TableSelection:
+    filter: TableFilter
+    sizes: dict[TableName, int]
+    # Tables whose rows are copied, in copy order.
+    order: list[TableName] = field(default_factory=list)
+    # Tables (and views) left out of the backup.
+    excluded: list[TableName] = field(default_factory=list)
+    # Tables backed up without their rows, by pattern or for the budget.
+    data_excluded: list[TableName] = field(default_factory=list)
+    over_budget: list[TableName] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self._position = {name: i for i, name in enumerate(self.order)}
+
+    @property
+    def without_data(self) -> list[TableName]:
+        return self.data_excluded + self.over_budget
+
+    def copies(self, schema: str, table: str) -> bool:
+        """Whether the rows of ``schema.table`` are copied."""
+        if (schema, table) in self.sizes:
+            return (schema, table) in self._position
+        return self.filter.copies_data(schema, table)
+
+    def position(self, schema: str, table: str) -> int:
+        """Sort key putting tables in copy order; unknown tables go last."""
+        return self._position.get((schema, table), len(self.order))
+
+    def dump_flags(self) -> list[str]:
+        """pg_dump options leaving out what the selection does not back up."""
+        return [
+            *(table_flag("--exclude-table", *name) for name in self.excluded),
+            *(table_flag("--exclude-table-data", *name) for name in self.without_data),
+        ]
+
+    def summary(self) -> str:
+        lines = [
+            f"Table filters: {len(self.order)} tables copied, "
+            f"{len(self.excluded)} excluded, "
+            f"{len(self.without_data)} backed up without data."
+        ]
+        if self.over_budget:
+            budget = _size(self.filter.budget_bytes or 0)
+            lines.append(f"  Over the {budget} budget, backed up without data:")
+            lines += [
+                f"    {schema}.{table} ({_size(self.sizes[schema, table])})"
+                for schema, table in self.over_budget
+            ]
+        return "\n".join(lines)
+
+
+def plan_selection(
+    table_filter: TableFilter,
+    sizes: dict[TableName, int],
+    views: Sequence[TableName] = (),
+) -> TableSelection:
+    """Apply ``table_filter`` to the tables of ``sizes`` (bytes per table).
+
+    Of ``views`` (and materialized views), only those excluded matter.
+    """
+    excluded = [name for name in views if not table_filter.backs_up(*name)]
+    data_excluded, candidates = [], []
+    for name in sorted(sizes):
+        if not table_filter.backs_up(*name):
+            excluded.append(name)
+        elif not table_filter.copies_data(*name):
+            data_excluded.append(name)
+        else:
+            candidates.append(name)
+
+    def key(name: TableName) -> tuple:
+        group, index = table_filter.rank(*name)
+        size = sizes[name]
+        return group, index, size if group == GROUP_FIRST else -size, name
+
+    order, over_budget = [], []
+    total = 0
+    budget = table_filter.budget_bytes
+    for name in sorted(candidates, key=key):
+        if budget is not None and total + sizes[name] > budget:
+            over_budget.append(name)
+            continue
+        total += sizes[name]
+        order.append(name)
+    return TableSelection(
+        table_filter, dict(sizes), order, sorted(excluded), data_excluded, over_budget
+    )
+
+
+def select_tables(
+    source_url: str, schemas: Sequence[str], table_filter: TableFilter
+) -> TableSelection:
+    """Resolve ``table_filter`` against the tables of ``schemas`` on Supabase."""
+    with db.connection(source_url) as conn:
+        rows = conn.execute(SIZES_QUERY, (list(schemas),)).fetchall()
+    return plan_selection(
+        table_filter,
+        {(s, t): size for s, t, kind, size in rows if kind == "r"},
+        [(s, t) for s, t, kind, _ in rows if kind != "r"],
+    )
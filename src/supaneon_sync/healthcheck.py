@@ -2,61 +2,248 @@
 
 from __future__ import annotations
 
+import random
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Collection
+
 import psycopg
+from psycopg import sql
 
+from . import db
 
-def run_healthcheck(db_url: str, schema: str = "public") -> None:
-    """Run a set of deterministic, fast, non-destructive checks against a specific schema.
+DEFAULT_WORKERS = 4
 
-    Raises SystemExit on failure.
+
+@dataclass
+class HealthReport:
+    schema: str
+    # Row count per table: exact where listed in ``exact``, else estimated.
+    rows: dict[str, int]
+    exact: set[str] = field(default_factory=set)
+    # Sampled tables whose exact count did not finish within the budget.
+    skipped: list[str] = field(default_factory=list)
+    # Tables backed up without their rows on purpose (see ``filters``).
+    without_data: set[str] = field(default_factory=set)
+
+    @property
+    def total_rows(self) -> int:
+        return sum(self.rows.values())
+
+    @property
+    def empty(self) -> list[str]:
+        """Tables counted exactly as empty that should have had rows."""
+        return sorted(
+            t for t in self.exact if self.rows[t] == 0 and t not in self.without_data
+        )
+
+
+def _list_tables(cur: psycopg.Cursor, schema: str) -> list[str]:
+    cur.execute(
+        "SELECT table_name "
+        "FROM information_schema.tables "
+        "WHERE table_schema = %s AND table_type = 'BASE TABLE' "
+        "ORDER BY table_name",
+        (schema,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def _estimated_rows(cur: psycopg.Cursor, schema: str) -> dict[str, int]:
+    """Row estimates for every table of ``schema`` in one catalog query.
+
+    Tables that were never analyzed (``reltuples = -1``) report 0.
     """
+    cur.execute(
+        """
+        SELECT c.relname, greatest(c.reltuples, 0)::bigint
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'p')
+        ORDER BY c.relname
+        """,
+        (schema,),
+    )
+    return {name: rows for name, rows in cur.fetchall()}
+
+
+def _exact_count(
+    db_url: str, schema: str, table: str, deadline: float | None
+) -> int | None:
+    """``count(*)`` of one table, or None if it would overrun ``deadline``."""
+    with db.connection(db_url) as conn:
+        if deadline is not None:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                return None
+            conn.execute(
+                sql.SQL("SET LOCAL statement_timeout = {}").format(
+                    sql.Literal(remaining_ms)
+                )
+            )
+        try:
+            row = conn.execute(
+                sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(schema, table))
+            ).fetchone()
+        except psycopg.errors.QueryCanceled:
+            return None
+    return row[0] if row else 0
+
+
+def _exact_counts(
+    db_url: str,
+    schema: str,
+    tables: list[str],
+    workers: int,
+    budget: float | None,
+) -> tuple[dict[str, int], list[str]]:
+    """Count ``tables`` concurrently; returns counts and the tables skipped."""
+    deadline = None if budget is None else time.monotonic() + budget
+    db.get_pool(db_url, max_size=workers)
+    counts: dict[str, int] = {}
+    skipped: list[str] = []
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
     try:
-        with psycopg.connect(db_url, autocommit=True) as conn:
-            with conn.cursor() as cur:
-                # Set search_path so we query the backup schema instead of public
-                cur.execute(f'SET search_path TO "{schema}"')
-
-                # Check for table existence
+        futures = {
+            pool.submit(_exact_count, db_url, schema, t, deadline): t for t in tables
+        }
+        done, _ = wait(futures, timeout=budget, return_when=FIRST_EXCEPTION)
+        for fut in done:
+            fut.result()
+    finally:
+        # Counts still queued past the deadline are dropped; running ones are
+        # stopped by their statement_timeout.
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    for fut, table in futures.items():
+        count = None if fut.cancelled() else fut.result()
+        if count is None:
+            skipped.append(table)
+        else:
+            counts[table] = count
+    return counts, sorted(skipped)
+
+
+def _check_exact(db_url: str, schema: str) -> HealthReport:
+    with db.connection(db_url, autocommit=True) as conn:
+        with conn.cursor() as cur:
+            tables = _list_tables(cur, schema)
+            if not tables:
+                raise ValueError(f"No tables found in schema '{schema}'")
+
+            print(f"  Found {len(tables)} tables: {', '.join(tables)}")
+
+            # Check at least one table has rows
+            rows: dict[str, int] = {}
+            for table in tables:
                 cur.execute(
-                    "SELECT table_name "
-                    "FROM information_schema.tables "
-                    "WHERE table_schema = %s",
-                    (schema,),
+                    sql.SQL("SELECT count(*) FROM {}").format(
+                        sql.Identifier(schema, table)
+                    )
                 )
+
                 row = cur.fetchone()
                 if row is None:
                     raise ValueError(
-                        f"COUNT query returned no rows for schema '{schema}'"
+                        f"COUNT query returned no rows for table '{table}'"
                     )
 
-                tables = [row[0] for row in cur.fetchall()]
-
-                if not tables:
-                    raise ValueError(f"No tables found in schema '{schema}'")
-
-                print(f"  Found {len(tables)} tables: {', '.join(tables)}")
-
-                # Check at least one table has rows
-                total_rows = 0
-                for table in tables:
-                    cur.execute(f'SELECT count(*) FROM "{schema}"."{table}"')
-
-                    row = cur.fetchone()
-                    if row is None:
-                        raise ValueError(
-                            f"COUNT query returned no rows for table '{table}'"
-                        )
-
-                    count: int = row[0]
-                    total_rows += count
-
-                    if count > 0:
-                        print(f"  Verified table '{table}' has {count} rows.")
+                count: int = row[0]
+                rows[table] = count
+
+                if count > 0:
+                    print(f"  Verified table '{table}' has {count} rows.")
+
+    return HealthReport(schema, rows, exact=set(rows))
+
+
+def _check_fast(
+    db_url: str,
+    schema: str,
+    sample: int,
+    workers: int,
+    budget: float | None,
+    analyze: bool,
+) -> HealthReport:
+    with db.connection(db_url, autocommit=True) as conn:
+        with conn.cursor() as cur:
+            tables = _list_tables(cur, schema)
+            if not tables:
+                raise ValueError(f"No tables found in schema '{schema}'")
+            print(f"  Found {len(tables)} tables.")
+
+            if analyze:
+                # One statement for the whole schema; ANALYZE reads a fixed
+                # sample of each table rather than scanning it.
+                cur.execute(
+                    sql.SQL("ANALYZE {}").format(
+                        sql.SQL(", ").join(sql.Identifier(schema, t) for t in tables)
+                    )
+                )
+            rows = _estimated_rows(cur, schema)
+
+    report = HealthReport(schema, rows)
+    if sample > 0:
+        # Seeded by the schema name so reruns check the same tables.
+        picked = sorted(random.Random(schema).sample(tables, min(sample, len(tables))))
+        counts, report.skipped = _exact_counts(db_url, schema, picked, workers, budget)
+        for table, count in sorted(counts.items()):
+            print(
+                f"  Verified table '{table}' has {count} rows "
+                f"(estimated {rows.get(table, 0)})."
+            )
+        report.rows.update(counts)
+        report.exact = set(counts)
+        if report.skipped:
+            print(
+                f"  Time budget exhausted; skipped exact counts for "
+                f"{', '.join(report.skipped)}."
+            )
+    return report
+
+
+def run_healthcheck(
+    db_url: str,
+    schema: str = "public",
+    fast: bool = False,
+    sample: int = 0,
+    workers: int = DEFAULT_WORKERS,
+    budget: float | None = None,
+    analyze: bool = True,
+    without_data: Collection[str] = (),
+) -> HealthReport:
+    """Run a set of deterministic, fast, non-destructive checks against a specific schema.
 
-                if total_rows == 0:
-                    raise ValueError(f"All tables in schema '{schema}' are empty")
+    The default mode counts every table exactly. ``fast`` mode reads row
+    estimates for all tables in one catalog query (after ``ANALYZE`` unless
+    ``analyze`` is False) and counts only ``sample`` tables exactly, over
+    ``workers`` connections and within ``budget`` seconds. Tables in
+    ``without_data`` were backed up without rows and are not expected to
+    have any.
 
-                print(f"  Total rows across all tables: {total_rows}")
+    Raises SystemExit on failure.
+    """
+    try:
+        if fast:
+            report = _check_fast(db_url, schema, sample, workers, budget, analyze)
+        else:
+            report = _check_exact(db_url, schema)
+        report.without_data = set(without_data) & set(report.rows)
+
+        if report.without_data:
+            print(
+                "  Backed up without data (table filters): "
+                + ", ".join(sorted(report.without_data))
+            )
+        if report.total_rows == 0 and len(report.without_data) < len(report.rows):
+            raise ValueError(f"All tables in schema '{schema}' are empty")
+        if report.empty:
+            print(f"  Empty tables: {', '.join(report.empty)}")
+
+        kind = "" if len(report.exact) == len(report.rows) else "estimated "
+        print(f"  Total {kind}rows across all tables: {report.total_rows}")
+        return report
 
     except Exception as exc:  # pragma: no cover - integration-only
         raise SystemExit(f"Healthcheck failed for schema '{schema}': {exc}")
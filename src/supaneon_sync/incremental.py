@@ -0,0 +1,202 @@
+"""Incremental backups: clone unchanged tables from the previous backup.
+
+A table's fingerprint combines its cumulative ``pg_stat_user_tables`` write
+counters with its ``relfilenode`` (which changes on TRUNCATE and table
+rewrites). A table whose fingerprint and column layout match the previous
+backup is cloned server-side on Neon instead of being pulled from Supabase,
+provided its rows pass the check below.
+
+The fingerprint alone can miss changes: the counters are flushed to the
+statistics system asynchronously, so a committed write may not be counted
+yet, and ``pg_stat_reset()`` or a crash resets them, after which a changed
+table can show its old fingerprint again. So before a table is cloned its
+rows are checked against the previous backup: none may have an ``xmin``
+newer than the watermark recorded with that backup, and there must be as
+many as it holds. Inserts and updates write rows with a new ``xmin`` and
+deletes alone change the count, so no change slips through. The check scans
+the table on Supabase but transfers nothing.
+
+The watermark is the xmin horizon of a snapshot taken *before* the
+fingerprints, and so before the copy snapshot: any write the copy did not
+see has a newer transaction id. A previous backup without a watermark has
+nothing to check against, and its tables are copied again.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import psycopg
+from psycopg import sql
+
+from . import db
+from .checkpoint import Checkpoint, run_watermark, table_step
+from .manifest import load_manifest
+
+
+@dataclass
+class IncrementalPlan:
+    fingerprints: dict[str, str]
+    previous_schema: str | None = None
+    # See ``xmin_watermark``; recorded with the backup for the next run.
+    watermark: int | None = None
+    unchanged: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> set[str]:
+        return set(self.fingerprints) - set(self.unchanged)
+
+
+def xmin_watermark(source_url: str) -> int:
+    """The oldest transaction id still running on the source, with its epoch."""
+    with db.connection(source_url) as conn:
+        row = conn.execute(
+            "SELECT txid_snapshot_xmin(txid_current_snapshot())"
+        ).fetchone()
+    assert row is not None
+    return int(row[0])
+
+
+def table_fingerprints(source_url: str, schema: str = "public") -> dict[str, str]:
+    with db.connection(source_url) as conn:
+        rows = conn.execute(
+            """
+            SELECT c.relname,
+                   coalesce(s.n_tup_ins, 0),
+                   coalesce(s.n_tup_upd, 0),
+                   coalesce(s.n_tup_del, 0),
+                   c.relfilenode
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE n.nspname = %s AND c.relkind = 'r'
+            """,
+            (schema,),
+        ).fetchall()
+    return {r[0]: f"{r[1]}:{r[2]}:{r[3]}:{r[4]}" for r in rows}
+
+
+def _column_layout(conn: psycopg.Connection, schema: str) -> dict[str, list[tuple]]:
+    rows = conn.execute(
+        """
+        SELECT table_name, column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = %s AND is_generated = 'NEVER'
+        ORDER BY table_name, ordinal_position
+        """,
+        (schema,),
+    ).fetchall()
+    layout: dict[str, list[tuple]] = {}
+    for table, column, data_type in rows:
+        layout.setdefault(table, []).append((column, data_type))
+    return layout
+
+
+def _rows_unchanged(
+    conn: psycopg.Connection, schema: str, table: str, watermark: int, rows: int
+) -> bool:
+    """Whether ``table`` still holds ``rows`` rows, none newer than ``watermark``."""
+    # Row xmins are 32-bit and compared modulo 2^32 through age(); a
+    # watermark too old for that (negative age) proves nothing.
+    xid = str(watermark % 2**32)
+    row = conn.execute(
+        sql.SQL(
+            "SELECT age(%s::text::xid), count(*),"
+            " coalesce(bool_or(age(xmin) <= age(%s::text::xid)), false)"
+            " FROM {}"
+        ).format(sql.Identifier(schema, table)),
+        (xid, xid),
+    ).fetchone()
+    assert row is not None
+    horizon_age, count, newer = row
+    return horizon_age >= 0 and count == rows and not newer
+
+
+def plan_incremental(
+    source_url: str,
+    neon_url: str,
+    new_schema: str,
+    previous_schema: str | None,
+    source_schema: str = "public",
+) -> IncrementalPlan:
+    """Decide which tables can be cloned from ``previous_schema``."""
+    watermark = xmin_watermark(source_url)
+    plan = IncrementalPlan(
+        fingerprints=table_fingerprints(source_url, source_schema),
+        previous_schema=previous_schema,
+        watermark=watermark,
+    )
+    if previous_schema is None:
+        return plan
+
+    manifest = load_manifest(neon_url, previous_schema)
+    previous_watermark = run_watermark(neon_url, previous_schema)
+    if not manifest or previous_watermark is None:
+        return plan
+
+    with db.connection(neon_url) as conn:
+        old_layout = _column_layout(conn, previous_schema)
+        new_layout = _column_layout(conn, new_schema)
+
+    # Unchanged by their fingerprint and layout, with their backed-up rows.
+    candidates: list[tuple[str, int | None]] = []
+    for table, fingerprint in sorted(plan.fingerprints.items()):
+        entry = manifest.get(table)
+        if entry is None or entry.fingerprint != fingerprint:
+            continue
+        # An ALTER TABLE without a rewrite keeps the counters and relfilenode,
+        # so the column layout has to match too.
+        if table not in new_layout or old_layout.get(table) != new_layout[table]:
+            continue
+        candidates.append((table, entry.rows))
+
+    with db.connection(source_url) as conn:
+        for table, rows in candidates:
+            if rows is not None and _rows_unchanged(
+                conn, source_schema, table, previous_watermark, rows
+            ):
+                plan.unchanged.append(table)
+
+    return plan
+
+
+def clone_table(
+    conn: psycopg.Connection,
+    table: str,
+    columns: list[str],
+    previous_schema: str,
+    new_schema: str,
+) -> int:
+    """Copy ``table`` between two schemas of the same Neon database."""
+    cols = sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+    cur = conn.execute(
+        sql.SQL("INSERT INTO {} ({}) OVERRIDING SYSTEM VALUE SELECT {} FROM {}").format(
+            sql.Identifier(new_schema, table),
+            cols,
+            cols,
+            sql.Identifier(previous_schema, table),
+        )
+    )
+    return cur.rowcount
+
+
+def clone_tables(
+    neon_url: str,
+    tables: list[str],
+    previous_schema: str,
+    new_schema: str,
+    checkpoint: Checkpoint | None = None,
+) -> dict[str, int]:
+    rows: dict[str, int] = {}
+    with db.connection(neon_url) as conn:
+        layout = _column_layout(conn, new_schema)
+        for table in tables:
+            if checkpoint is not None and checkpoint.done(table_step(table)):
+                continue
+            columns = [c for c, _ in layout[table]]
+            rows[table] = clone_table(conn, table, columns, previous_schema, new_schema)
+            if checkpoint is not None:
+                checkpoint.mark(conn, table_step(table), rows[table])
+            conn.commit()
+            print(f"  Cloned {table} from {previous_schema}: {rows[table]} rows")
+    return rows
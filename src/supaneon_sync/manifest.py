@@ -0,0 +1,129 @@
+"""Backup bookkeeping tables kept on Neon.
+
+Everything lives in the ``supaneon_sync`` schema, which does not match the
+``backup_%`` pattern used for backup schemas and is therefore never rotated.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import psycopg
+
+from . import db
+
+META_SCHEMA = "supaneon_sync"
+
+ACTION_COPIED = "copied"
+ACTION_CLONED = "cloned"
+# Left out of the backup by its table filters (see ``filters``).
+ACTION_EXCLUDED = "excluded"
+# Backed up without its rows, by pattern or for the size budget.
+ACTION_SKIPPED = "skipped"
+
+
+@dataclass
+class ManifestEntry:
+    table_name: str
+    action: str
+    # Where the data came from: the Supabase schema for copies, or the
+    # previous backup schema for server-side clones.
+    source: str
+    fingerprint: str | None = None
+    rows: int | None = None
+
+
+def ensure_manifest(conn: psycopg.Connection) -> None:
+    conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{META_SCHEMA}"')
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{META_SCHEMA}".backup_manifest (
+            backup_schema text NOT NULL,
+            table_name text NOT NULL,
+            action text NOT NULL,
+            source text NOT NULL,
+            fingerprint text,
+            rows bigint,
+            recorded_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (backup_schema, table_name)
+        )
+    """)
+
+
+def record_manifest(
+    conn_url: str, backup_schema: str, entries: list[ManifestEntry]
+) -> None:
+    with db.connection(conn_url) as conn:
+        ensure_manifest(conn)
+        with conn.cursor() as cur:
+            cur.executemany(
+                f"""
+                INSERT INTO "{META_SCHEMA}".backup_manifest
+                    (backup_schema, table_name, action, source, fingerprint, rows)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (backup_schema, table_name) DO UPDATE SET
+                    action = EXCLUDED.action,
+                    source = EXCLUDED.source,
+                    fingerprint = EXCLUDED.fingerprint,
+                    rows = EXCLUDED.rows,
+                    recorded_at = now()
+                """,
+                [
+                    (
+                        backup_schema,
+                        e.table_name,
+                        e.action,
+                        e.source,
+                        e.fingerprint,
+                        e.rows,
+                    )
+                    for e in entries
+                ],
+            )
+
+
+def load_manifest(conn_url: str, backup_schema: str) -> dict[str, ManifestEntry]:
+    """Return the manifest of ``backup_schema`` keyed by table name.
+
+    Backups taken before the manifest existed simply yield an empty dict.
+    """
+    with db.connection(conn_url) as conn:
+        row = conn.execute(
+            "SELECT to_regclass(%s)", (f'"{META_SCHEMA}".backup_manifest',)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return {}
+        rows = conn.execute(
+            f"""
+            SELECT table_name, action, source, fingerprint, rows
+            FROM "{META_SCHEMA}".backup_manifest
+            WHERE backup_schema = %s
+            """,
+            (backup_schema,),
+        ).fetchall()
+    return {r[0]: ManifestEntry(*r) for r in rows}
+
+
+def forget_manifest(conn_url: str, backup_schemas: list[str]) -> None:
+    """Delete the manifests of ``backup_schemas``, e.g. once they are dropped."""
+    with db.connection(conn_url) as conn:
+        row = conn.execute(
+            "SELECT to_regclass(%s)", (f'"{META_SCHEMA}".backup_manifest',)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return
+        conn.execute(
+            f"""
+            DELETE FROM "{META_SCHEMA}".backup_manifest
+            WHERE backup_schema = ANY(%s)
+            """,
+            (backup_schemas,),
+        )
+
+
+def filtered_tables(conn_url: str, backup_schema: str) -> dict[str, str]:
+    """Tables of ``backup_schema`` excluded or skipped by filters, by action."""
+    return {
+        name: entry.action
+        for name, entry in load_manifest(conn_url, backup_schema).items()
+        if entry.action in (ACTION_EXCLUDED, ACTION_SKIPPED)
+    }
@@ -0,0 +1,246 @@
+"""Per-phase instrumentation of a backup run.
+
+Every phase (dump, remap, restore, copy, ...) records its wall time, the bytes
+it read and wrote, the rows it moved and the peak RSS seen so far. Each phase
+is logged as one JSON object through ``safe_log`` when it ends, optionally
+appended to a JSON-lines file, and the whole run can be written as a
+Prometheus textfile (for node_exporter's textfile collector).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from .utils import redact, safe_log
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore[assignment]
+
+PROMETHEUS_PREFIX = "supaneon_backup"
+
+T = TypeVar("T")
+
+
+def _maxrss_bytes(who: int) -> int | None:
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def peak_rss() -> tuple[int | None, int | None]:
+    """Peak RSS of this process and of its largest waited-for child."""
+    if resource is None:
+        return None, None
+    return (
+        _maxrss_bytes(resource.RUSAGE_SELF),
+        _maxrss_bytes(resource.RUSAGE_CHILDREN),
+    )
+
+
+@dataclass
+class PhaseMetrics:
+    phase: str
+    seconds: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    rows: int = 0
+    peak_rss_bytes: int | None = None
+    children_peak_rss_bytes: int | None = None
+    ok: bool = True
+    # Seconds spent waiting on the "source" or on the "target" of a copy.
+    stall_seconds: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second, counting whichever direction moved more."""
+        moved = max(self.bytes_in, self.bytes_out)
+        return moved / self.seconds if self.seconds > 0 else 0.0
+
+
+def _label(name: str, value: str) -> str:
+    """``name="value"`` with ``value`` escaped for the Prometheus text format."""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{name}="{escaped}"'
+
+
+def count_bytes(
+    lines: Iterable[bytes], phase: PhaseMetrics, direction: str = "in"
+) -> Iterator[bytes]:
+    """Generator stage adding the size of the lines to ``phase.bytes_<direction>``.
+
+    The total is kept in a local and added once the stream ends, to keep the
+    per-line cost down.
+    """
+    total = 0
+    try:
+        for line in lines:
+            total += len(line)
+            yield line
+    finally:
+        if direction == "in":
+            phase.bytes_in += total
+        else:
+            phase.bytes_out += total
+
+
+def file_size(path: str) -> int:
+    """Size of a file, or the total size of the files under a directory."""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class RunMetrics:
+    """Collects the phases of one backup run; safe to use from several threads."""
+
+    def __init__(self, mode: str, schema: str, jsonl_path: str | None = None):
+        self.mode = mode
+        self.schema = schema
+        self.jsonl_path = jsonl_path
+        self.phases: list[PhaseMetrics] = []
+        self.started = time.time()
+        self.seconds = 0.0
+        self.ok = False
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[PhaseMetrics]:
+        """Time the enclosed block; the yielded object takes bytes and rows."""
+        metrics = PhaseMetrics(name)
+        t0 = time.perf_counter()
+        try:
+            yield metrics
+        except BaseException:
+            metrics.ok = False
+            raise
+        finally:
+            metrics.seconds = time.perf_counter() - t0
+            metrics.peak_rss_bytes, metrics.children_peak_rss_bytes = peak_rss()
+            with self._lock:
+                self.phases.append(metrics)
+            self._emit({"event": "phase", **self._phase_record(metrics)})
+
+    def timed(self, name: str, fn: Callable[..., T], *args: Any) -> T:
+        """Call ``fn(*args)`` as phase ``name``, e.g. from a worker thread."""
+        with self.phase(name):
+            return fn(*args)
+
+    def finish(self, ok: bool) -> None:
+        self.ok = ok
+        self.seconds = time.perf_counter() - self._t0
+        self_rss, children_rss = peak_rss()
+        self._emit(
+            {
+                "event": "run",
+                "mode": self.mode,
+                "schema": self.schema,
+                "ok": ok,
+                "seconds": round(self.seconds, 3),
+                "bytes_in": sum(p.bytes_in for p in self.phases),
+                "bytes_out": sum(p.bytes_out for p in self.phases),
+                "rows": sum(p.rows for p in self.phases),
+                "peak_rss_bytes": self_rss,
+                "children_peak_rss_bytes": children_rss,
+            }
+        )
+
+    def _phase_record(self, metrics: PhaseMetrics) -> dict:
+        record = asdict(metrics)
+        record["seconds"] = round(metrics.seconds, 3)
+        record["stall_seconds"] = {
+            side: round(v, 3) for side, v in metrics.stall_seconds.items()
+        }
+        record["throughput_bytes_per_second"] = round(metrics.throughput)
+        return {"mode": self.mode, "schema": self.schema, **record}
+
+    def _emit(self, record: dict) -> None:
+        line = json.dumps(record, sort_keys=True)
+        safe_log(line)
+        if self.jsonl_path:
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(redact(line) + "\n")
+
+    def prometheus_text(self) -> str:
+        labels = _label("mode", self.mode)
+        out: list[str] = []
+
+        def gauge(name: str, help_text: str, samples: list[tuple[str, float]]):
+            out.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            out.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+            for extra, value in samples:
+                sep = "," if extra else ""
+                out.append(
+                    f"{PROMETHEUS_PREFIX}_{name}{{{labels}{sep}{extra}}} {value}"
+                )
+
+        with self._lock:
+            phases = list(self.phases)
+
+        def per_phase(attr: str) -> list[tuple[str, float]]:
+            return [(_label("phase", p.phase), getattr(p, attr)) for p in phases]
+
+        gauge("success", "1 if the last backup succeeded.", [("", int(self.ok))])
+        gauge(
+            "last_run_timestamp_seconds",
+            "Start time of the last backup.",
+            [("", round(self.started, 3))],
+        )
+        gauge(
+            "duration_seconds",
+            "Wall time of the last backup.",
+            [("", round(self.seconds, 3))],
+        )
+        gauge(
+            "phase_seconds",
+            "Wall time of each phase.",
+            [(lbl, round(v, 3)) for lbl, v in per_phase("seconds")],
+        )
+        gauge("phase_bytes_in", "Bytes read by each phase.", per_phase("bytes_in"))
+        gauge("phase_bytes_out", "Bytes written by each phase.", per_phase("bytes_out"))
+        gauge("phase_rows", "Rows moved by each phase.", per_phase("rows"))
+        gauge(
+            "phase_stall_seconds",
+            "Time each phase waited on the source or the target of a copy.",
+            [
+                (f'{_label("phase", p.phase)},{_label("side", side)}', round(v, 3))
+                for p in phases
+                for side, v in p.stall_seconds.items()
+            ],
+        )
+        self_rss, children_rss = peak_rss()
+        gauge(
+            "peak_rss_bytes",
+            "Peak resident set size.",
+            [
+                (_label("process", proc), rss)
+                for proc, rss in (("self", self_rss), ("children", children_rss))
+                if rss is not None
+            ],
+        )
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the textfile atomically so a scrape never sees half of it."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
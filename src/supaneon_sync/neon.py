@@ -3,17 +3,36 @@
 This module provides a small wrapper to manage Neon branches. Implementations
 should be tested with mocks; network calls are explicit and authorized by
 `NEON_API_KEY`.
+
+Branch lists are read page by page (cursor pagination). Branch and endpoint
+metadata is cached in memory for ``cache_ttl`` seconds, and creating or
+deleting a branch drops what it makes stale. Calls that change a branch wait
+for the operations Neon starts for them, polling with exponential backoff.
 """
 
 from __future__ import annotations
 
 import datetime
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from requests.adapters import HTTPAdapter
+from typing import Any, Iterable
 from urllib3.util import Retry
 
-NEON_API_BASE = "https://api.neon.tech"  # placeholder; adjust if needed
+NEON_API_BASE = "https://console.neon.tech/api/v2"
+
+# Branches requested per page when listing.
+PAGE_LIMIT = 100
+# Seconds branch and endpoint metadata is reused for.
+DEFAULT_CACHE_TTL = 30.0
+# Concurrent requests when resolving the hosts of many branches.
+DEFAULT_LOOKUP_WORKERS = 8
+
+OPERATION_FINISHED = "finished"
+OPERATION_FAILED = frozenset({"failed", "error", "cancelled"})
 
 
 @dataclass
@@ -25,10 +44,50 @@ class NeonBranch:
     host: str | None = None
 
 
+def _parse_time(value: str | None) -> datetime.datetime:
+    # Ensure we have a valid datetime
+    if not value:
+        return datetime.datetime.now(datetime.UTC)
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _branch(data: dict[str, Any], host: str | None = None) -> NeonBranch:
+    return NeonBranch(
+        id=data["id"],
+        name=data["name"],
+        created_at=_parse_time(data.get("created_at")),
+        host=host,
+    )
+
+
+def _endpoint_host(endpoints: list[dict[str, Any]]) -> str | None:
+    for ep in endpoints:
+        if ep.get("type") == "read_write":
+            return ep.get("host")
+    if endpoints:
+        return endpoints[0].get("host")
+    return None
+
+
 class NeonClient:
-    def __init__(self, api_key: str, project_id: str):
+    def __init__(
+        self,
+        api_key: str,
+        project_id: str,
+        base_url: str = NEON_API_BASE,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+    ):
         self.api_key = api_key
         self.project_id = project_id
+        self.base_url = base_url.rstrip("/")
+        self.cache_ttl = cache_ttl
+        # Operation polling: first delay, cap on the delay, and give-up time.
+        self.poll_interval = 0.5
+        self.max_poll_interval = 10.0
+        self.operation_timeout = 600.0
+
+        self._cache: dict[tuple[str, ...], tuple[float, Any]] = {}
+        self._cache_lock = threading.Lock()
 
         # Configure retry strategy
         retry_strategy = Retry(
@@ -38,7 +97,9 @@ class NeonClient:
             allowed_methods=["HEAD", "GET", "OPTIONS", "POST", "DELETE"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy, pool_maxsize=DEFAULT_LOOKUP_WORKERS
+        )
 
         self.session = requests.Session()
         self.session.mount("https://", adapter)
@@ -52,7 +113,7 @@ class NeonClient:
         )
 
     def _url(self, path: str) -> str:
-        return f"{NEON_API_BASE}{path}"
+        return f"{self.base_url}{path}"
 
     def _request(self, method: str, path: str, **kwargs) -> requests.Response:
         url = self._url(path)
@@ -63,7 +124,7 @@ class NeonClient:
         except requests.exceptions.ConnectionError as e:
             # Provide a more helpful message for DNS/network issues
             raise SystemExit(
-                f"ERROR: Could not connect to Neon API at {NEON_API_BASE}.\n"
+                f"ERROR: Could not connect to Neon API at {self.base_url}.\n"
                 f"Details: {e}\n"
                 "Please check your internet connection and DNS settings."
             ) from e
@@ -72,64 +133,138 @@ class NeonClient:
             err_msg = f"HTTP Error {e.response.status_code}: {e.response.text}"
             raise SystemExit(f"ERROR: Neon API request failed: {err_msg}") from e
 
+    # -----------------------------------------------------------------
+    # Cache
+    # -----------------------------------------------------------------
+
+    def _cached(self, key: tuple[str, ...]) -> Any | None:
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is None or hit[0] <= time.monotonic():
+                return None
+            return hit[1]
+
+    def _store(self, key: tuple[str, ...], value: Any) -> Any:
+        if self.cache_ttl > 0:
+            with self._cache_lock:
+                self._cache[key] = (time.monotonic() + self.cache_ttl, value)
+        return value
+
+    def invalidate(self, branch_id: str | None = None) -> None:
+        """Forget the cached branch list, and ``branch_id``'s endpoints."""
+        with self._cache_lock:
+            self._cache.pop(("branches",), None)
+            if branch_id is not None:
+                self._cache.pop(("endpoints", branch_id), None)
+
+    # -----------------------------------------------------------------
+    # Operations
+    # -----------------------------------------------------------------
+
+    def wait_for_operations(self, operations: Iterable[dict[str, Any]]) -> None:
+        """Block until every operation Neon started has finished.
+
+        Polls with exponential backoff from ``poll_interval`` up to
+        ``max_poll_interval``. Raises RuntimeError if one fails and
+        TimeoutError after ``operation_timeout`` seconds.
+        """
+        pending = [
+            op["id"] for op in operations if op.get("status") != OPERATION_FINISHED
+        ]
+        deadline = time.monotonic() + self.operation_timeout
+        delay = self.poll_interval
+        while pending:
+            still_running = []
+            for op_id in pending:
+                path = f"/projects/{self.project_id}/operations/{op_id}"
+                op = self._request("GET", path).json().get("operation", {})
+                status = op.get("status")
+                if status in OPERATION_FAILED:
+                    raise RuntimeError(
+                        f"Neon operation {op_id} ({op.get('action')}) {status}: "
+                        f"{op.get('error', 'no details')}"
+                    )
+                if status != OPERATION_FINISHED:
+                    still_running.append(op_id)
+            pending = still_running
+            if not pending:
+                break
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(
+                    f"Neon operations still running after "
+                    f"{self.operation_timeout:.0f}s: {', '.join(pending)}"
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    # -----------------------------------------------------------------
+    # Branches
+    # -----------------------------------------------------------------
+
     def create_branch(
-        self, branch_name: str, parent_id: str | None = None
+        self, branch_name: str, parent_id: str | None = None, wait: bool = True
     ) -> NeonBranch:
-        """Create a Neon branch. Returns NeonBranch dataclass on success."""
-        # Example POST: /v1/projects/{project}/branches
-        path = f"/v1/projects/{self.project_id}/branches"
-        payload = {"name": branch_name}
+        """Create a Neon branch. Returns NeonBranch dataclass on success.
+
+        With ``wait`` the call returns once Neon has finished creating it.
+        """
+        # No endpoint is requested: a backup branch needs no compute until
+        # someone connects to it.
+        path = f"/projects/{self.project_id}/branches"
+        branch = {"name": branch_name}
         if parent_id:
-            payload["parent_id"] = parent_id
+            branch["parent_id"] = parent_id
 
-        resp = self._request("POST", path, json=payload)
+        resp = self._request("POST", path, json={"branch": branch})
         data = resp.json()
 
-        # Depending on API response, we might get the endpoint host here or need a separate call.
-        # Usually 'branch' object contains 'endpoints'.
-        # Let's try to extract it if present.
         branch_data = data.get("branch", data)  # Some APIs wrap in 'branch'
+        self.invalidate()
+        if wait:
+            self.wait_for_operations(data.get("operations", []))
 
-        branch_id = branch_data.get("id")
-        created_at_str = branch_data.get("created_at")
-
-        # Ensure we have a valid datetime
-        created_at = (
-            datetime.datetime.fromisoformat(created_at_str.replace("Z", "+00:00"))
-            if created_at_str
-            else datetime.datetime.utcnow()
+        created = _branch(
+            {"name": branch_name, **branch_data},
+            host=_endpoint_host(data.get("endpoints", [])),
         )
+        if created.host is not None:
+            self._store(("endpoints", created.id), created.host)
+        return created
 
-        return NeonBranch(
-            id=branch_id,
-            name=branch_data.get("name", branch_name),
-            created_at=created_at,
-            host=None,
-        )
+    def delete_branch(self, branch_id: str, wait: bool = True) -> None:
+        """Delete a branch by its ID.
 
-    def delete_branch(self, branch_id: str) -> None:
-        """Delete a branch by its ID."""
-        path = f"/v1/projects/{self.project_id}/branches/{branch_id}"
-        self._request("DELETE", path)
+        With ``wait`` the call returns once Neon has finished deleting it;
+        Neon refuses other changes to the project until then.
+        """
+        path = f"/projects/{self.project_id}/branches/{branch_id}"
+        data = self._request("DELETE", path).json()
+        self.invalidate(branch_id)
+        if wait:
+            self.wait_for_operations(data.get("operations", []))
 
-    def list_branches(self) -> list[NeonBranch]:
-        path = f"/v1/projects/{self.project_id}/branches"
-        resp = self._request("GET", path)
-        data = resp.json()
+    def list_branches(self, refresh: bool = False) -> list[NeonBranch]:
+        """All branches of the project, following every page of results."""
+        if not refresh:
+            cached = self._cached(("branches",))
+            if cached is not None:
+                return list(cached)
 
-        results = []
-        for b in data.get("branches", []):
-            results.append(
-                NeonBranch(
-                    id=b.get("id"),
-                    name=b.get("name"),
-                    created_at=datetime.datetime.fromisoformat(
-                        b.get("created_at").replace("Z", "+00:00")
-                    ),
-                    host=None,
-                )
-            )
-        return results
+        path = f"/projects/{self.project_id}/branches"
+        results: list[NeonBranch] = []
+        cursor: str | None = None
+        while True:
+            params: dict[str, Any] = {"limit": PAGE_LIMIT}
+            if cursor:
+                params["cursor"] = cursor
+            data = self._request("GET", path, params=params).json()
+            page = data.get("branches", [])
+            results.extend(_branch(b) for b in page)
+            cursor = (data.get("pagination") or {}).get("next")
+            # The last page may still carry a cursor; an empty page ends it.
+            if not cursor or not page:
+                break
+        return list(self._store(("branches",), results))
 
     def latest_backup_branch(
         self,
@@ -143,16 +278,31 @@ class NeonClient:
 
     def get_branch_host(self, branch_id: str) -> str:
         """Fetch the read-write endpoint host for a branch."""
-        path = f"/v1/projects/{self.project_id}/branches/{branch_id}/endpoints"
+        cached = self._cached(("endpoints", branch_id))
+        if cached is not None:
+            return cached
+
+        path = f"/projects/{self.project_id}/branches/{branch_id}/endpoints"
         resp = self._request("GET", path)
-        data = resp.json()
+        host = _endpoint_host(resp.json().get("endpoints", []))
+        if host is None:
+            raise RuntimeError(f"No endpoints found for branch {branch_id}")
+        return self._store(("endpoints", branch_id), host)
+
+    def get_branch_hosts(
+        self, branch_ids: Iterable[str], workers: int = DEFAULT_LOOKUP_WORKERS
+    ) -> dict[str, str | None]:
+        """Endpoint hosts of many branches, looked up concurrently.
 
-        endpoints = data.get("endpoints", [])
-        for ep in endpoints:
-            if ep.get("type") == "read_write":
-                return ep.get("host")
+        Branches without an endpoint map to None.
+        """
+        ids = list(dict.fromkeys(branch_ids))
 
-        if endpoints:
-            return endpoints[0].get("host")
+        def lookup(branch_id: str) -> str | None:
+            try:
+                return self.get_branch_host(branch_id)
+            except RuntimeError:
+                return None
 
-        raise RuntimeError(f"No endpoints found for branch {branch_id}")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(ids) or 1))) as ex:
+            return dict(zip(ids, ex.map(lookup, ids)))
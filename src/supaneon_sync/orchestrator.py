@@ -0,0 +1,346 @@
+"""Asyncio orchestration of a backup as a DAG of tasks.
+
+``Dag`` starts every task as soon as the tasks it depends on have finished,
+running at most ``limit`` bounded tasks at a time. The first task to fail
+cancels all the others (``asyncio.TaskGroup``), and its exception is raised
+unchanged, as a blocking mode would raise it.
+
+The I/O helpers are the asyncio counterparts of the blocking ones the other
+modes use:
+- ``pg_dump`` and ``psql`` run through ``asyncio.create_subprocess_exec``;
+- Supabase and Neon are reached with psycopg's ``AsyncConnection``, taken
+  from per-URL ``AsyncConnectionPool``s that live as long as one run.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import subprocess
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Sequence
+
+import psycopg
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+
+from .checkpoint import Checkpoint, post_data_step
+from .copier import (
+    SEQUENCES_QUERY,
+    TABLES_QUERY,
+    TableCopyResult,
+    backed_up_sequences,
+)
+from .db import CONNECT_TIMEOUT
+from .filters import TableSelection
+from .postdata import DEADLOCK_RETRIES, PostDataEntry, entry_error, parse_post_data
+
+
+@dataclass
+class _Node:
+    fn: Callable[[], Awaitable[Any]]
+    after: tuple[str, ...]
+    bounded: bool
+
+
+def _first_error(group: BaseExceptionGroup) -> BaseException:
+    first = group.exceptions[0]
+    return _first_error(first) if isinstance(first, BaseExceptionGroup) else first
+
+
+class Dag:
+    """Named async tasks with dependencies, run with bounded concurrency."""
+
+    def __init__(self) -> None:
+        self._nodes: dict[str, _Node] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        after: Iterable[str] = (),
+        bounded: bool = True,
+    ) -> str:
+        """Add task ``name`` running ``fn()`` once every task in ``after`` is done.
+
+        Dependencies must be added first, which keeps the graph acyclic.
+        Unbounded tasks do not take a slot: use them for tasks that only wait,
+        or that limit their own concurrency.
+        """
+        if name in self._nodes:
+            raise ValueError(f"Duplicate task '{name}'")
+        after = tuple(after)
+        unknown = [dep for dep in after if dep not in self._nodes]
+        if unknown:
+            raise ValueError(f"Task '{name}' depends on unknown {', '.join(unknown)}")
+        self._nodes[name] = _Node(fn, after, bounded)
+        return name
+
+    async def run(self, limit: int) -> dict[str, Any]:
+        """Run every task; returns each task's result by name."""
+        slots = asyncio.Semaphore(max(1, limit))
+        tasks: dict[str, asyncio.Task[Any]] = {}
+
+        async def run_node(node: _Node) -> Any:
+            for dep in node.after:
+                await tasks[dep]
+            if not node.bounded:
+                return await node.fn()
+            async with slots:
+                return await node.fn()
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for name, node in self._nodes.items():
+                    tasks[name] = group.create_task(run_node(node), name=name)
+        except BaseExceptionGroup as failed:
+            raise _first_error(failed) from None
+        return {name: task.result() for name, task in tasks.items()}
+
+
+# ---------------------------------------------------------------------
+# Subprocesses
+# ---------------------------------------------------------------------
+
+
+async def _communicate(
+    cmd: list[str], data: bytes | None = None, capture: bool = False
+) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.PIPE if data is not None else None,
+        stdout=subprocess.PIPE if capture else None,
+    )
+    try:
+        out, _ = await proc.communicate(data)
+    finally:
+        # Cancelled by a failing sibling task.
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode or -1, cmd[0])
+    return out or b""
+
+
+async def read_command(cmd: list[str]) -> bytes:
+    """Run ``cmd`` and return its stdout."""
+    return await _communicate(cmd, capture=True)
+
+
+async def feed_command(cmd: list[str], data: bytes) -> None:
+    """Run ``cmd`` with ``data`` on its stdin."""
+    await _communicate(cmd, data)
+
+
+# ---------------------------------------------------------------------
+# Connections
+# ---------------------------------------------------------------------
+
+
+async def _reset(conn: psycopg.AsyncConnection) -> None:
+    await conn.set_autocommit(False)
+    await conn.set_isolation_level(None)
+    await conn.set_read_only(None)
+
+
+class AsyncPools:
+    """One ``AsyncConnectionPool`` per URL, closed when the block exits."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._pools: dict[str, AsyncConnectionPool] = {}
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> AsyncPools:
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        for pool in self._pools.values():
+            await pool.close()
+        self._pools.clear()
+
+    async def _pool(self, url: str) -> AsyncConnectionPool:
+        async with self._lock:
+            pool = self._pools.get(url)
+            if pool is None:
+                pool = AsyncConnectionPool(
+                    url,
+                    min_size=1,
+                    max_size=self.max_size,
+                    open=False,
+                    reset=_reset,
+                    timeout=CONNECT_TIMEOUT,
+                )
+                await pool.open(wait=False)
+                self._pools[url] = pool
+            return pool
+
+    @asynccontextmanager
+    async def connection(
+        self, url: str, autocommit: bool = False
+    ) -> AsyncIterator[psycopg.AsyncConnection]:
+        """Borrow a connection; committed on success, rolled back on error."""
+        async with (await self._pool(url)).connection() as conn:
+            if autocommit:
+                await conn.set_autocommit(True)
+            yield conn
+
+
+async def _begin_snapshot(conn: psycopg.AsyncConnection, snapshot: str | None) -> None:
+    await conn.set_isolation_level(psycopg.IsolationLevel.REPEATABLE_READ)
+    await conn.set_read_only(True)
+    if snapshot:
+        await conn.execute(
+            sql.SQL("SET TRANSACTION SNAPSHOT {}").format(sql.Literal(snapshot))
+        )
+
+
+@asynccontextmanager
+async def exported_snapshot(
+    pools: AsyncPools, source_url: str, source_schemas: Sequence[str] = ("public",)
+) -> AsyncIterator[tuple[str | None, list[tuple[str, str]]]]:
+    """Export a snapshot of Supabase and list the tables it sees.
+
+    Tables are listed as ``(schema, table)``, for every schema in
+    ``source_schemas``. The snapshot stays usable (by copies and by
+    ``pg_dump --snapshot``) until the block exits.
+    """
+    async with pools.connection(source_url) as coord:
+        await _begin_snapshot(coord, None)
+        tables = []
+        for schema in source_schemas:
+            cur = await coord.execute(TABLES_QUERY, (schema,))
+            tables += [(schema, row[0]) for row in await cur.fetchall()]
+        cur = await coord.execute("SELECT pg_export_snapshot()")
+        row = await cur.fetchone()
+        yield (row[0] if row else None), tables
+
+
+# ---------------------------------------------------------------------
+# Data
+# ---------------------------------------------------------------------
+
+
+async def copy_table(
+    pools: AsyncPools,
+    source_url: str,
+    target_url: str,
+    table: str,
+    target_schema: str,
+    snapshot: str | None,
+    checkpoint: Checkpoint | None = None,
+    source_schema: str = "public",
+) -> TableCopyResult:
+    """Stream one table into ``target_schema``; see ``copier.copy_table``."""
+    copy_out = sql.SQL("COPY {} TO STDOUT").format(sql.Identifier(source_schema, table))
+    copy_in = sql.SQL("COPY {} FROM STDIN").format(sql.Identifier(target_schema, table))
+
+    nbytes = 0
+    async with (
+        pools.connection(source_url) as src,
+        pools.connection(target_url) as dst,
+    ):
+        await _begin_snapshot(src, snapshot)
+        async with src.cursor() as scur, dst.cursor() as dcur:
+            async with scur.copy(copy_out) as cin, dcur.copy(copy_in) as cout:
+                async for data in cin:
+                    await cout.write(data)
+                    nbytes += len(data)
+            rows = dcur.rowcount
+        if checkpoint is not None:
+            await checkpoint.amark(
+                dst, checkpoint.table_step(table, target_schema), rows
+            )
+
+    return TableCopyResult(table=table, rows=rows, bytes=nbytes)
+
+
+async def copy_sequences(
+    pools: AsyncPools,
+    source_url: str,
+    target_url: str,
+    target_schema: str,
+    source_schema: str = "public",
+    selection: TableSelection | None = None,
+) -> int:
+    """Carry sequence positions over; see ``copier.copy_sequences``."""
+    async with pools.connection(source_url) as src:
+        cur = await src.execute(SEQUENCES_QUERY, (source_schema,))
+        rows = backed_up_sequences(await cur.fetchall(), selection)
+    if not rows:
+        return 0
+    async with pools.connection(target_url) as dst:
+        for name, last_value in rows:
+            await dst.execute(
+                "SELECT pg_catalog.setval(%s::regclass, %s, true)",
+                (sql.Identifier(target_schema, name).as_string(dst), last_value),
+            )
+    return len(rows)
+
+
+# ---------------------------------------------------------------------
+# Post-data
+# ---------------------------------------------------------------------
+
+
+async def _apply_entry(
+    pools: AsyncPools,
+    neon_url: str,
+    prelude: bytes,
+    entry: PostDataEntry,
+    checkpoint: Checkpoint | None,
+) -> None:
+    for attempt in range(DEADLOCK_RETRIES + 1):
+        try:
+            async with pools.connection(neon_url, autocommit=True) as conn:
+                async with conn.transaction():
+                    if prelude:
+                        await conn.execute(prelude)
+                    await conn.execute(entry.sql)
+                    if checkpoint is not None:
+                        await checkpoint.amark(
+                            conn, post_data_step(entry.kind, entry.name, entry.schema)
+                        )
+            return
+        except psycopg.errors.DeadlockDetected as exc:
+            if attempt == DEADLOCK_RETRIES:
+                raise entry_error(entry, exc) from exc
+        except psycopg.Error as exc:
+            raise entry_error(entry, exc) from exc
+
+
+async def apply_post_data(
+    pools: AsyncPools,
+    neon_url: str,
+    lines: Iterable[bytes],
+    workers: int,
+    checkpoint: Checkpoint | None = None,
+) -> int:
+    """Apply a remapped post-data script; see ``postdata.apply_post_data``."""
+    script = parse_post_data(lines)
+    if checkpoint is not None:
+        script.entries = [
+            e
+            for e in script.entries
+            if not checkpoint.done(post_data_step(e.kind, e.name, e.schema))
+        ]
+    prelude = script.prelude
+    slots = asyncio.Semaphore(max(1, workers))
+
+    async def apply(entry: PostDataEntry) -> None:
+        async with slots:
+            await _apply_entry(pools, neon_url, prelude, entry, checkpoint)
+
+    for entries, parallel in script.waves():
+        if not parallel:
+            for entry in entries:
+                await _apply_entry(pools, neon_url, prelude, entry, checkpoint)
+            continue
+        try:
+            async with asyncio.TaskGroup() as group:
+                for entry in entries:
+                    group.create_task(apply(entry))
+        except BaseExceptionGroup as failed:
+            raise _first_error(failed) from None
+    return len(script.entries)
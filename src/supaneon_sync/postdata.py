@@ -0,0 +1,227 @@
+"""Parallel creation of post-data objects (indexes, constraints, triggers).
+
+pg_dump's post-data section holds everything that is cheaper to build after
+the data is loaded. Each object is preceded by a table-of-contents comment::
+
+    --
+    -- Name: users users_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+    --
+
+which is used here to split the (already remapped) SQL into one entry per
+object. The entries are applied in waves, each wave spread over several Neon
+connections:
+
+1. primary keys, unique constraints and plain indexes;
+2. foreign keys (which need the referenced unique index) and partition index
+   attachments;
+3. triggers, comments and the like;
+4. anything else, one at a time in dump order.
+
+Every entry runs in its own transaction with pg_dump's session settings made
+transaction-local, so nothing leaks into the connection pool. Foreign keys
+lock both tables they connect and can deadlock each other; those entries are
+retried.
+"""
+
+from __future__ import annotations
+
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Iterable
+
+import psycopg
+
+from . import db
+from .checkpoint import Checkpoint, post_data_step
+from .exceptions import BackupError
+
+DEADLOCK_RETRIES = 3
+
+# Entry types built in parallel, by wave. Everything else runs serially last.
+PARALLEL_WAVES: tuple[frozenset[str], ...] = (
+    frozenset({"CONSTRAINT", "INDEX"}),
+    frozenset({"FK CONSTRAINT", "INDEX ATTACH"}),
+    frozenset({"TRIGGER", "COMMENT", "POLICY", "ROW SECURITY", "RULE"}),
+)
+
+_header_re = re.compile(
+    rb"^-- Name: (?P<name>.*); Type: (?P<type>[^;]+); Schema: (?P<schema>[^;]*);"
+)
+_setting_re = re.compile(rb"^SET (?P<name>\w+) = (?P<value>.*);\s*$")
+_set_config_re = re.compile(
+    rb"^SELECT pg_catalog\.set_config\((?P<args>'[^']*', '[^']*'), false\);\s*$"
+)
+
+
+@dataclass
+class PostDataEntry:
+    name: str
+    kind: str
+    sql: bytes
+    # "-" for objects outside any schema.
+    schema: str = ""
+
+
+@dataclass
+class PostDataScript:
+    # pg_dump's SET statements, rewritten as SET LOCAL.
+    settings: list[bytes] = field(default_factory=list)
+    entries: list[PostDataEntry] = field(default_factory=list)
+
+    @property
+    def prelude(self) -> bytes:
+        return b"".join(self.settings)
+
+    def waves(self) -> list[tuple[list[PostDataEntry], bool]]:
+        """Entries grouped into ``(entries, parallel)`` waves, in apply order."""
+        out: list[tuple[list[PostDataEntry], bool]] = [
+            ([e for e in self.entries if e.kind in kinds], True)
+            for kinds in PARALLEL_WAVES
+        ]
+        known = frozenset().union(*PARALLEL_WAVES)
+        out.append(([e for e in self.entries if e.kind not in known], False))
+        return [(entries, parallel) for entries, parallel in out if entries]
+
+
+def _local_setting(line: bytes) -> bytes | None:
+    """Transaction-local form of a pg_dump session setting, if it is one."""
+    m = _setting_re.match(line)
+    if m:
+        if m.group("name") == b"client_encoding":
+            # psycopg owns the connection encoding.
+            return b""
+        return b"SET LOCAL " + m.group("name") + b" = " + m.group("value") + b";\n"
+    m = _set_config_re.match(line)
+    if m:
+        return b"SELECT pg_catalog.set_config(" + m.group("args") + b", true);\n"
+    return None
+
+
+def parse_post_data(lines: Iterable[bytes]) -> PostDataScript:
+    """Split a post-data SQL script into its settings and per-object entries.
+
+    Comments, blank lines and psql meta-commands are dropped, but only
+    between statements and outside string literals. Entries left empty (e.g.
+    policies removed by the remapper) are omitted.
+    """
+    script = PostDataScript()
+    current: PostDataEntry | None = None
+    body: list[bytes] = []
+    # Inside a multi-line string literal, e.g. a comment's text. pg_dump
+    # writes standard-conforming strings, where a quote is escaped by
+    # doubling it, so an odd count of quotes on a line opens or closes one.
+    in_string = False
+
+    def flush() -> None:
+        if current is not None and b"".join(body).strip():
+            current.sql = b"".join(body)
+            script.entries.append(current)
+
+    for line in lines:
+        between_statements = not in_string and (
+            not body or body[-1].rstrip().endswith(b";")
+        )
+        if between_statements:
+            m = _header_re.match(line)
+            if m:
+                flush()
+                current = PostDataEntry(
+                    name=m.group("name").decode(),
+                    kind=m.group("type").decode(),
+                    sql=b"",
+                    schema=m.group("schema").decode(),
+                )
+                body = []
+                continue
+            if not line.strip() or line.startswith((b"--", b"\\")):
+                continue
+            setting = _local_setting(line)
+            if setting is not None:
+                if setting and setting not in script.settings:
+                    script.settings.append(setting)
+                continue
+        body.append(line)
+        if line.count(b"'") % 2:
+            in_string = not in_string
+    flush()
+    return script
+
+
+def apply_entry(
+    neon_url: str,
+    prelude: bytes,
+    entry: PostDataEntry,
+    checkpoint: Checkpoint | None = None,
+) -> None:
+    """Create one post-data object, retrying if it loses a deadlock."""
+    for attempt in range(DEADLOCK_RETRIES + 1):
+        try:
+            with db.connection(neon_url, autocommit=True) as conn:
+                with conn.transaction():
+                    if prelude:
+                        conn.execute(prelude)
+                    conn.execute(entry.sql)
+                    if checkpoint is not None:
+                        checkpoint.mark(
+                            conn, post_data_step(entry.kind, entry.name, entry.schema)
+                        )
+            return
+        except psycopg.errors.DeadlockDetected:
+            if attempt == DEADLOCK_RETRIES:
+                raise
+
+
+def apply_post_data(
+    neon_url: str,
+    lines: Iterable[bytes],
+    workers: int,
+    checkpoint: Checkpoint | None = None,
+) -> int:
+    """Apply a remapped post-data script over ``workers`` connections.
+
+    Objects ``checkpoint`` already has as created are skipped. Returns the
+    number of objects created. Raises BackupError naming the first object
+    that failed.
+    """
+    script = parse_post_data(lines)
+    if checkpoint is not None:
+        script.entries = [
+            e
+            for e in script.entries
+            if not checkpoint.done(post_data_step(e.kind, e.name, e.schema))
+        ]
+    prelude = script.prelude
+    db.get_pool(neon_url, max_size=workers)
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for entries, parallel in script.waves():
+            if not parallel:
+                for entry in entries:
+                    _apply_or_raise(neon_url, prelude, entry, checkpoint)
+                continue
+            futures = [
+                pool.submit(_apply_or_raise, neon_url, prelude, entry, checkpoint)
+                for entry in entries
+            ]
+            for fut in as_completed(futures):
+                fut.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return len(script.entries)
+
+
+def _apply_or_raise(
+    neon_url: str,
+    prelude: bytes,
+    entry: PostDataEntry,
+    checkpoint: Checkpoint | None = None,
+) -> None:
+    try:
+        apply_entry(neon_url, prelude, entry, checkpoint)
+    except psycopg.Error as exc:
+        raise entry_error(entry, exc) from exc
+
+
+def entry_error(entry: PostDataEntry, exc: Exception) -> BackupError:
+    return BackupError(f"Failed to create {entry.kind.lower()} {entry.name}: {exc}")
@@ -0,0 +1,428 @@
+"""Single-pass remapper for pg_dump SQL output.
+
+The dump is read once as raw byte lines and never decoded. Outside
+``COPY ... FROM stdin;`` blocks every line goes through one skip check and
+one combined substitution regex; inside a COPY block data rows are passed
+through untouched until the ``\\.`` terminator, since ``public.`` can only
+appear there as user data.
+
+All rule literals are ASCII, and in UTF-8 an ASCII byte never occurs inside a
+multi-byte character, so matching on bytes finds exactly what matching on the
+decoded text would.
+
+A dump of several schemas is remapped with a ``{source: target}`` mapping;
+every source schema gets the rules ``public`` has (qualified names,
+``search_path`` and dropped ``SCHEMA`` statements), so references between the
+schemas follow them to their targets. Like ``public.``, a qualifier is
+recognised by its text alone: a table or alias named after a backed-up schema
+and used to qualify a column (``billing.amount``) is rewritten too.
+
+When tables are left out of a backup (see ``filters``), foreign keys
+referencing them are dropped, and foreign keys referencing tables backed up
+without their rows are added ``NOT VALID``, so the rows that are copied are
+not checked against an empty table. pg_dump writes such a key as an
+``ALTER TABLE`` line followed by its ``ADD CONSTRAINT`` line; the former is
+held back until the latter has been looked at.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import re
+from typing import BinaryIO, Collection, Iterable, Iterator, Mapping
+
+_SKIP_PREFIXES = (
+    b"GRANT ",
+    b"REVOKE ",
+    b"ALTER DEFAULT PRIVILEGES",
+    b"SET ROLE",
+    b"CREATE POLICY",
+    b"ALTER POLICY",
+    b"DROP POLICY",
+)
+
+_SKIP_CONTAINS = (
+    b"ROW LEVEL SECURITY",
+    b"TO anon",
+    b"TO authenticated",
+    b"TO service_role",
+    b"EXTENSION ",
+    b"SCHEMA public",
+)
+
+_skip_contains_re = re.compile(b"|".join(re.escape(c) for c in _SKIP_CONTAINS))
+
+# Every alternative starts with a literal and there are no capturing groups,
+# so the regex engine can skip ahead to candidate positions instead of trying
+# each rule at every byte; the rule is recovered from the matched text.
+# search_path forms come first; they reproduce what chaining the individual
+# rules used to produce (``extensions.`` -> ``public.`` -> ``<schema>.``).
+_rules_re = re.compile(
+    rb'search_path = (?:"extensions"|extensions)\.'
+    rb"|search_path = public"
+    rb'|"public"'
+    rb'|(?:"extensions"|extensions)\.'
+    rb"|'extensions'"
+    rb"|public\."
+)
+
+_qualified_re = re.compile(rb"public\.")
+
+_ALTER_TABLE = b"ALTER TABLE "
+_FOREIGN_KEY = b" FOREIGN KEY "
+
+_COPY_PREFIX = b"COPY "
+_COPY_SUFFIX = b"FROM stdin;\n"
+_COPY_END = (b"\\.\n", b"\\.\r\n", b"\\.")
+
+# Table of "COPY [schema.]table (...) FROM stdin;", quoted or not.
+_copy_target_re = re.compile(
+    rb'COPY (?:(?:"(?P<qschema>(?:[^"]|"")+)"|(?P<schema>[^."\s]+))\.)?'
+    rb'(?:"(?P<quoted>(?:[^"]|"")+)"|(?P<bare>[^."\s(]+))'
+)
+
+# Identifiers pg_dump writes without quotes.
+_plain_ident_re = re.compile(r"^[a-z_][a-z0-9_$]*$")
+
+
+def _unquote(quoted: bytes | None, bare: bytes | None) -> str | None:
+    if quoted is not None:
+        return quoted.replace(b'""', b'"').decode()
+    return bare.decode() if bare is not None else None
+
+
+def copy_header_name(line: bytes) -> tuple[str | None, str] | None:
+    """``(schema, table)`` of a ``COPY ... FROM stdin;`` header line.
+
+    The schema is None if the table is not qualified.
+    """
+    if not (line.startswith(_COPY_PREFIX) and line.endswith(_COPY_SUFFIX)):
+        return None
+    m = _copy_target_re.match(line)
+    if m is None:
+        return None
+    table = _unquote(m.group("quoted"), m.group("bare"))
+    assert table is not None
+    return _unquote(m.group("qschema"), m.group("schema")), table
+
+
+def copy_header_table(line: bytes) -> str | None:
+    """Unqualified table name of a ``COPY ... FROM stdin;`` header line."""
+    name = copy_header_name(line)
+    return name[1] if name else None
+
+
+def _ident_text(name: str) -> bytes:
+    """``name`` as pg_dump writes it in SQL."""
+    if _plain_ident_re.match(name):
+        return name.encode()
+    return b'"' + name.replace('"', '""').encode() + b'"'
+
+
+def is_copy_end(line: bytes) -> bool:
+    """Whether ``line`` terminates a COPY data block."""
+    return line in _COPY_END
+
+
+def _follows_word_char(line: bytes, start: int) -> bool:
+    """Equivalent of ``(?<!\\w)`` on the decoded text, evaluated on bytes.
+
+    A leading lookbehind in the pattern would disable the literal prefix scan
+    for the whole regex, so it is checked only for actual matches.
+    """
+    if start == 0:
+        return False
+    prev = line[start - 1]
+    if prev < 0x80:
+        return chr(prev).isalnum() or prev == 0x5F  # "_"
+    # Walk back over UTF-8 continuation bytes to the start of the character.
+    lead = start - 1
+    while lead > 0 and 0x80 <= line[lead] < 0xC0:
+        lead -= 1
+    char = line[lead:start].decode("utf-8", "replace")
+    return char.isalnum()
+
+
+class Remapper:
+    """Rewrites a dump of the ``public`` schema into ``new_schema``.
+
+    ``schemas`` maps every schema of a multi-schema dump to its target
+    instead; ``public`` is remapped only if it is one of them. ``excluded``
+    and ``without_data`` name the ``(schema, table)``s left out of the
+    backup and backed up without rows.
+    """
+
+    def __init__(
+        self,
+        new_schema: str,
+        schemas: Mapping[str, str] | None = None,
+        excluded: Collection[tuple[str, str]] = (),
+        without_data: Collection[tuple[str, str]] = (),
+    ):
+        self.new_schema = new_schema
+        self.schemas = dict(schemas) if schemas else {"public": new_schema}
+        # "REFERENCES <table>(" -> whether the foreign key is dropped.
+        self._references = {
+            b"REFERENCES " + _ident_text(s) + b"." + _ident_text(t) + b"(": drop
+            for names, drop in ((without_data, False), (excluded, True))
+            for s, t in names
+        }
+        self._references_re = (
+            re.compile(b"|".join(re.escape(r) for r in self._references))
+            if self._references
+            else None
+        )
+        target = new_schema.encode()
+        self._qualified = target + b"."
+        # Matched text -> replacement, one entry per alternative of _rules_re.
+        self._replacements = {
+            b'search_path = "extensions".': b"search_path = " + target + b".",
+            b"search_path = extensions.": b"search_path = " + target + b".",
+            b'"extensions".': b"public.",
+            b"extensions.": b"public.",
+            b"'extensions'": b"'" + target + b"'",
+        }
+        # Qualifiers only rewritten where they do not continue a word.
+        self._bare_qualifiers = set()
+        if self.schemas == {"public": new_schema}:
+            self._replacements.update(
+                {
+                    b"search_path = public": b"search_path = " + target,
+                    b'"public"': b'"' + target + b'"',
+                    b"public.": self._qualified,
+                }
+            )
+            self._bare_qualifiers.add(b"public.")
+            self._rules_re = _rules_re
+            self._qualified_re = _qualified_re
+            self._skip_contains_re = _skip_contains_re
+            self._copy_replacements = {b"public.": self._qualified}
+            return
+
+        # Longest names first, so that no schema's rules match a prefix of
+        # another's.
+        sources = sorted(self.schemas, key=len, reverse=True)
+        search_paths, qualifiers, skips = [], [], list(_SKIP_CONTAINS[:-1])
+        self._copy_replacements = {}
+        for source in sources:
+            text, dest = _ident_text(source), _ident_text(self.schemas[source])
+            search_paths.append(b"search_path = " + text)
+            qualifiers.append(text + b".")
+            skips.append(b"SCHEMA " + text)
+            self._replacements[b"search_path = " + text] = b"search_path = " + dest
+            self._replacements[text + b"."] = dest + b"."
+            self._copy_replacements[text + b"."] = dest + b"."
+            if not text.startswith(b'"'):
+                self._bare_qualifiers.add(text + b".")
+            if source == "public":
+                self._replacements[b'"public"'] = b'"' + dest + b'"'
+                qualifiers.insert(0, b'"public"')
+
+        def alternatives(literals: Iterable[bytes]) -> bytes:
+            return b"|".join(re.escape(lit) for lit in literals)
+
+        self._rules_re = re.compile(
+            alternatives(
+                [
+                    b'search_path = "extensions".',
+                    b"search_path = extensions.",
+                    *search_paths,
+                    b'"extensions".',
+                    b"extensions.",
+                    b"'extensions'",
+                    *qualifiers,
+                ]
+            )
+        )
+        self._qualified_re = re.compile(alternatives(self._copy_replacements))
+        self._skip_contains_re = re.compile(alternatives(skips))
+
+    def rewrite(self, line: bytes) -> bytes:
+        """Apply the substitution rules to one line."""
+        replacements = self._replacements
+        bare = self._bare_qualifiers
+
+        def replace(m: re.Match[bytes]) -> bytes:
+            text = m.group()
+            if text in bare and _follows_word_char(line, m.start()):
+                return text
+            return replacements[text]
+
+        return self._rules_re.sub(replace, line)
+
+    def rewrite_copy_header(self, line: bytes) -> bytes:
+        """Rename the target table of a ``COPY ... FROM stdin;`` header.
+
+        Only qualified names are rewritten; the DDL rules could misfire on
+        column names.
+        """
+        replacements = self._copy_replacements
+        bare = self._bare_qualifiers
+
+        def replace(m: re.Match[bytes]) -> bytes:
+            text = m.group()
+            if text in bare and _follows_word_char(line, m.start()):
+                return text
+            return replacements[text]
+
+        return self._qualified_re.sub(replace, line)
+
+    def remap_ddl_line(self, line: bytes) -> bytes | None:
+        """Remap one DDL line, or return None if it must be dropped."""
+        if line.startswith(_SKIP_PREFIXES) or self._skip_contains_re.search(line):
+            return None
+        return self.rewrite(line)
+
+    def _holds(self, line: bytes) -> bool:
+        """Whether ``line`` may start a foreign key that needs filtering."""
+        return (
+            self._references_re is not None
+            and line.startswith(_ALTER_TABLE)
+            and not line.rstrip().endswith(b";")
+        )
+
+    def _remap_statement(self, held: bytes, line: bytes) -> Iterator[bytes]:
+        """Remap a held ``ALTER TABLE`` line and the line following it."""
+        m = None
+        if _FOREIGN_KEY in line and self._references_re is not None:
+            m = self._references_re.search(line)
+        if m is not None:
+            if self._references[m.group()]:
+                return
+            end = line.rindex(b";")
+            line = line[:end] + b" NOT VALID" + line[end:]
+        for part in (held, line):
+            out = self.remap_ddl_line(part)
+            if out is not None:
+                yield out
+
+    def remap_ddl(self, lines: Iterable[bytes]) -> Iterator[bytes]:
+        """Remap lines that hold no COPY data."""
+        held = None
+        for line in lines:
+            if held is not None:
+                yield from self._remap_statement(held, line)
+                held = None
+            elif self._holds(line):
+                held = line
+            else:
+                out = self.remap_ddl_line(line)
+                if out is not None:
+                    yield out
+        if held is not None:
+            out = self.remap_ddl_line(held)
+            if out is not None:
+                yield out
+
+    def remap(self, lines: Iterable[bytes]) -> Iterator[bytes]:
+        """Generator stage remapping a whole dump, COPY-block aware."""
+        in_copy = False
+        held = None
+        for line in lines:
+            if in_copy:
+                if line in _COPY_END:
+                    in_copy = False
+                yield line
+            elif held is not None:
+                yield from self._remap_statement(held, line)
+                held = None
+            elif line.startswith(_COPY_PREFIX) and line.endswith(_COPY_SUFFIX):
+                in_copy = True
+                yield self.rewrite_copy_header(line)
+            elif self._holds(line):
+                held = line
+            else:
+                out = self.remap_ddl_line(line)
+                if out is not None:
+                    yield out
+        if held is not None:
+            yield from self.remap_ddl([held])
+
+
+def _mmap_lines(mm: mmap.mmap, start: int, end: int) -> Iterator[bytes]:
+    mm.seek(start)
+    while mm.tell() < end:
+        yield mm.readline()
+
+
+def remap_file(
+    src: str,
+    dst: str,
+    new_schema: str,
+    schemas: Mapping[str, str] | None = None,
+    excluded: Collection[tuple[str, str]] = (),
+    without_data: Collection[tuple[str, str]] = (),
+) -> None:
+    """Remap a dump file to ``dst`` via a memory map of ``src``.
+
+    Produces the same bytes as ``Remapper.remap`` over the file's lines, but
+    only lines outside COPY blocks are looked at individually: each COPY
+    payload is located with two ``find`` calls and written as a single
+    memoryview slice of the map, so a data-heavy dump is copied at close to
+    I/O speed.
+    """
+    remapper = Remapper(new_schema, schemas, excluded, without_data)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        if os.fstat(fin.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _remap_mapped(remapper, mm, fout)
+
+
+def _next_copy_header(mm: mmap.mmap, pos: int) -> int:
+    """Offset of the next line starting with ``COPY `` at or after ``pos``.
+
+    ``pos`` is always at a line start. Returns ``len(mm)`` if there is none.
+    """
+    if pos == 0 and mm[: len(_COPY_PREFIX)] == _COPY_PREFIX:
+        return 0
+    found = mm.find(b"\n" + _COPY_PREFIX, max(pos - 1, 0))
+    return len(mm) if found < 0 else found + 1
+
+
+def _copy_block_end(mm: mmap.mmap, header_end: int) -> int:
+    """Offset just past the ``\\.`` terminator of a COPY block."""
+    size = len(mm)
+    search = header_end - 1
+    while True:
+        found = mm.find(b"\n\\.", search)
+        if found < 0:
+            return size
+        after = found + 3
+        if after == size:
+            return size
+        if mm[after : after + 1] == b"\n":
+            return after + 1
+        if mm[after : after + 2] == b"\r\n":
+            return after + 2
+        search = after
+
+
+def _remap_mapped(remapper: Remapper, mm: mmap.mmap, fout: BinaryIO) -> None:
+    size = len(mm)
+    with memoryview(mm) as view:
+        pos = 0
+        while pos < size:
+            header = _next_copy_header(mm, pos)
+
+            # Everything before the COPY header is DDL.
+            fout.writelines(remapper.remap_ddl(_mmap_lines(mm, pos, header)))
+            if header >= size:
+                break
+
+            newline = mm.find(b"\n", header)
+            header_end = size if newline < 0 else newline + 1
+            line = mm[header:header_end]
+            if not line.endswith(_COPY_SUFFIX):
+                # "COPY " at the start of a line that is not a data block.
+                out = remapper.remap_ddl_line(line)
+                if out is not None:
+                    fout.write(out)
+                pos = header_end
+                continue
+
+            fout.write(remapper.rewrite_copy_header(line))
+            end = _copy_block_end(mm, header_end)
+            fout.write(view[header_end:end])
+            pos = end
@@ -3,11 +3,19 @@
 from __future__ import annotations
 
 from .config import validate_env
-from .healthcheck import run_healthcheck
-from .backup import list_backup_schemas
+from .healthcheck import DEFAULT_WORKERS, run_healthcheck
+from .backup import list_backup_schemas, target_schemas
+from .checkpoint import run_schemas
+from .manifest import ACTION_SKIPPED, filtered_tables
+from .verify import DEFAULT_CHUNK_ROWS, VerifyReport, verify_backup
 
 
-def run_restore_test():
+def run_restore_test(
+    fast: bool = False,
+    sample: int = 0,
+    workers: int = DEFAULT_WORKERS,
+    budget: float | None = None,
+):
     cfg = validate_env()
     neon_url = cfg.neon_database_url
 
@@ -26,12 +34,71 @@ def run_restore_test():
 
     print(f"Running healthchecks against schema {latest_schema}...")
     try:
-        run_healthcheck(neon_url, schema=latest_schema)
+        filtered = filtered_tables(neon_url, latest_schema)
+        run_healthcheck(
+            neon_url,
+            schema=latest_schema,
+            fast=fast,
+            sample=sample,
+            workers=workers,
+            budget=budget,
+            without_data=[t for t, a in filtered.items() if a == ACTION_SKIPPED],
+        )
         print("Healthcheck passed!")
     except Exception as e:
         print(f"Healthcheck failed: {e}")
         raise SystemExit(1)
 
 
+def run_verify(
+    schema: str | None = None,
+    workers: int = DEFAULT_WORKERS,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> list[VerifyReport]:
+    """Compare a backup (default: the latest) with Supabase.
+
+    Every Supabase schema the backup took is compared with its schema on Neon,
+    the backup schema itself or one of its companions; one report each.
+    """
+    cfg = validate_env()
+    neon_url = cfg.neon_database_url
+
+    if schema is None:
+        backup_schemas = list_backup_schemas(neon_url)
+        if not backup_schemas:
+            raise SystemExit("No backup schemas found")
+        schema = backup_schemas[-1]
+
+    reports = []
+    for source, target in target_schemas(schema, run_schemas(neon_url, schema)).items():
+        print(f"Verifying {target} against Supabase {source} with {workers} workers...")
+        report = verify_backup(
+            cfg.supabase_database_url,
+            neon_url,
+            target,
+            source_schema=source,
+            workers=workers,
+            chunk_rows=chunk_rows,
+            filtered=filtered_tables(neon_url, target),
+        )
+
+        if report.filtered:
+            print(f"  Not compared (table filters): {', '.join(report.filtered)}")
+        for table in report.missing:
+            print(f"  Missing table: {table}")
+        for m in report.mismatches:
+            print(
+                f"  Mismatch in {m.range.table} [{m.range.lo}, {m.range.hi}): "
+                f"source {m.source.rows} rows, backup {m.target.rows} rows"
+                + (", contents differ" if m.source.rows == m.target.rows else "")
+            )
+        print(
+            f"  Checked {report.tables} tables, {report.ranges} key ranges, "
+            f"{report.rows} source rows."
+        )
+        reports.append(report)
+    return reports
+
+
 if __name__ == "__main__":
     run_restore_test()
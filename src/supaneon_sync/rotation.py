@@ -0,0 +1,82 @@
+"""Retention policy for backup schemas (and, in ``branch`` mode, branches).
+
+Rotation happens in two steps around a backup:
+
+1. While the new backup is running, only schemas that are surplus even
+   *without* it are dropped, so a failed backup never leaves fewer backups
+   than the policy keeps.
+2. Once the new backup has succeeded it is counted too, and whatever it
+   pushes over the limits is dropped.
+
+Policies only ever drop the oldest schemas, and never go below ``min_keep``.
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+from dataclasses import dataclass
+from typing import Mapping
+
+DEFAULT_KEEP = 6
+
+# Schemas are named backup_<timestamp>, branches backup-<timestamp>.
+_SCHEMA_TS_RE = re.compile(r"^backup[_-](\d{8}t\d{6}z)", re.IGNORECASE)
+
+
+def schema_timestamp(schema: str) -> datetime.datetime | None:
+    """When a backup schema or branch was taken, or None if unparseable."""
+    m = _SCHEMA_TS_RE.match(schema)
+    if m is None:
+        return None
+    return datetime.datetime.strptime(m.group(1).lower(), "%Y%m%dt%H%M%Sz").replace(
+        tzinfo=datetime.UTC
+    )
+
+
+@dataclass
+class RetentionPolicy:
+    # Backups kept, counting the one being taken; None for no count limit.
+    keep: int | None = DEFAULT_KEEP
+    # Drop backups older than this.
+    max_age: datetime.timedelta | None = None
+    # Drop the oldest backups until the rest fit in this many bytes on Neon.
+    max_bytes: int | None = None
+    # Age and size limits never rotate below this many backups.
+    min_keep: int = 1
+
+    @property
+    def needs_sizes(self) -> bool:
+        return self.max_bytes is not None
+
+    def expired(
+        self,
+        schemas: list[str],
+        sizes: Mapping[str, int] | None = None,
+        now: datetime.datetime | None = None,
+    ) -> list[str]:
+        """Schemas to drop, oldest first, for ``schemas`` to satisfy the policy."""
+        kept = sorted(schemas)
+        dropped: list[str] = []
+        floor = max(self.min_keep, 0)
+
+        if self.keep is not None:
+            while len(kept) > max(self.keep, floor):
+                dropped.append(kept.pop(0))
+
+        if self.max_age is not None:
+            cutoff = (now or datetime.datetime.now(datetime.UTC)) - self.max_age
+            while len(kept) > floor:
+                taken = schema_timestamp(kept[0])
+                if taken is None or taken >= cutoff:
+                    break
+                dropped.append(kept.pop(0))
+
+        if self.max_bytes is not None and sizes is not None:
+            total = sum(sizes.get(s, 0) for s in kept)
+            while len(kept) > floor and total > self.max_bytes:
+                oldest = kept.pop(0)
+                total -= sizes.get(oldest, 0)
+                dropped.append(oldest)
+
+        return dropped
@@ -0,0 +1,126 @@
+"""Streaming subprocess pipelines.
+
+Connects a producer command (e.g. ``pg_dump``) to a consumer command (e.g.
+``psql``) through a chain of Python generator stages, so that dumping,
+rewriting and loading overlap and no intermediate file is written to disk.
+"""
+
+from __future__ import annotations
+
+import subprocess
+from typing import Callable, Iterable, Iterator
+
+Stage = Callable[[Iterable[bytes]], Iterable[bytes]]
+
+
+def _apply_stages(lines: Iterable[bytes], stages: Iterable[Stage]) -> Iterator[bytes]:
+    for stage in stages:
+        lines = stage(lines)
+    yield from lines
+
+
+def _feed(lines: Iterable[bytes], sink: subprocess.Popen) -> bool:
+    """Write ``lines`` to ``sink`` stdin; returns False if the sink hung up."""
+    assert sink.stdin is not None
+    broken = False
+    try:
+        for line in lines:
+            sink.stdin.write(line)
+    except BrokenPipeError:
+        broken = True
+    finally:
+        try:
+            sink.stdin.close()
+        except BrokenPipeError:
+            broken = True
+    return not broken
+
+
+def run_pipeline(source_cmd: list[str], sink_cmd: list[str], *stages: Stage) -> None:
+    """Pipe ``source_cmd`` stdout through ``stages`` into ``sink_cmd`` stdin.
+
+    Stages receive and yield raw byte lines.
+
+    Raises subprocess.CalledProcessError if either process exits non-zero. When
+    the sink dies early (e.g. psql with ON_ERROR_STOP) the source is terminated
+    and the sink's failure is reported.
+    """
+    source = subprocess.Popen(source_cmd, stdout=subprocess.PIPE)
+    try:
+        sink = subprocess.Popen(sink_cmd, stdin=subprocess.PIPE)
+    except BaseException:
+        source.kill()
+        source.wait()
+        raise
+
+    assert source.stdout is not None
+    try:
+        complete = _feed(_apply_stages(source.stdout, stages), sink)
+    except BaseException:
+        source.kill()
+        sink.kill()
+        raise
+
+    if not complete:
+        # The sink stopped reading; there is no point in finishing the dump.
+        source.kill()
+
+    sink_rc = sink.wait()
+    source.stdout.close()
+    source_rc = source.wait()
+
+    if sink_rc != 0:
+        raise subprocess.CalledProcessError(sink_rc, sink_cmd[0])
+    if source_rc != 0:
+        raise subprocess.CalledProcessError(source_rc, source_cmd[0])
+
+
+def run_sink(lines: Iterable[bytes], sink_cmd: list[str], *stages: Stage) -> None:
+    """Feed ``lines`` from Python through ``stages`` into ``sink_cmd`` stdin."""
+    sink = subprocess.Popen(sink_cmd, stdin=subprocess.PIPE)
+    try:
+        _feed(_apply_stages(lines, stages), sink)
+    except BaseException:
+        sink.kill()
+        raise
+    sink_rc = sink.wait()
+    if sink_rc != 0:
+        raise subprocess.CalledProcessError(sink_rc, sink_cmd[0])
+
+
+def run_source(source_cmd: list[str], path: str, *stages: Stage) -> None:
+    """Write ``source_cmd`` stdout through ``stages`` into the file ``path``."""
+    source = subprocess.Popen(source_cmd, stdout=subprocess.PIPE)
+    assert source.stdout is not None
+    try:
+        with open(path, "wb") as fout:
+            fout.writelines(_apply_stages(source.stdout, stages))
+    except BaseException:
+        source.kill()
+        raise
+    finally:
+        source.stdout.close()
+        source_rc = source.wait()
+    if source_rc != 0:
+        raise subprocess.CalledProcessError(source_rc, source_cmd[0])
+
+
+def iter_source(source_cmd: list[str], *stages: Stage) -> Iterator[bytes]:
+    """Yield ``source_cmd`` stdout lines through ``stages``.
+
+    Raises subprocess.CalledProcessError once the lines are exhausted if the
+    command failed; the command is killed if the caller stops early.
+    """
+    source = subprocess.Popen(source_cmd, stdout=subprocess.PIPE)
+    assert source.stdout is not None
+    complete = False
+    try:
+        yield from _apply_stages(source.stdout, stages)
+        complete = True
+    finally:
+        if not complete:
+            source.kill()
+        source.stdout.close()
+        source_rc = source.wait()
+    if source_rc != 0:
+        raise subprocess.CalledProcessError(source_rc, source_cmd[0])
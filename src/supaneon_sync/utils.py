@@ -13,9 +13,34 @@ logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
 _sanitize_re = re.compile(r"postgres(?:ql)?://[^\s']+")
+_plain_name_re = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def redact(msg: str) -> str:
+    """Replace database URLs in ``msg`` so credentials never reach output."""
+    return _sanitize_re.sub("postgresql://<REDACTED>", msg)
 
 
 def safe_log(msg: str) -> None:
     """Log a message but redact database URLs to avoid leaking credentials."""
-    redacted = _sanitize_re.sub("postgresql://<REDACTED>", msg)
-    logger.info(redacted)
+    logger.info(redact(msg))
+
+
+def schema_flag(schema: str) -> str:
+    """``pg_dump --schema`` option selecting exactly ``schema``.
+
+    The option takes a pattern: other names are quoted so that case, spaces
+    and wildcard characters are matched literally.
+    """
+    return f"--schema={_name_pattern(schema)}"
+
+
+def table_flag(option: str, schema: str, table: str) -> str:
+    """pg_dump table option (e.g. ``--exclude-table``) naming exactly one table."""
+    return f"{option}={_name_pattern(schema)}.{_name_pattern(table)}"
+
+
+def _name_pattern(name: str) -> str:
+    if _plain_name_re.match(name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
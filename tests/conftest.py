@@ -0,0 +1,158 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from supaneon_sync.neon import NeonClient
+
+_ROUTE_RE = re.compile(
+    r"^/projects/(?P<project>[^/]+)/(?P<kind>branches|operations)"
+    r"(?:/(?P<id>[^/]+))?(?P<endpoints>/endpoints)?$"
+)
+
+
+class FakeNeonApi(BaseHTTPRequestHandler):
+    """The branch, endpoint and operation routes of the Neon API, in memory.
+
+    Branches are listed in pages of at most ``limit``. Every create or delete
+    starts an operation that reports ``running`` for ``operation_polls``
+    polls and then ``operation_status``.
+    """
+
+    branches: dict[str, dict] = {}
+    endpoints: dict[str, list[dict]] = {}
+    operations: dict[str, dict] = {}
+    requests: list[tuple[str, str, dict | None]] = []
+    operation_polls = 1
+    operation_status = "finished"
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _operation(self, action: str, branch_id: str) -> list[dict]:
+        op = {
+            "id": f"op-{len(self.operations) + 1}",
+            "action": action,
+            "branch_id": branch_id,
+            "status": "running",
+            "polls": 0,
+        }
+        self.operations[op["id"]] = op
+        return [{k: v for k, v in op.items() if k != "polls"}]
+
+    def _route(self, method: str) -> None:
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        payload = None
+        if method == "POST":
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((method, url.path, payload))
+
+        m = _ROUTE_RE.match(url.path)
+        if m is None or self.headers["Authorization"] != "Bearer key":
+            self._reply(404, {"message": "not found"})
+        elif m.group("kind") == "operations":
+            op = self.operations[m.group("id")]
+            op["polls"] += 1
+            if op["polls"] > self.operation_polls:
+                op["status"] = self.operation_status
+            self._reply(200, {"operation": op})
+        elif m.group("endpoints"):
+            self._reply(200, {"endpoints": self.endpoints.get(m.group("id"), [])})
+        elif method == "GET":
+            everything = list(self.branches.values())
+            start = int(query.get("cursor", 0))
+            end = start + int(query.get("limit", len(everything)))
+            self._reply(
+                200,
+                {
+                    "branches": everything[start:end],
+                    "pagination": {"next": str(end) if end < len(everything) else ""},
+                },
+            )
+        elif method == "POST":
+            branch = {
+                "id": f"br-{len(self.requests)}",
+                "name": payload["branch"]["name"],
+                "parent_id": payload["branch"].get("parent_id"),
+                "created_at": "2026-10-16T12:00:00Z",
+            }
+            self.branches[branch["id"]] = branch
+            self._reply(
+                201,
+                {
+                    "branch": branch,
+                    "endpoints": [],
+                    "operations": self._operation("create_branch", branch["id"]),
+                },
+            )
+        elif m.group("id") in self.branches:
+            branch = self.branches.pop(m.group("id"))
+            self._reply(
+                200,
+                {
+                    "branch": branch,
+                    "operations": self._operation("delete_timeline", branch["id"]),
+                },
+            )
+        else:
+            self._reply(404, {"message": "no such branch"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_neon():
+    """A fresh ``FakeNeonApi`` with only a ``main`` branch."""
+    FakeNeonApi.branches = {
+        "br-main": {
+            "id": "br-main",
+            "name": "main",
+            "created_at": "2026-01-01T00:00:00Z",
+        }
+    }
+    FakeNeonApi.endpoints = {
+        "br-main": [{"type": "read_write", "host": "ep-main.neon.test"}]
+    }
+    FakeNeonApi.operations = {}
+    FakeNeonApi.requests = []
+    FakeNeonApi.operation_polls = 1
+    FakeNeonApi.operation_status = "finished"
+    return FakeNeonApi
+
+
+@pytest.fixture
+def neon_api(fake_neon):
+    """A ``NeonClient`` talking to ``fake_neon`` over HTTP."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fake_neon)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    client = NeonClient(
+        "key", "proj", base_url=f"http://127.0.0.1:{server.server_port}"
+    )
+    client.poll_interval = 0.001
+    try:
+        yield client
+    finally:
+        server.shutdown()
+        server.server_close()
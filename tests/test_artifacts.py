@@ -0,0 +1,120 @@
+import gzip
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from supaneon_sync import artifacts, backup
+from supaneon_sync.checkpoint import STEP_TABLES, Checkpoint
+from supaneon_sync.exceptions import RestoreError
+
+DUMP = [b"CREATE TABLE public.users (id integer);\n", b"-- done\n"]
+
+
+def _record(tmp_path, compression="gzip"):
+    recorder = artifacts.ArtifactRecorder(str(tmp_path), "backup_x", compression)
+    passed = list(recorder.stage("schema.sql")(iter(DUMP)))
+    recorder.finish()
+    return recorder, passed
+
+
+def test_recorder_tees_lines_and_writes_manifest(tmp_path):
+    recorder, passed = _record(tmp_path)
+
+    assert passed == DUMP
+    with gzip.open(tmp_path / "backup_x" / "schema.sql.gz") as f:
+        assert f.read() == b"".join(DUMP)
+
+    manifest = json.loads((tmp_path / "backup_x" / "manifest.json").read_text())
+    assert manifest["backup_schema"] == "backup_x"
+    [entry] = manifest["files"]
+    assert entry["name"] == "schema.sql.gz"
+    assert entry["raw_bytes"] == sum(len(line) for line in DUMP)
+    assert artifacts.verify_artifact(recorder.dir) == manifest
+
+
+def test_verify_artifact_detects_corruption(tmp_path):
+    recorder, _ = _record(tmp_path)
+    path = tmp_path / "backup_x" / "schema.sql.gz"
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(RestoreError):
+        artifacts.verify_artifact(recorder.dir)
+
+
+def test_abort_removes_partial_artifacts(tmp_path):
+    recorder = artifacts.ArtifactRecorder(str(tmp_path), "backup_x")
+    list(recorder.stage("schema.sql")(iter(DUMP)))
+    recorder.abort()
+
+    assert not (tmp_path / "backup_x").exists()
+
+
+def test_zstd_round_trip(tmp_path):
+    pytest.importorskip("zstandard")
+    recorder, _ = _record(tmp_path, "zstd")
+
+    manifest = artifacts.verify_artifact(recorder.dir)
+    path = tmp_path / "backup_x" / manifest["files"][0]["name"]
+    with artifacts.open_artifact(str(path), "zstd") as f:
+        assert list(f) == DUMP
+
+
+@patch("supaneon_sync.backup.run_sink")
+@patch("supaneon_sync.backup.db")
+def test_restore_artifact_replays_remapped_dump(mock_db, mock_run_sink, tmp_path):
+    recorder, _ = _record(tmp_path)
+    replayed = []
+    mock_run_sink.side_effect = lambda lines, cmd, stage: replayed.extend(stage(lines))
+
+    target = backup.restore_artifact(recorder.dir, "postgres://neon", "backup_y")
+
+    assert target == "backup_y"
+    assert replayed[0] == b"CREATE TABLE backup_y.users (id integer);\n"
+
+
+@patch("supaneon_sync.backup.run_sink")
+@patch("supaneon_sync.backup.db")
+def test_restore_artifact_loads_data_before_post_data(mock_db, mock_run_sink, tmp_path):
+    recorder = artifacts.ArtifactRecorder(str(tmp_path), "backup_x")
+    # Recorded in the order an older plain backup dumped them.
+    for name in ("schema.sql", "postdata.sql", "data.sql"):
+        list(recorder.stage(name)(iter([f"-- {name}\n".encode()])))
+    recorder.finish()
+    replayed = []
+    mock_run_sink.side_effect = lambda lines, cmd, stage: replayed.extend(lines)
+
+    backup.restore_artifact(recorder.dir, "postgres://neon")
+
+    assert replayed == [b"-- schema.sql\n", b"-- data.sql\n", b"-- postdata.sql\n"]
+
+
+@patch("supaneon_sync.backup._post_data_section")
+@patch("supaneon_sync.backup.run_pipeline")
+def test_resumed_stream_backup_still_records_the_schema(
+    mock_pipeline, mock_post_data, tmp_path
+):
+    recorder = artifacts.ArtifactRecorder(str(tmp_path), "backup_x")
+    checkpoint = Checkpoint("neon", "backup_x", {STEP_TABLES: None}, resumed=True)
+    job = backup.BackupJob(
+        "src",
+        "neon",
+        "backup_x",
+        backup.BackupOptions(mode="stream"),
+        MagicMock(),
+        checkpoint,
+        recorder,
+    )
+
+    with patch.object(
+        backup.BackupJob, "schema_dump_cmd", return_value=["cat", "/dev/null"]
+    ):
+        backup._run_stream(job)
+    manifest = recorder.finish()
+
+    # The tables exist, so only data is streamed into Neon.
+    assert mock_pipeline.call_count == 1
+    files = json.loads(open(manifest).read())["files"]
+    assert "schema.sql.gz" in [f["name"] for f in files]
@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+from supaneon_sync import branches
+from supaneon_sync.rotation import RetentionPolicy
+
+
+def test_branch_backups_are_created_and_rotated_over_the_api(fake_neon, neon_api):
+    for ts in ("20261014t000000z", "20261015t000000z", "20261016t000000z"):
+        neon_api.create_branch(branches.branch_name(ts), parent_id="br-main")
+
+    expired = branches.rotate_branches(neon_api, RetentionPolicy(keep=2))
+
+    assert expired == ["backup-20261014t000000z"]
+    assert sorted(b.name for b in neon_api.list_branches()) == [
+        "backup-20261015t000000z",
+        "backup-20261016t000000z",
+        "main",
+    ]
+    method, path, payload = fake_neon.requests[0]
+    assert (method, path) == ("POST", "/projects/proj/branches")
+    assert payload == {
+        "branch": {"name": "backup-20261014t000000z", "parent_id": "br-main"}
+    }
+    assert ("DELETE", "/projects/proj/branches/br-1", None) in fake_neon.requests
+
+
+def test_ddl_hash_ignores_comments_and_meta_commands():
+    ddl = b"CREATE TABLE supaneon_rolling.users (id integer);\n"
+    first = b"-- Dumped by pg_dump version 16.10\n\\restrict abc\n" + ddl
+    second = b"-- Dumped by pg_dump version 16.11\n\\restrict xyz\n" + ddl
+
+    assert branches.ddl_hash(first) == branches.ddl_hash(second)
+    assert branches.ddl_hash(ddl) != branches.ddl_hash(
+        ddl.replace(b"integer", b"bigint")
+    )
+
+
+@patch("supaneon_sync.branches.db")
+def test_refresh_tables_reloads_with_foreign_keys_dropped(mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    fk = ("orders", "orders_user_fk", "FOREIGN KEY (user_id) REFERENCES x.users(id)")
+    conn.execute.return_value.fetchall.return_value = [fk]
+    conn.cursor.return_value.__enter__.return_value.rowcount = 3
+
+    rows = branches.refresh_tables("src", "neon", ["users"])
+
+    assert rows == {"users": 3}
+    statements = [
+        c.args[0] if isinstance(c.args[0], str) else c.args[0].as_string(None)
+        for c in conn.execute.call_args_list
+    ]
+    assert statements[1:] == [
+        'ALTER TABLE "supaneon_rolling"."orders" DROP CONSTRAINT "orders_user_fk"',
+        'TRUNCATE "supaneon_rolling"."users"',
+        'ALTER TABLE "supaneon_rolling"."orders" ADD CONSTRAINT "orders_user_fk" '
+        + fk[2],
+    ]
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from supaneon_sync import buffers
+
+
+def test_pump_packs_chunks_into_bounded_slots():
+    chunks = [b"a" * 3, b"b" * 3, b"c" * 3, b"d" * 10, b"e"]
+    written = []
+
+    stats = buffers.pump(chunks, lambda view: written.append(bytes(view)), 2, 8)
+
+    assert written == [b"aaabbb", b"ccc", b"d" * 10, b"e"]
+    assert b"".join(written) == b"".join(chunks)
+    assert (stats.bytes, stats.chunks, stats.writes) == (20, 5, 4)
+
+
+def test_pump_applies_backpressure_to_the_reader():
+    read, ahead = [], []
+
+    def source():
+        for i in range(10):
+            read.append(i)
+            yield b"x" * 4
+
+    def write(view):
+        time.sleep(0.01)
+        ahead.append(len(read) - len(ahead))
+
+    stats = buffers.pump(source(), write, 2, 4)
+
+    # The slot being written, the one filled and the chunk being put.
+    assert stats.chunks == 10 and max(ahead) <= 3
+    assert stats.sink_wait > 0
+
+
+def test_pump_reraises_either_side_and_stops_the_other():
+    def failing_source():
+        yield b"ok"
+        raise ValueError("source broke")
+
+    with pytest.raises(ValueError, match="source broke"):
+        buffers.pump(failing_source(), lambda view: None)
+
+    read = []
+
+    def endless():
+        while True:
+            read.append(1)
+            yield b"x" * 4
+
+    def failing_write(view):
+        raise OSError("sink broke")
+
+    with pytest.raises(OSError, match="sink broke"):
+        buffers.pump(endless(), failing_write, 2, 4)
+    assert len(read) < 100
@@ -0,0 +1,172 @@
+import struct
+from unittest.mock import MagicMock, patch
+
+from supaneon_sync import backup, cdc
+
+
+def _string(text):
+    return text.encode() + b"\0"
+
+
+def _tuple(*values):
+    out = struct.pack("!H", len(values))
+    for v in values:
+        if v is None:
+            out += b"n"
+        elif v is cdc.UNCHANGED:
+            out += b"u"
+        else:
+            out += b"t" + struct.pack("!i", len(v)) + v.encode()
+    return out
+
+
+def _relation(relid, name, columns, key, identity=b"d", types=None):
+    out = b"R" + struct.pack("!I", relid) + _string("public") + _string(name)
+    out += identity + struct.pack("!H", len(columns))
+    for column in columns:
+        out += struct.pack("!B", column in key) + _string(column)
+        # text, unless ``types`` says otherwise
+        out += struct.pack("!Ii", (types or {}).get(column, 25), -1)
+    return out
+
+
+def _begin(xid):
+    return b"B" + struct.pack("!QqI", 0, 0, xid)
+
+
+def _commit(end_lsn):
+    return b"C" + struct.pack("!BQQq", 0, end_lsn - 8, end_lsn, 0)
+
+
+def transaction(xid, end_lsn, *messages):
+    rows = [_begin(xid), *messages, _commit(end_lsn)]
+    return [(cdc.lsn_text(end_lsn), data) for data in rows]
+
+
+USERS = _relation(1, "users", ["id", "name", "bio"], ["id"])
+LOG = _relation(2, "log", ["msg"], [], identity=b"f")
+
+
+def test_pgoutput_changes_become_sql():
+    rows = transaction(
+        7,
+        0x1_0000_0100,
+        USERS,
+        b"I" + struct.pack("!I", 1) + b"N" + _tuple("1", "ann", None),
+        b"U" + struct.pack("!I", 1) + b"N" + _tuple("1", "bob", cdc.UNCHANGED),
+        b"U"
+        + struct.pack("!I", 1)
+        + b"K"
+        + _tuple("1", None, None)
+        + b"N"
+        + _tuple("2", "bob", "x"),
+        LOG,
+        b"D" + struct.pack("!I", 2) + b"O" + _tuple("hi"),
+        b"T" + struct.pack("!IB", 2, 0) + struct.pack("!II", 1, 2),
+    )
+
+    [tx] = cdc.PgOutputDecoder().decode(rows)
+
+    assert (tx.xid, tx.end_lsn) == (7, 0x1_0000_0100)
+    statements = [
+        (query.as_string(None), params)
+        for query, params in (
+            cdc.change_statement(change, "live") for change in tx.changes
+        )
+    ]
+    assert statements == [
+        (
+            'INSERT INTO "live"."users" ("id", "name", "bio") OVERRIDING SYSTEM VALUE '
+            'VALUES (%s, %s, %s) ON CONFLICT ("id") DO UPDATE SET '
+            '"name" = EXCLUDED."name", "bio" = EXCLUDED."bio"',
+            ["1", "ann", None],
+        ),
+        ('UPDATE "live"."users" SET "name" = %s WHERE "id" = %s', ["bob", "1"]),
+        (
+            'UPDATE "live"."users" SET "id" = %s, "name" = %s, "bio" = %s '
+            'WHERE "id" = %s',
+            ["2", "bob", "x", "1"],
+        ),
+        (
+            'DELETE FROM "live"."log" WHERE ctid = (SELECT ctid FROM "live"."log" '
+            'WHERE "msg" IS NOT DISTINCT FROM %s LIMIT 1)',
+            ["hi"],
+        ),
+        ('TRUNCATE "live"."users", "live"."log"', []),
+    ]
+
+
+def test_update_carrying_only_the_unchanged_key_sets_nothing():
+    # id is GENERATED ALWAYS AS IDENTITY and bio an unchanged TOASTed value:
+    # setting id again would fail.
+    docs = _relation(3, "docs", ["id", "bio"], ["id"])
+    update = b"U" + struct.pack("!I", 3) + b"N" + _tuple("1", cdc.UNCHANGED)
+    [tx] = cdc.PgOutputDecoder().decode(transaction(1, 200, docs, update))
+
+    assert cdc.change_statement(tx.changes[0], "live") is None
+    conn = MagicMock()
+    assert cdc.apply_transactions(conn, [tx], "live") == 0
+    assert conn.execute.call_count == 1
+
+
+def test_full_identity_matches_columns_without_equality_as_text():
+    shapes = _relation(
+        4,
+        "shapes",
+        ["at", "doc", "n"],
+        [],
+        identity=b"f",
+        types={"at": 600, "doc": 114},
+    )
+    delete = b"D" + struct.pack("!I", 4) + b"O" + _tuple("(1,2)", '{"a":1}', "3")
+    [tx] = cdc.PgOutputDecoder().decode(transaction(1, 200, shapes, delete))
+
+    query, params = cdc.change_statement(tx.changes[0], "live")
+
+    assert query.as_string(None) == (
+        'DELETE FROM "live"."shapes" WHERE ctid = (SELECT ctid FROM "live"."shapes" '
+        'WHERE "at"::text IS NOT DISTINCT FROM %s::text '
+        'AND "doc"::text IS NOT DISTINCT FROM %s::text '
+        'AND "n" IS NOT DISTINCT FROM %s LIMIT 1)'
+    )
+    assert params == ["(1,2)", '{"a":1}', "3"]
+
+
+def test_apply_runs_as_replica_so_target_triggers_do_not_fire():
+    insert = b"I" + struct.pack("!I", 1) + b"N" + _tuple("1", "ann", None)
+    txs = cdc.PgOutputDecoder().decode(transaction(1, 200, USERS, insert))
+    conn = MagicMock()
+
+    assert cdc.apply_transactions(conn, txs, "live") == 1
+
+    # Set before any change, for the batch's transaction only: the triggers
+    # (and foreign keys) of the live schema stay off while it is applied.
+    first, *changes = [c.args[0] for c in conn.execute.call_args_list]
+    assert first == "SET LOCAL session_replication_role = replica"
+    assert [q.as_string(None).split()[0] for q in changes] == ["INSERT"]
+
+
+@patch("supaneon_sync.backup.copy_sequences")
+@patch("supaneon_sync.backup.db")
+@patch("supaneon_sync.backup.cdc.advance_slot")
+@patch("supaneon_sync.backup.cdc.apply_transactions")
+@patch("supaneon_sync.backup.cdc.save_state")
+@patch("supaneon_sync.backup.cdc.peek_changes")
+@patch("supaneon_sync.backup.cdc.load_state")
+def test_sync_skips_applied_transactions_and_advances_the_slot(
+    mock_load, mock_peek, mock_save, mock_apply, mock_advance, mock_db, mock_seq
+):
+    insert = b"I" + struct.pack("!I", 1) + b"N" + _tuple("1", "ann", None)
+    mock_load.return_value = cdc.SyncState("s", "public", cdc.LIVE_SCHEMA, lsn=200)
+    mock_peek.return_value = transaction(1, 200, USERS, insert) + transaction(
+        2, 300, USERS, insert
+    )
+    mock_apply.side_effect = lambda conn, txs, schema: len(txs)
+
+    applied = backup.sync_stream("src", "neon", backup.SyncOptions(slot="s", once=True))
+
+    assert applied == 1
+    [applied_txs] = [c.args[1] for c in mock_apply.call_args_list]
+    assert [tx.xid for tx in applied_txs] == [2]
+    assert mock_save.call_args.args[1].lsn == 300
+    mock_advance.assert_called_once_with("src", "s", 300)
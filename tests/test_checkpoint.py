@@ -0,0 +1,102 @@
+from unittest.mock import patch
+
+from supaneon_sync import backup, checkpoint
+from supaneon_sync.checkpoint import Checkpoint, table_step
+
+DATA = [
+    b"SET statement_timeout = 0;\n",
+    b"COPY backup_x.users (id) FROM stdin;\n",
+    b"1\n",
+    b"\\.\n",
+    b'COPY backup_x."order items" (id) FROM stdin;\n',
+    b"2\n",
+    b"\\.\n",
+    b"SELECT pg_catalog.setval('backup_x.users_id_seq', 1, true);\n",
+]
+
+
+def test_resume_stage_wraps_copies_and_skips_loaded_tables():
+    cp = Checkpoint("neon", "backup_x", {table_step("users"): 1}, resumed=True)
+
+    out = b"".join(cp.resume_stage(DATA))
+
+    assert b"COPY backup_x.users" not in out
+    assert out.startswith(b"SET statement_timeout = 0;\nBEGIN;\nCOPY backup_x.")
+    assert (
+        b'2\n\\.\nINSERT INTO "supaneon_sync"."backup_checkpoint" '
+        b"(backup_schema, step, rows) VALUES ('backup_x', 'table:order items', NULL)"
+    ) in out
+    assert out.endswith(b"recorded_at = now();\nCOMMIT;\n" + DATA[-1])
+
+
+@patch("supaneon_sync.checkpoint.db")
+def test_mark_records_step_in_callers_transaction(mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    cp = Checkpoint("neon", "backup_x")
+
+    cp.mark(conn, table_step("users"), 5)
+
+    conn.execute.assert_called_once()
+    assert cp.done("table:users") and cp.rows("table:users") == 5
+    assert cp.steps("table:") == ["table:users"]
+    mock_db.connection.assert_not_called()
+
+
+@patch("supaneon_sync.backup.db")
+def test_list_backup_schemas_skips_unfinished_runs(mock_db):
+    cur = mock_db.connection.return_value.__enter__.return_value
+    cur = cur.cursor.return_value.__enter__.return_value
+    cur.fetchone.return_value = ("supaneon_sync.backup_runs",)
+    cur.fetchall.return_value = [("backup_a",)]
+
+    assert backup.list_backup_schemas("neon") == ["backup_a"]
+    query, params = cur.execute.call_args.args
+    assert "backup_runs" in query and params == (checkpoint.STATUS_RUNNING,)
+
+
+def test_companion_schema_tables_have_steps_of_their_own():
+    cp = Checkpoint("neon", "backup_x", {table_step("users"): 1}, resumed=True)
+    data = [
+        line.replace(b"backup_x.", b"backup_x__billing.") for line in DATA[1:4]
+    ] + DATA[1:4]
+
+    out = b"".join(cp.resume_stage(data))
+
+    assert out.startswith(b"BEGIN;\nCOPY backup_x__billing.users")
+    assert b"'table:backup_x__billing.users'" in out
+    assert b"COPY backup_x.users" not in out
+    assert cp.table_step("users", "backup_x") == "table:users"
+
+
+@patch("supaneon_sync.backup.db")
+def test_delete_schema_drops_companions(mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.return_value = [("backup_a__billing",)]
+
+    backup.delete_schema("neon", "backup_a")
+
+    assert cur.execute.call_args_list[0].args[1] == ("backup_a__",)
+    assert cur.execute.call_args.args[0] == (
+        'DROP SCHEMA IF EXISTS "backup_a", "backup_a__billing" CASCADE'
+    )
+
+
+@patch("supaneon_sync.backup._forget_backup")
+@patch("supaneon_sync.backup.incomplete_runs")
+def test_drop_abandoned_keeps_what_other_modes_can_resume(mock_runs, mock_forget):
+    runs = {
+        "copy": ["backup_1", "backup_3"],
+        "directory": ["backup_2", "backup_4"],
+        "legacy": ["backup_0"],
+    }
+    mock_runs.side_effect = lambda url, mode=None: (
+        sorted(sum(runs.values(), [])) if mode is None else runs.get(mode, [])
+    )
+
+    backup._drop_abandoned("neon", "backup_5", "copy")
+
+    # Every interrupted copy backup and the older directory one go; the newest
+    # directory backup is left for `--resume --mode directory`.
+    dropped = [c.args[1] for c in mock_forget.call_args_list]
+    assert dropped == ["backup_0", "backup_1", "backup_2", "backup_3"]
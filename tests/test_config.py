@@ -1,6 +1,7 @@
 import pytest
 
-from supaneon_sync.config import validate_env
+from supaneon_sync.config import load_projects, validate_env
+from supaneon_sync.exceptions import ConfigError
 
 
 def test_validate_env_missing(monkeypatch):
@@ -30,3 +31,44 @@ def test_validate_env_ok(monkeypatch):
     assert cfg.supabase_database_url.startswith("postgres")
     assert cfg.supabase_database_url.endswith("sslmode=require")
     assert cfg.neon_database_url.endswith("sslmode=require")
+
+
+def test_load_projects(tmp_path, monkeypatch):
+    monkeypatch.setenv("B_SUPABASE", "postgres://b@sb/db?sslmode=require")
+    path = tmp_path / "projects.toml"
+    path.write_text("""
+[defaults]
+mode = "copy"
+keep = 3
+
+[[project]]
+name = "a"
+supabase_url = "postgres://a@sb/db?sslmode=require"
+neon_url = "postgres://a@neon/db?sslmode=require"
+keep = 0
+
+[[project]]
+name = "b"
+supabase_url_env = "B_SUPABASE"
+neon_url = "postgres://b@neon/db?sslmode=require"
+""")
+
+    a, b = load_projects(str(path))
+
+    assert a.overrides == {"mode": "copy", "keep": 0}
+    assert b.supabase_database_url == "postgres://b@sb/db?sslmode=require"
+    assert b.overrides == {"mode": "copy", "keep": 3}
+
+    path.write_text(path.read_text().replace("b@neon", "a@neon"))
+    with pytest.raises(ConfigError, match="a, b share a Neon database"):
+        load_projects(str(path))
+
+    # Every project would branch the same Neon project.
+    path.write_text(path.read_text().replace('mode = "copy"', 'mode = "branch"'))
+    with pytest.raises(ConfigError, match="project a: 'branch' mode backs up a single"):
+        load_projects(str(path))
+    path.write_text(path.read_text().replace('mode = "branch"', 'mode = "copy"'))
+
+    monkeypatch.delenv("B_SUPABASE")
+    with pytest.raises(ConfigError, match="B_SUPABASE is not set"):
+        load_projects(str(path))
@@ -0,0 +1,174 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from supaneon_sync import copier
+from supaneon_sync.filters import TableFilter, plan_selection
+
+
+def _executed(mock_conn):
+    return [c.args[0] for c in mock_conn.execute.call_args_list]
+
+
+@patch("supaneon_sync.copier.copy_table")
+@patch("supaneon_sync.copier.db")
+def test_copy_tables_shares_exported_snapshot(mock_db, mock_copy_table):
+    coord = mock_db.connection.return_value.__enter__.return_value
+    coord.execute.return_value.fetchall.return_value = [("big",), ("small",)]
+    coord.execute.return_value.fetchone.return_value = ("00000003-0000001B-1",)
+    mock_copy_table.side_effect = lambda src, dst, table, *a: copier.TableCopyResult(
+        table, 10, 100
+    )
+
+    results = copier.copy_tables("src", "dst", "backup_x", workers=2)
+
+    assert sorted(r.table for r in results) == ["big", "small"]
+    snapshots = {c.args[5] for c in mock_copy_table.call_args_list}
+    assert snapshots == {"00000003-0000001B-1"}
+    assert coord.isolation_level == copier.psycopg.IsolationLevel.REPEATABLE_READ
+
+
+@patch("supaneon_sync.copier.copy_table")
+@patch("supaneon_sync.copier.db")
+def test_copy_tables_propagates_first_failure(mock_db, mock_copy_table):
+    coord = mock_db.connection.return_value.__enter__.return_value
+    coord.execute.return_value.fetchall.return_value = [("a",), ("b",)]
+    coord.execute.return_value.fetchone.return_value = ("snap",)
+    mock_copy_table.side_effect = RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        copier.copy_tables("src", "dst", "backup_x", workers=2)
+
+
+@patch("supaneon_sync.copier.db")
+def test_copy_table_streams_chunks_under_snapshot(mock_db):
+    src, dst = MagicMock(), MagicMock()
+    mock_db.connection.return_value.__enter__.side_effect = [src, dst]
+
+    scur = src.cursor.return_value.__enter__.return_value
+    dcur = dst.cursor.return_value.__enter__.return_value
+    cin = scur.copy.return_value.__enter__.return_value
+    cin.__iter__.return_value = iter([b"1\tfoo\n", b"2\tbar\n"])
+    cout = dcur.copy.return_value.__enter__.return_value
+    dcur.rowcount = 2
+
+    result = copier.copy_table("src", "dst", "users", "backup_x", snapshot="snap")
+
+    assert (result.table, result.rows, result.bytes) == ("users", 2, 12)
+    # Rows are packed into the ring's slots before they are written.
+    assert [bytes(c.args[0]) for c in cout.write.call_args_list] == [
+        b"1\tfoo\n2\tbar\n"
+    ]
+    assert "SET TRANSACTION SNAPSHOT" in _executed(src)[0].as_string(None)
+    dst.commit.assert_called_once()
+
+
+def test_page_ranges_cover_the_table_with_open_ends():
+    ranges = copier.page_ranges(10, 3)
+
+    assert ranges == [
+        copier.PageRange(None, 4),
+        copier.PageRange(4, 8),
+        copier.PageRange(8, None),
+    ]
+    assert ranges[1].condition().as_string(None) == (
+        "ctid >= '(4,0)'::tid AND ctid < '(8,0)'::tid"
+    )
+
+
+@patch("supaneon_sync.copier.split_tables")
+@patch("supaneon_sync.copier.copy_table")
+@patch("supaneon_sync.copier.db")
+def test_copy_tables_copies_large_tables_in_ranges(
+    mock_db, mock_copy_table, mock_split
+):
+    coord = mock_db.connection.return_value.__enter__.return_value
+    coord.execute.return_value.fetchall.return_value = [("big",), ("small",)]
+    coord.execute.return_value.fetchone.return_value = ("snap",)
+    mock_split.return_value = {"big": copier.page_ranges(10, 2)}
+    mock_copy_table.side_effect = lambda src, dst, table, *a: copier.TableCopyResult(
+        table, 10, 100
+    )
+    checkpoint = MagicMock(resumed=True)
+    checkpoint.done.return_value = False
+
+    results = copier.copy_tables(
+        "src", "dst", "backup_x", checkpoint=checkpoint, split_bytes=1
+    )
+
+    assert sorted((r.table, r.rows) for r in results) == [("big", 20), ("small", 10)]
+    pages = {(c.args[2], c.args[7]) for c in mock_copy_table.call_args_list}
+    assert pages == {
+        ("big", copier.PageRange(None, 5)),
+        ("big", copier.PageRange(5, None)),
+        ("small", None),
+    }
+    checkpoint.mark_now.assert_called_once_with(checkpoint.table_step.return_value, 20)
+    assert 'TRUNCATE "backup_x"."big"' in [
+        q.as_string(None) for q in _executed(coord) if not isinstance(q, str)
+    ]
+
+
+@patch("supaneon_sync.copier.copy_table")
+@patch("supaneon_sync.copier.db")
+def test_binary_copy_falls_back_to_text_for_unportable_tables(mock_db, mock_copy_table):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    conn.info.server_version = 170002
+    conn.execute.return_value.fetchall.side_effect = [
+        [("plain",), ("tagged",)],
+        [("tagged",)],
+    ]
+    conn.execute.return_value.fetchone.return_value = ("snap",)
+    mock_copy_table.side_effect = lambda src, dst, table, *a: copier.TableCopyResult(
+        table, 1, 10
+    )
+
+    copier.copy_tables("src", "dst", "backup_x", copy_format="binary")
+
+    binary = {c.args[2]: c.args[8] for c in mock_copy_table.call_args_list}
+    assert binary == {"plain": True, "tagged": False}
+
+
+@patch("supaneon_sync.copier.db")
+def test_copy_table_binary_format(mock_db):
+    src, dst = MagicMock(), MagicMock()
+    mock_db.connection.return_value.__enter__.side_effect = [src, dst]
+    scur = src.cursor.return_value.__enter__.return_value
+    dcur = dst.cursor.return_value.__enter__.return_value
+    scur.copy.return_value.__enter__.return_value.__iter__.return_value = iter(
+        [b"PGCOPY\n\xff\r\n\x00"]
+    )
+
+    copier.copy_table("src", "dst", "users", "backup_x", binary=True)
+
+    assert scur.copy.call_args.args[0].as_string(None) == (
+        'COPY "public"."users" TO STDOUT (FORMAT binary)'
+    )
+    assert dcur.copy.call_args.args[0].as_string(None) == (
+        'COPY "backup_x"."users" FROM STDIN (FORMAT binary)'
+    )
+
+
+@patch("supaneon_sync.copier.db")
+def test_copy_sequences_skips_sequences_of_excluded_tables(mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    # events.id is an identity column; its table is filtered out.
+    conn.execute.return_value.fetchall.return_value = [
+        ("users_id_seq", 42, "public", "users"),
+        ("events_id_seq", 900, "public", "events"),
+        ("invoice_numbers", 7, None, None),
+    ]
+    conn.connection = None
+    selection = plan_selection(
+        TableFilter(exclude=["events"]),
+        {("public", "users"): 10, ("public", "events"): 300},
+    )
+
+    copied = copier.copy_sequences("src", "dst", "backup_x", "public", selection)
+
+    assert copied == 2
+    setval = [c.args[1] for c in conn.execute.call_args_list if "setval" in c.args[0]]
+    assert setval == [
+        ('"backup_x"."users_id_seq"', 42),
+        ('"backup_x"."invoice_numbers"', 7),
+    ]
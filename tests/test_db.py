@@ -0,0 +1,31 @@
+from unittest.mock import MagicMock, patch
+
+from supaneon_sync import db
+
+
+@patch("supaneon_sync.db.ConnectionPool")
+def test_get_pool_reuses_and_grows_pool_per_url(mock_pool_cls):
+    pool = mock_pool_cls.return_value
+    pool.min_size, pool.max_size = 1, db.DEFAULT_POOL_SIZE
+    try:
+        assert db.get_pool("postgres://neon") is pool
+        assert db.get_pool("postgres://neon", max_size=2) is pool
+        db.get_pool("postgres://neon", max_size=9)
+    finally:
+        db._pools.clear()
+
+    mock_pool_cls.assert_called_once()
+    pool.open.assert_called_once_with(wait=False)
+    pool.resize.assert_called_once_with(1, 9)
+
+
+def test_reset_restores_connection_defaults():
+    conn = MagicMock()
+    conn.autocommit = True
+    conn.read_only = True
+
+    db._reset(conn)
+
+    assert conn.autocommit is False
+    assert conn.isolation_level is None
+    assert conn.read_only is None
@@ -0,0 +1,90 @@
+from unittest.mock import MagicMock, patch
+
+from supaneon_sync import backup, directory
+from supaneon_sync.copier import TableCopyResult
+
+TOC = """\
+;
+; Archive created at 2026-01-01 00:00:00 UTC
+;
+215; 1259 16390 TABLE public users postgres
+3344; 0 16390 TABLE DATA public users postgres
+3345; 0 16401 TABLE DATA public order items postgres
+3100; 2606 16410 CONSTRAINT public users users_pkey postgres
+"""
+
+
+def test_parse_toc_keeps_only_table_data():
+    entries = directory.parse_toc(TOC.splitlines())
+
+    assert entries == [
+        directory.TocEntry(3344, "public", "users"),
+        directory.TocEntry(3345, "public", "order items"),
+    ]
+
+
+@patch("supaneon_sync.directory.load_table_data")
+@patch("supaneon_sync.directory.read_toc")
+def test_load_directory_wraps_data_in_sections(mock_read_toc, mock_load):
+    mock_read_toc.return_value = directory.parse_toc(TOC.splitlines())
+    events = []
+    mock_load.side_effect = lambda url, d, entry, schema, checkpoint: (
+        events.append(("data", entry.name)) or TableCopyResult(entry.name, 1, 1)
+    )
+
+    results = directory.load_directory(
+        "neon",
+        "/tmp/dump",
+        "backup_x",
+        jobs=1,
+        apply_section=lambda cmd: events.append(("ddl", cmd[1])),
+    )
+
+    assert events == [
+        ("ddl", "--section=pre-data"),
+        ("data", "users"),
+        ("data", "order items"),
+        ("ddl", "--section=post-data"),
+    ]
+    assert len(results) == 2
+
+
+def test_load_table_data_reads_data_file(tmp_path):
+    (tmp_path / "3344.dat").write_bytes(b"1\tfoo\n2\tbar\n")
+    entry = directory.TocEntry(3344, "public", "users")
+
+    with patch("supaneon_sync.directory.db") as mock_db:
+        conn = mock_db.connection.return_value.__enter__.return_value
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.rowcount = 2
+        cout = cur.copy.return_value.__enter__.return_value
+
+        result = directory.load_table_data("neon", str(tmp_path), entry, "backup_x")
+
+    assert result == TableCopyResult("users", 2, 12)
+    cout.write.assert_called_once_with(b"1\tfoo\n2\tbar\n")
+
+
+@patch("supaneon_sync.copier.db")
+@patch("supaneon_sync.backup.load_directory", return_value=[])
+@patch("supaneon_sync.backup.dump_directory")
+def test_directory_backup_carries_sequence_positions(mock_dump, mock_load, mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    conn.execute.return_value.fetchall.return_value = [
+        ("users_id_seq", 42, "public", "users")
+    ]
+    # Quote identifiers without a live connection.
+    conn.connection = None
+    job = backup.BackupJob(
+        "src",
+        "neon",
+        "backup_x",
+        backup.BackupOptions(mode="directory"),
+        MagicMock(),
+        MagicMock(),
+    )
+
+    backup._run_directory(job)
+
+    setval = [c.args for c in conn.execute.call_args_list if "setval" in c.args[0]]
+    assert [params for _, params in setval] == [('"backup_x"."users_id_seq"', 42)]
@@ -0,0 +1,61 @@
+from supaneon_sync.filters import TableFilter, plan_selection
+
+SIZES = {
+    ("public", "users"): 10,
+    ("public", "plans"): 1,
+    ("public", "orders"): 500,
+    ("public", "events"): 300,
+    ("public", "sessions"): 900,
+    ("public", "audit_log"): 5_000,
+    ("billing", "invoices"): 200,
+}
+
+
+def test_selection_orders_filters_and_budgets_tables():
+    table_filter = TableFilter(
+        exclude=["audit_*"],
+        exclude_data=["sessions"],
+        first=["users", "plans", "billing.*"],
+        last=["events"],
+        budget_bytes=600,
+    )
+
+    selection = plan_selection(
+        table_filter, SIZES, views=[("public", "audit_view"), ("public", "v")]
+    )
+
+    assert selection.excluded == [("public", "audit_log"), ("public", "audit_view")]
+    assert selection.data_excluded == [("public", "sessions")]
+    # users, plans and invoices first; then the rest largest first, while
+    # the budget lasts.
+    assert selection.order == [
+        ("public", "users"),
+        ("public", "plans"),
+        ("billing", "invoices"),
+        ("public", "events"),
+    ]
+    assert selection.over_budget == [("public", "orders")]
+    assert selection.copies("public", "users")
+    assert not selection.copies("public", "orders")
+    # Tables the selection has not seen are judged by the patterns.
+    assert selection.copies("public", "new_table")
+    assert not selection.copies("public", "audit_new")
+    assert selection.dump_flags() == [
+        "--exclude-table=public.audit_log",
+        "--exclude-table=public.audit_view",
+        "--exclude-table-data=public.sessions",
+        "--exclude-table-data=public.orders",
+    ]
+
+
+def test_include_patterns_leave_out_everything_else():
+    selection = plan_selection(
+        TableFilter(include=["users", "billing.*"]),
+        SIZES,
+        views=[("public", "v")],
+    )
+
+    assert selection.order == [("billing", "invoices"), ("public", "users")]
+    assert ("public", "orders") in selection.excluded
+    assert ("public", "v") in selection.excluded
+    assert selection.over_budget == []
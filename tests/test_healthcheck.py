@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+from supaneon_sync import healthcheck
+
+
+def _cursor(mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    return conn.cursor.return_value.__enter__.return_value
+
+
+@patch("supaneon_sync.healthcheck.db")
+def test_exact_check_counts_every_listed_table(mock_db):
+    cur = _cursor(mock_db)
+    cur.fetchall.return_value = [("users",), ("orders",)]
+    cur.fetchone.side_effect = [(3,), (0,)]
+
+    report = healthcheck.run_healthcheck("neon", schema="backup_x")
+
+    # The first table is no longer swallowed by a stray fetchone().
+    assert report.rows == {"users": 3, "orders": 0}
+    assert report.exact == {"users", "orders"}
+
+
+@patch("supaneon_sync.healthcheck._exact_count")
+@patch("supaneon_sync.healthcheck.db")
+def test_fast_check_uses_estimates_and_samples_exact_counts(mock_db, mock_count):
+    cur = _cursor(mock_db)
+    tables = [(f"t{i}",) for i in range(10)]
+    estimates = [(f"t{i}", 100) for i in range(10)]
+    cur.fetchall.side_effect = [tables, estimates]
+    mock_count.side_effect = lambda url, schema, table, deadline: (
+        None if table == "t0" else 101
+    )
+
+    report = healthcheck.run_healthcheck(
+        "neon", schema="backup_x", fast=True, sample=10, budget=5
+    )
+
+    analyze = cur.execute.call_args_list[1].args[0].as_string(None)
+    assert analyze.startswith('ANALYZE "backup_x"."t0"')
+    assert report.skipped == ["t0"]
+    assert report.exact == {f"t{i}" for i in range(1, 10)}
+    assert report.rows["t0"] == 100 and report.rows["t1"] == 101
+    assert report.total_rows == 100 + 9 * 101
+
+
+@patch("supaneon_sync.healthcheck.db")
+def test_sample_is_deterministic_per_schema(mock_db):
+    tables = [f"t{i}" for i in range(50)]
+    with patch("supaneon_sync.healthcheck._exact_counts") as mock_counts:
+        mock_counts.return_value = ({}, [])
+        for _ in range(2):
+            cur = _cursor(mock_db)
+            cur.fetchall.side_effect = [
+                [(t,) for t in tables],
+                [(t, 1) for t in tables],
+            ]
+            healthcheck.run_healthcheck("neon", schema="backup_x", fast=True, sample=5)
+    first, second = (c.args[2] for c in mock_counts.call_args_list)
+    assert first == second and len(first) == 5
@@ -0,0 +1,136 @@
+from unittest.mock import patch
+
+import pytest
+
+from supaneon_sync import backup, incremental
+from supaneon_sync.backup import BackupOptions
+from supaneon_sync.exceptions import BackupError
+from supaneon_sync.manifest import ManifestEntry
+
+LAYOUT = {"users": [("id", "uuid")], "events": [("id", "bigint")]}
+
+
+def _entry(table, fingerprint):
+    return ManifestEntry(table, "copied", "public", fingerprint, 1)
+
+
+@patch("supaneon_sync.incremental._rows_unchanged", return_value=True)
+@patch("supaneon_sync.incremental.run_watermark", return_value=700)
+@patch("supaneon_sync.incremental.db")
+@patch("supaneon_sync.incremental._column_layout")
+@patch("supaneon_sync.incremental.load_manifest")
+@patch("supaneon_sync.incremental.table_fingerprints")
+def test_plan_clones_only_unchanged_tables(
+    mock_fp, mock_manifest, mock_layout, mock_db, mock_watermark, mock_rows
+):
+    mock_fp.return_value = {"users": "10:0:0:1", "events": "99:0:0:2"}
+    mock_manifest.return_value = {
+        "users": _entry("users", "10:0:0:1"),
+        "events": _entry("events", "98:0:0:2"),
+    }
+    mock_layout.return_value = LAYOUT
+
+    plan = incremental.plan_incremental("src", "neon", "backup_new", "backup_old")
+
+    assert plan.unchanged == ["users"]
+    assert plan.changed == {"events"}
+    mock_rows.assert_called_once_with(
+        mock_db.connection.return_value.__enter__.return_value,
+        "public",
+        "users",
+        700,
+        1,
+    )
+
+
+@patch("supaneon_sync.incremental.run_watermark", return_value=700)
+@patch("supaneon_sync.incremental.db")
+@patch("supaneon_sync.incremental._column_layout")
+@patch("supaneon_sync.incremental.load_manifest")
+@patch("supaneon_sync.incremental.table_fingerprints")
+def test_plan_copies_tables_whose_columns_changed(
+    mock_fp, mock_manifest, mock_layout, mock_db, mock_watermark
+):
+    mock_fp.return_value = {"users": "10:0:0:1"}
+    mock_manifest.return_value = {"users": _entry("users", "10:0:0:1")}
+    mock_layout.side_effect = [
+        {"users": [("id", "uuid")]},
+        {"users": [("id", "uuid"), ("email", "text")]},
+    ]
+
+    plan = incremental.plan_incremental("src", "neon", "backup_new", "backup_old")
+
+    assert plan.unchanged == []
+    assert plan.changed == {"users"}
+
+
+@patch("supaneon_sync.incremental.run_watermark", return_value=700)
+@patch("supaneon_sync.incremental.db")
+@patch("supaneon_sync.incremental.load_manifest")
+@patch("supaneon_sync.incremental.table_fingerprints")
+def test_plan_without_previous_manifest_copies_everything(
+    mock_fp, mock_manifest, mock_db, mock_watermark
+):
+    mock_fp.return_value = {"users": "1:0:0:1"}
+    mock_manifest.return_value = {}
+
+    plan = incremental.plan_incremental("src", "neon", "backup_new", "backup_old")
+
+    assert plan.changed == {"users"}
+
+
+@patch("supaneon_sync.incremental.run_watermark")
+@patch("supaneon_sync.incremental.db")
+@patch("supaneon_sync.incremental._column_layout")
+@patch("supaneon_sync.incremental.load_manifest")
+@patch("supaneon_sync.incremental.table_fingerprints")
+def test_plan_copies_tables_whose_rows_changed_behind_the_statistics(
+    mock_fp, mock_manifest, mock_layout, mock_db, mock_watermark
+):
+    # The counters were reset, or not flushed yet: the fingerprint matches.
+    mock_fp.return_value = {"users": "10:0:0:1", "events": "5:0:0:2"}
+    mock_manifest.return_value = {
+        "users": _entry("users", "10:0:0:1"),
+        "events": _entry("events", "5:0:0:2"),
+    }
+    mock_layout.return_value = LAYOUT
+    mock_watermark.return_value = 2**32 + 700
+    conn = mock_db.connection.return_value.__enter__.return_value
+    # This run's watermark, then (age of the previous one, rows, any row
+    # newer than it) for users and events.
+    conn.execute.return_value.fetchone.side_effect = [
+        (2**32 + 900,),
+        (30, 1, True),
+        (30, 2, False),
+    ]
+
+    plan = incremental.plan_incremental("src", "neon", "backup_new", "backup_old")
+
+    assert plan.unchanged == []
+    assert plan.changed == {"users", "events"}
+    assert plan.watermark == 2**32 + 900
+    # Row xmins are 32-bit, so the watermark loses its epoch.
+    assert conn.execute.call_args.args[1] == ("700", "700")
+
+
+@patch("supaneon_sync.incremental.run_watermark", return_value=None)
+@patch("supaneon_sync.incremental.db")
+@patch("supaneon_sync.incremental._column_layout")
+@patch("supaneon_sync.incremental.load_manifest")
+@patch("supaneon_sync.incremental.table_fingerprints")
+def test_plan_without_previous_watermark_copies_everything(
+    mock_fp, mock_manifest, mock_layout, mock_db, mock_watermark
+):
+    mock_fp.return_value = {"users": "10:0:0:1"}
+    mock_manifest.return_value = {"users": _entry("users", "10:0:0:1")}
+    mock_layout.return_value = LAYOUT
+
+    plan = incremental.plan_incremental("src", "neon", "backup_new", "backup_old")
+
+    assert plan.changed == {"users"}
+
+
+@pytest.mark.parametrize("mode", ["plain", "stream", "directory", "async", "branch"])
+def test_incremental_is_rejected_outside_copy_mode(mode):
+    with pytest.raises(BackupError, match="--incremental requires mode 'copy'"):
+        backup.run("src", "neon", BackupOptions(mode=mode, incremental=True))
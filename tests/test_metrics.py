@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from supaneon_sync import metrics
+
+
+def test_phases_are_written_as_json_lines(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    run = metrics.RunMetrics("stream", "backup_x", str(path))
+
+    with run.phase("stream_data") as m:
+        list(metrics.count_bytes([b"abc\n", b"de\n"], m, "in"))
+        m.rows = 2
+    with pytest.raises(RuntimeError):
+        with run.phase("restore_data"):
+            raise RuntimeError("psql failed")
+    run.finish(ok=False)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["event"] for r in records] == ["phase", "phase", "run"]
+    assert records[0]["phase"] == "stream_data"
+    assert records[0]["bytes_in"] == 7 and records[0]["rows"] == 2
+    assert records[0]["ok"] is True and records[1]["ok"] is False
+    assert records[2]["ok"] is False and records[2]["bytes_in"] == 7
+    assert records[0]["peak_rss_bytes"] > 0
+
+
+def test_prometheus_textfile(tmp_path):
+    run = metrics.RunMetrics("copy", "backup_x")
+    with run.phase("copy") as m:
+        m.rows = 42
+    run.finish(ok=True)
+
+    path = tmp_path / "supaneon.prom"
+    run.write_prometheus(str(path))
+    text = path.read_text()
+
+    assert "# TYPE supaneon_backup_phase_rows gauge" in text
+    assert 'supaneon_backup_phase_rows{mode="copy",phase="copy"} 42' in text
+    assert 'supaneon_backup_success{mode="copy"} 1' in text
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_prometheus_escapes_label_values():
+    run = metrics.RunMetrics('co"py', "backup_x")
+    with run.phase("C:\\dump\nretry"):
+        pass
+    run.finish(ok=True)
+
+    text = run.prometheus_text()
+
+    assert 'supaneon_backup_success{mode="co\\"py"} 1' in text
+    assert 'phase="C:\\\\dump\\nretry"' in text
+    assert all(line.count("{") <= 1 for line in text.splitlines())
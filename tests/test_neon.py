@@ -0,0 +1,56 @@
+import pytest
+
+from supaneon_sync import neon
+
+
+def test_list_branches_follows_pages_and_is_cached(fake_neon, neon_api, monkeypatch):
+    monkeypatch.setattr(neon, "PAGE_LIMIT", 2)
+    for i in range(4):
+        fake_neon.branches[f"br-x{i}"] = {"id": f"br-x{i}", "name": f"backup-{i}"}
+
+    assert len(neon_api.list_branches()) == 5
+    listed = [r for r in fake_neon.requests if r[0] == "GET"]
+    assert len(listed) == 3
+
+    neon_api.list_branches()
+    assert len([r for r in fake_neon.requests if r[0] == "GET"]) == 3
+
+    # Creating a branch drops the cached list.
+    created = neon_api.create_branch("backup-9")
+    assert created.name in [b.name for b in neon_api.list_branches()]
+    assert neon_api.list_branches(refresh=True) == neon_api.list_branches()
+
+
+def test_branch_changes_wait_for_their_operations(fake_neon, neon_api):
+    fake_neon.operation_polls = 3
+
+    branch = neon_api.create_branch("backup-1")
+
+    polls = [r for r in fake_neon.requests if "/operations/" in r[1]]
+    assert len(polls) == 4
+    assert fake_neon.operations["op-1"]["status"] == "finished"
+
+    fake_neon.operation_status = "failed"
+    with pytest.raises(RuntimeError, match=r"\(delete_timeline\) failed"):
+        neon_api.delete_branch(branch.id)
+
+    neon_api.max_poll_interval = neon_api.operation_timeout = 0.01
+    fake_neon.operation_polls = 1000
+    with pytest.raises(TimeoutError):
+        neon_api.create_branch("backup-2")
+
+
+def test_branch_hosts_are_resolved_concurrently_and_cached(fake_neon, neon_api):
+    for i in range(5):
+        fake_neon.endpoints[f"br-{i}"] = [
+            {"type": "read_only", "host": f"ep-ro-{i}"},
+            {"type": "read_write", "host": f"ep-{i}"},
+        ]
+
+    hosts = neon_api.get_branch_hosts([f"br-{i}" for i in range(6)], workers=3)
+
+    assert hosts == {**{f"br-{i}": f"ep-{i}" for i in range(5)}, "br-5": None}
+    assert neon_api.get_branch_host("br-0") == "ep-0"
+    assert len([r for r in fake_neon.requests if r[1].endswith("/endpoints")]) == 6
+    with pytest.raises(RuntimeError, match="No endpoints"):
+        neon_api.get_branch_host("br-5")
@@ -0,0 +1,74 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from supaneon_sync.orchestrator import Dag, read_command
+
+
+def test_dag_respects_dependencies_and_limit():
+    events = []
+    running = 0
+    peak = 0
+
+    async def task(name):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        events.append(("start", name))
+        await asyncio.sleep(0.01)
+        events.append(("end", name))
+        running -= 1
+        return name.upper()
+
+    dag = Dag()
+    dag.add("schema", lambda: task("schema"))
+    copies = [
+        dag.add(f"copy{i}", lambda i=i: task(f"copy{i}"), after=["schema"])
+        for i in range(4)
+    ]
+    dag.add("post", lambda: task("post"), after=copies)
+
+    results = asyncio.run(dag.run(limit=2))
+
+    assert results["post"] == "POST"
+    assert peak == 2
+    assert events[:2] == [("start", "schema"), ("end", "schema")]
+    assert events[-2:] == [("start", "post"), ("end", "post")]
+
+
+def test_dag_cancels_everything_on_first_failure():
+    cancelled = []
+
+    async def slow(name):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise subprocess.CalledProcessError(1, "pg_dump")
+
+    dag = Dag()
+    dag.add("slow", lambda: slow("slow"))
+    dag.add("fail", fail)
+    dag.add("after", lambda: slow("after"), after=["fail"])
+
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(dag.run(limit=4))
+    assert cancelled == ["slow"]
+
+    with pytest.raises(ValueError, match="unknown missing"):
+        dag.add("x", fail, after=["missing"])
+
+
+def test_read_command_raises_on_failure():
+    out = asyncio.run(read_command([sys.executable, "-c", "print('hi')"]))
+    assert out == b"hi\n"
+
+    with pytest.raises(subprocess.CalledProcessError) as exc:
+        asyncio.run(read_command([sys.executable, "-c", "import sys; sys.exit(3)"]))
+    assert exc.value.returncode == 3
@@ -0,0 +1,149 @@
+from unittest.mock import patch
+
+import psycopg
+import pytest
+
+from supaneon_sync import postdata
+from supaneon_sync.checkpoint import Checkpoint, post_data_step
+from supaneon_sync.exceptions import BackupError
+
+POST_DATA = b"""--
+-- PostgreSQL database dump
+--
+
+SET statement_timeout = 0;
+SET client_encoding = 'UTF8';
+SELECT pg_catalog.set_config('search_path', '', false);
+
+SET default_tablespace = '';
+
+--
+-- Name: users users_pkey; Type: CONSTRAINT; Schema: backup_x; Owner: -
+--
+
+ALTER TABLE ONLY backup_x.users
+    ADD CONSTRAINT users_pkey PRIMARY KEY (id);
+
+
+--
+-- Name: users_email_idx; Type: INDEX; Schema: backup_x; Owner: -
+--
+
+CREATE INDEX users_email_idx ON backup_x.users USING btree (email);
+
+
+--
+-- Name: orders orders_user_id_fkey; Type: FK CONSTRAINT; Schema: backup_x; Owner: -
+--
+
+ALTER TABLE ONLY backup_x.orders
+    ADD CONSTRAINT orders_user_id_fkey FOREIGN KEY (user_id) REFERENCES backup_x.users(id);
+
+
+--
+-- Name: users; Type: ROW SECURITY; Schema: backup_x; Owner: -
+--
+
+--
+-- Name: stats; Type: MATERIALIZED VIEW DATA; Schema: backup_x; Owner: -
+--
+
+REFRESH MATERIALIZED VIEW backup_x.stats;
+
+
+--
+-- Name: INDEX users_email_idx; Type: COMMENT; Schema: backup_x; Owner: -
+--
+
+COMMENT ON INDEX backup_x.users_email_idx IS '-- not a header;
+-- Name: x; Type: INDEX; Schema: y';
+
+
+--
+-- PostgreSQL database dump complete
+--
+"""
+
+
+def test_parse_splits_entries_and_localizes_settings():
+    script = postdata.parse_post_data(POST_DATA.splitlines(keepends=True))
+
+    assert script.settings == [
+        b"SET LOCAL statement_timeout = 0;\n",
+        b"SELECT pg_catalog.set_config('search_path', '', true);\n",
+        b"SET LOCAL default_tablespace = '';\n",
+    ]
+    # The policy-less ROW SECURITY entry is dropped; the comment keeps the
+    # header-like lines inside its string literal.
+    assert [(e.kind, e.name) for e in script.entries] == [
+        ("CONSTRAINT", "users users_pkey"),
+        ("INDEX", "users_email_idx"),
+        ("FK CONSTRAINT", "orders orders_user_id_fkey"),
+        ("MATERIALIZED VIEW DATA", "stats"),
+        ("COMMENT", "INDEX users_email_idx"),
+    ]
+    assert script.entries[-1].sql.count(b"\n") == 2
+
+    waves = [
+        ([e.name for e in entries], parallel) for entries, parallel in script.waves()
+    ]
+    assert waves == [
+        (["users users_pkey", "users_email_idx"], True),
+        (["orders orders_user_id_fkey"], True),
+        (["INDEX users_email_idx"], True),
+        (["stats"], False),
+    ]
+
+
+@patch("supaneon_sync.postdata.db")
+def test_apply_runs_each_entry_in_a_transaction(mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+
+    created = postdata.apply_post_data(
+        "neon", POST_DATA.splitlines(keepends=True), workers=1
+    )
+
+    assert created == 5
+    mock_db.get_pool.assert_called_once_with("neon", max_size=1)
+    assert conn.transaction.call_count == 5
+    statements = [c.args[0] for c in conn.execute.call_args_list]
+    assert statements[0].startswith(b"SET LOCAL statement_timeout")
+    # Foreign keys only after every index and constraint.
+    bodies = statements[1::2]
+    assert b"PRIMARY KEY" in bodies[0] and b"FOREIGN KEY" in bodies[2]
+
+
+@patch("supaneon_sync.postdata.db")
+def test_apply_retries_deadlocks_and_names_failures(mock_db):
+    conn = mock_db.connection.return_value.__enter__.return_value
+    entry = postdata.PostDataEntry("orders orders_fkey", "FK CONSTRAINT", b"ALTER;")
+
+    conn.execute.side_effect = [psycopg.errors.DeadlockDetected(), None]
+    postdata.apply_entry("neon", b"", entry)
+    assert conn.execute.call_count == 2
+
+    conn.execute.side_effect = psycopg.errors.UndefinedTable("no such table")
+    with pytest.raises(BackupError, match="fk constraint orders orders_fkey"):
+        postdata._apply_or_raise("neon", b"", entry)
+
+
+def test_resume_tells_same_named_objects_in_different_schemas_apart():
+    lines = [
+        b"-- Name: users users_pkey; Type: CONSTRAINT; Schema: backup_x; Owner: -\n",
+        b"ALTER TABLE backup_x.users ADD PRIMARY KEY (id);\n",
+        b"-- Name: users users_pkey; Type: CONSTRAINT; Schema: backup_x__billing; Owner: -\n",
+        b"ALTER TABLE backup_x__billing.users ADD PRIMARY KEY (id);\n",
+    ]
+    first, second = postdata.parse_post_data(lines).entries
+    assert post_data_step(first.kind, first.name, first.schema) != post_data_step(
+        second.kind, second.name, second.schema
+    )
+
+    done = {post_data_step(first.kind, first.name, first.schema): 1}
+    cp = Checkpoint("neon", "backup_x", done, resumed=True)
+    with patch("supaneon_sync.postdata.db") as mock_db:
+        conn = mock_db.connection.return_value.__enter__.return_value
+        created = postdata.apply_post_data("neon", lines, workers=1, checkpoint=cp)
+
+    assert created == 1
+    assert b"backup_x__billing.users" in conn.execute.call_args_list[0].args[0]
@@ -0,0 +1,227 @@
+import re
+
+from supaneon_sync.backup import remap_data_file, remap_schema_file, target_schemas
+from supaneon_sync.remap import Remapper, remap_file
+
+
+def legacy_remap_schema_line(line: str, new_schema: str) -> str | None:
+    """The per-line regex chain the engine replaced, kept as an oracle."""
+    skip_prefixes = (
+        "GRANT ",
+        "REVOKE ",
+        "ALTER DEFAULT PRIVILEGES",
+        "SET ROLE",
+        "CREATE POLICY",
+        "ALTER POLICY",
+        "DROP POLICY",
+    )
+    skip_contains = (
+        "ROW LEVEL SECURITY",
+        "TO anon",
+        "TO authenticated",
+        "TO service_role",
+        "EXTENSION ",
+    )
+    if line.startswith(skip_prefixes) or any(x in line for x in skip_contains):
+        return None
+    if "SCHEMA public" in line:
+        return None
+    line = re.sub(r'"public"', f'"{new_schema}"', line)
+    line = re.sub(r"(?<!\w)public\.", f"{new_schema}.", line)
+    line = re.sub(r'("extensions"|extensions)\.', "public.", line)
+    line = line.replace("search_path = public", f"search_path = {new_schema}")
+    line = line.replace("extensions.uuid_generate_v4()", "gen_random_uuid()")
+    line = line.replace("'extensions'", f"'{new_schema}'")
+    return line
+
+
+DDL = """\
+SET search_path = public, pg_catalog;
+SELECT pg_catalog.set_config('search_path', '', false);
+CREATE SCHEMA public;
+COMMENT ON SCHEMA public IS 'standard public schema';
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp" WITH SCHEMA extensions;
+CREATE TABLE public.users (
+    id uuid DEFAULT extensions.uuid_generate_v4() NOT NULL,
+    org_id uuid REFERENCES "public"."orgs"(id),
+    note text DEFAULT 'public.x'::text,
+    épublic.col integer, €public.col integer, x_public.col integer,
+    myextensions.col integer,
+    path text DEFAULT 'extensions'
+);
+CREATE FUNCTION public.f() RETURNS void
+    LANGUAGE sql SET search_path = extensions.x AS $$ SELECT 1 $$;
+SET search_path = public.foo;
+ALTER TABLE public.users ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "own rows" ON public.users TO authenticated USING (true);
+GRANT ALL ON TABLE public.users TO anon;
+REVOKE ALL ON SCHEMA public FROM PUBLIC;
+ALTER TABLE ONLY public.users ADD CONSTRAINT users_pkey PRIMARY KEY (id);
+CREATE INDEX users_org ON public.users USING btree (org_id);
+ALTER TABLE ONLY "public"."users" ADD CONSTRAINT fk FOREIGN KEY (org_id) REFERENCES public.orgs(id);
+"""
+
+
+def test_ddl_output_matches_legacy_chain():
+    remapper = Remapper("backup_x")
+    for line in DDL.splitlines(keepends=True):
+        expected = legacy_remap_schema_line(line, "backup_x")
+        out = remapper.remap_ddl_line(line.encode())
+        assert out == (expected.encode() if expected is not None else None), line
+
+
+def test_remap_schema_file_is_byte_identical(tmp_path):
+    src, dst = tmp_path / "schema.sql", tmp_path / "schema.remapped.sql"
+    src.write_text(DDL)
+
+    remap_schema_file(str(src), str(dst), "backup_x")
+
+    expected = "".join(
+        out
+        for line in DDL.splitlines(keepends=True)
+        if (out := legacy_remap_schema_line(line, "backup_x")) is not None
+    )
+    assert dst.read_bytes() == expected.encode()
+
+
+def test_copy_rows_pass_through_untouched(tmp_path):
+    src, dst = tmp_path / "data.sql", tmp_path / "data.remapped.sql"
+    src.write_bytes(
+        b"SET statement_timeout = 0;\n"
+        b"COPY public.notes (id, body) FROM stdin;\n"
+        b"1\tsee public.users and GRANT ALL TO anon\n"
+        b"2\t\xff not utf-8\n"
+        b"\\.\n"
+        b"\n"
+        b"SELECT pg_catalog.setval('public.notes_id_seq', 2, true);\n"
+    )
+
+    remap_data_file(str(src), str(dst), "backup_x")
+
+    assert dst.read_bytes() == (
+        b"SET statement_timeout = 0;\n"
+        b"COPY backup_x.notes (id, body) FROM stdin;\n"
+        b"1\tsee public.users and GRANT ALL TO anon\n"
+        b"2\t\xff not utf-8\n"
+        b"\\.\n"
+        b"\n"
+        b"SELECT pg_catalog.setval('backup_x.notes_id_seq', 2, true);\n"
+    )
+
+
+def test_remap_file_matches_line_engine(tmp_path):
+    dump = (
+        b"COPY public.first (id) FROM stdin;\n"
+        b"1\n"
+        b"\\.\n"
+        b"COPY public.empty (id) FROM stdin;\n"
+        b"\\.\n"
+        b"GRANT ALL ON TABLE public.first TO anon;\n"
+        b"COPY public.crlf (id) FROM stdin;\n"
+        b"\\.x is not a terminator\n"
+        b"\\.\r\n"
+        b"COPY (SELECT 1) TO stdout;\n"
+        b"ALTER TABLE public.first OWNER TO postgres;\n"
+        b"COPY public.last (body) FROM stdin;\n"
+        b"see public.first\n"
+        b"\\."
+    )
+    src, dst = tmp_path / "dump.sql", tmp_path / "dump.remapped.sql"
+    src.write_bytes(dump)
+
+    remap_file(str(src), str(dst), "backup_x")
+
+    expected = b"".join(Remapper("backup_x").remap(dump.splitlines(keepends=True)))
+    assert dst.read_bytes() == expected
+    assert b"see public.first" in expected
+    assert b"ALTER TABLE backup_x.first" in expected
+
+
+def test_remap_file_handles_empty_input(tmp_path):
+    src, dst = tmp_path / "empty.sql", tmp_path / "out.sql"
+    src.write_bytes(b"")
+
+    remap_file(str(src), str(dst), "backup_x")
+
+    assert dst.read_bytes() == b""
+
+
+def test_several_schemas_follow_their_targets():
+    targets = target_schemas("backup_x", ["public", "billing", "Audit Log"])
+    assert targets == {
+        "public": "backup_x",
+        "billing": "backup_x__billing",
+        "Audit Log": "backup_x__audit_log",
+    }
+    remapper = Remapper("backup_x", targets)
+    dump = (
+        b"CREATE SCHEMA billing;\n"
+        b"SET search_path = billing, pg_catalog;\n"
+        b"CREATE TABLE billing.invoices (\n"
+        b"    user_id uuid REFERENCES public.users(id),\n"
+        b"    old_billing.col integer, billing_old.col integer\n"
+        b");\n"
+        b'CREATE VIEW public.v AS SELECT * FROM "Audit Log".events;\n'
+        b"ALTER TABLE ONLY billing.invoices ADD CONSTRAINT fk FOREIGN KEY "
+        b'(user_id) REFERENCES "public"."users"(id);\n'
+        b"COPY billing.invoices (user_id) FROM stdin;\n"
+        b"billing.x\n"
+        b"\\.\n"
+    )
+
+    out = b"".join(remapper.remap(dump.splitlines(keepends=True)))
+
+    assert out == (
+        b"SET search_path = backup_x__billing, pg_catalog;\n"
+        b"CREATE TABLE backup_x__billing.invoices (\n"
+        b"    user_id uuid REFERENCES backup_x.users(id),\n"
+        b"    old_billing.col integer, billing_old.col integer\n"
+        b");\n"
+        b"CREATE VIEW backup_x.v AS SELECT * FROM backup_x__audit_log.events;\n"
+        b"ALTER TABLE ONLY backup_x__billing.invoices ADD CONSTRAINT fk FOREIGN KEY "
+        b'(user_id) REFERENCES "backup_x"."users"(id);\n'
+        b"COPY backup_x__billing.invoices (user_id) FROM stdin;\n"
+        b"billing.x\n"
+        b"\\.\n"
+    )
+    # public is left alone when it is not backed up.
+    only_billing = Remapper("backup_x", {"billing": "backup_x"})
+    assert (
+        only_billing.rewrite(b"CREATE TABLE billing.t (u uuid REFERENCES public.u);")
+        == b"CREATE TABLE backup_x.t (u uuid REFERENCES public.u);"
+    )
+
+
+def test_foreign_keys_to_filtered_tables_are_dropped_or_not_validated(tmp_path):
+    dump = (
+        b"ALTER TABLE ONLY public.orders\n"
+        b"    ADD CONSTRAINT orders_pkey PRIMARY KEY (id);\n"
+        b"ALTER TABLE ONLY public.orders\n"
+        b"    ADD CONSTRAINT orders_user_fkey FOREIGN KEY (user_id) "
+        b"REFERENCES public.users(id) ON DELETE CASCADE;\n"
+        b"ALTER TABLE ONLY public.orders\n"
+        b'    ADD CONSTRAINT orders_log_fkey FOREIGN KEY (log_id) REFERENCES public."Log"(id);\n'
+    )
+    src = tmp_path / "postdata.sql"
+    src.write_bytes(dump)
+    remapper = Remapper(
+        "backup_x", excluded=[("public", "Log")], without_data=[("public", "users")]
+    )
+
+    out = b"".join(remapper.remap(dump.splitlines(keepends=True)))
+
+    assert out == (
+        b"ALTER TABLE ONLY backup_x.orders\n"
+        b"    ADD CONSTRAINT orders_pkey PRIMARY KEY (id);\n"
+        b"ALTER TABLE ONLY backup_x.orders\n"
+        b"    ADD CONSTRAINT orders_user_fkey FOREIGN KEY (user_id) "
+        b"REFERENCES backup_x.users(id) ON DELETE CASCADE NOT VALID;\n"
+    )
+    remap_file(
+        str(src),
+        str(tmp_path / "out.sql"),
+        "backup_x",
+        excluded=[("public", "Log")],
+        without_data=[("public", "users")],
+    )
+    assert (tmp_path / "out.sql").read_bytes() == out
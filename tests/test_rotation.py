@@ -1,13 +1,26 @@
+import datetime
 import unittest
 from unittest.mock import MagicMock, patch
 from supaneon_sync import backup
+from supaneon_sync.rotation import RetentionPolicy, schema_timestamp
 
 
 class TestSchemaRotation(unittest.TestCase):
+    @patch("supaneon_sync.backup.run_sink")
+    @patch("supaneon_sync.manifest.db")
+    @patch("supaneon_sync.checkpoint.db")
     @patch("supaneon_sync.backup.subprocess.run")
-    @patch("supaneon_sync.backup.psycopg.connect")
+    @patch("supaneon_sync.backup.db")
     @patch("supaneon_sync.backup.validate_env")
-    def test_rotation_logic(self, mock_validate_env, mock_connect, mock_subprocess):
+    def test_rotation_logic(
+        self,
+        mock_validate_env,
+        mock_db,
+        mock_subprocess,
+        mock_cp_db,
+        mock_manifest_db,
+        mock_sink,
+    ):
         # Setup mock config
         mock_cfg = MagicMock()
         mock_cfg.supabase_database_url = "postgres://supabase"
@@ -16,7 +29,7 @@ class TestSchemaRotation(unittest.TestCase):
         mock_validate_env.return_value = mock_cfg
 
         # Setup mock database connection for list_backup_schemas
-        mock_conn = mock_connect.return_value.__enter__.return_value
+        mock_conn = mock_db.connection.return_value.__enter__.return_value
         mock_cur = mock_conn.cursor.return_value.__enter__.return_value
 
         # Simulated schemas: 7 existing backups
@@ -36,10 +49,9 @@ class TestSchemaRotation(unittest.TestCase):
 
         # Verification:
         # 1. list_backup_schemas should be called
-        # 2. deletion should be called for the oldest 2
-        # while len(backup_schemas) >= max_schemas:
-        # 7 >= 6: delete 1, left 6.
-        # 6 >= 6: delete 1, left 5.
+        # 2. deletion should be called for the oldest 2 (default keep=6):
+        # while the backup runs, 7 existing -> delete 1, left 6.
+        # once it has succeeded, 6 + new = 7 -> delete 1, left 6.
         # So 2 deletions.
 
         # Check for drops
@@ -51,6 +63,104 @@ class TestSchemaRotation(unittest.TestCase):
         creates = [c for c in execute_calls if "CREATE SCHEMA" in c]
         self.assertGreaterEqual(len(creates), 1)
 
+        # The rotated backups' runs and manifests go with them.
+        cp_conn = mock_cp_db.connection.return_value.__enter__.return_value
+        forgotten = [
+            c.args[1]
+            for c in cp_conn.execute.call_args_list
+            if "DELETE" in c.args[0] and "backup_runs" in c.args[0]
+        ]
+        self.assertEqual([f[0] for f in forgotten], existing_schemas[:2])
+        manifest_conn = mock_manifest_db.connection.return_value.__enter__.return_value
+        manifest_deletes = [
+            c.args[1][0][0]
+            for c in manifest_conn.execute.call_args_list
+            if "DELETE" in c.args[0]
+        ]
+        self.assertEqual(manifest_deletes, [f[0] for f in forgotten])
+
+    @patch("supaneon_sync.backup._rotate", side_effect=RuntimeError("lock timeout"))
+    @patch("supaneon_sync.backup.RunMetrics.finish")
+    @patch("supaneon_sync.backup.run_sink")
+    @patch("supaneon_sync.checkpoint.db")
+    @patch("supaneon_sync.backup.subprocess.run")
+    @patch("supaneon_sync.backup.db")
+    @patch("supaneon_sync.backup.validate_env")
+    def test_rotation_failure_does_not_fail_the_backup(
+        self,
+        mock_validate_env,
+        mock_db,
+        mock_subprocess,
+        mock_cp_db,
+        mock_sink,
+        mock_finish,
+        mock_rotate,
+    ):
+        mock_validate_env.return_value = MagicMock()
+        mock_cur = mock_db.connection.return_value.__enter__.return_value
+        mock_cur = mock_cur.cursor.return_value.__enter__.return_value
+        mock_cur.fetchall.return_value = []
+
+        with patch("builtins.open", MagicMock()):
+            with patch("os.path.exists", return_value=True):
+                with patch("os.remove", MagicMock()):
+                    schema = backup.run()
+
+        self.assertTrue(schema.startswith("backup_"))
+        mock_finish.assert_called_once_with(True)
+
+    @patch("supaneon_sync.checkpoint.db")
+    @patch("supaneon_sync.backup.subprocess.run")
+    @patch("supaneon_sync.backup.db")
+    @patch("supaneon_sync.backup.validate_env")
+    def test_failed_backup_keeps_retention_floor(
+        self, mock_validate_env, mock_db, mock_subprocess, mock_cp_db
+    ):
+        mock_validate_env.return_value = MagicMock()
+        mock_cur = mock_db.connection.return_value.__enter__.return_value
+        mock_cur = mock_cur.cursor.return_value.__enter__.return_value
+        existing = [f"backup_20230101T00000{i}Z" for i in range(6)]
+        mock_cur.fetchall.return_value = [[s] for s in existing]
+        mock_subprocess.side_effect = RuntimeError("pg_dump failed")
+
+        with patch("builtins.open", MagicMock()):
+            with self.assertRaises(RuntimeError):
+                backup.run()
+
+        # Six existing backups already satisfy keep=6 without the new one,
+        # so nothing is dropped when the new backup fails.
+        execute_calls = [call.args[0] for call in mock_cur.execute.call_args_list]
+        self.assertFalse([c for c in execute_calls if "DROP SCHEMA" in c])
+
+
+class TestRetentionPolicy(unittest.TestCase):
+    NOW = datetime.datetime(2024, 1, 10, tzinfo=datetime.UTC)
+    SCHEMAS = [f"backup_2024010{d}t000000z" for d in range(1, 10)]
+
+    def test_schema_timestamp(self):
+        self.assertEqual(
+            schema_timestamp("backup_20240102T030405Z"),
+            datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.UTC),
+        )
+        self.assertIsNone(schema_timestamp("backup_manual"))
+
+    def test_count_keeps_newest(self):
+        policy = RetentionPolicy(keep=3)
+        self.assertEqual(policy.expired(self.SCHEMAS), self.SCHEMAS[:6])
+
+    def test_age_respects_min_keep(self):
+        policy = RetentionPolicy(
+            keep=None, max_age=datetime.timedelta(days=3), min_keep=1
+        )
+        self.assertEqual(policy.expired(self.SCHEMAS, now=self.NOW), self.SCHEMAS[:6])
+        old = RetentionPolicy(keep=None, max_age=datetime.timedelta(0), min_keep=2)
+        self.assertEqual(old.expired(self.SCHEMAS, now=self.NOW), self.SCHEMAS[:7])
+
+    def test_size_drops_oldest_until_under_budget(self):
+        policy = RetentionPolicy(keep=None, max_bytes=250)
+        sizes = {s: 100 for s in self.SCHEMAS}
+        self.assertEqual(policy.expired(self.SCHEMAS, sizes), self.SCHEMAS[:7])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,58 @@
+import subprocess
+import sys
+
+import pytest
+
+from supaneon_sync.backup import remap_data_lines, remap_schema_lines
+from supaneon_sync.stream import run_pipeline
+
+
+def _py(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+def test_run_pipeline_applies_stages_in_order(tmp_path):
+    out = tmp_path / "out.sql"
+    source = _py("print('COPY public.users (id) FROM stdin;'); print('1')")
+    sink = _py(f"import sys; open({str(out)!r}, 'w').write(sys.stdin.read())")
+
+    run_pipeline(
+        source,
+        sink,
+        lambda lines: remap_data_lines(lines, "backup_x"),
+        lambda lines: (line.upper() for line in lines),
+    )
+
+    assert out.read_text() == "COPY BACKUP_X.USERS (ID) FROM STDIN;\n1\n"
+
+
+def test_run_pipeline_reports_sink_failure():
+    source = _py("import sys\nfor i in range(100000): print(i)")
+    sink = _py("import sys; sys.stdin.readline(); sys.exit(3)")
+
+    with pytest.raises(subprocess.CalledProcessError) as exc:
+        run_pipeline(source, sink)
+    assert exc.value.returncode == 3
+
+
+def test_run_pipeline_reports_source_failure():
+    source = _py("import sys; print('x'); sys.exit(2)")
+    sink = _py("import sys; sys.stdin.read()")
+
+    with pytest.raises(subprocess.CalledProcessError) as exc:
+        run_pipeline(source, sink)
+    assert exc.value.returncode == 2
+
+
+def test_remap_schema_lines_is_lazy():
+    lines = iter(
+        [
+            b"GRANT ALL ON TABLE public.users TO anon;\n",
+            b"CREATE TABLE public.users (id uuid DEFAULT extensions.uuid_generate_v4());\n",
+        ]
+    )
+    remapped = remap_schema_lines(lines, "backup_x")
+
+    assert next(remapped) == (
+        b"CREATE TABLE backup_x.users (id uuid DEFAULT public.uuid_generate_v4());\n"
+    )
@@ -0,0 +1,95 @@
+from unittest.mock import patch
+
+from supaneon_sync import restore, verify
+from supaneon_sync.verify import KeyRange, RangeDigest, TableKey
+
+
+def _conn(mock_db):
+    return mock_db.connection.return_value.__enter__.return_value
+
+
+@patch("supaneon_sync.verify.db")
+def test_plan_ranges_splits_integer_keys_with_open_ends(mock_db):
+    conn = _conn(mock_db)
+    results = iter(
+        [
+            ("id", "bigint", False),  # primary key
+            (4_000,),  # estimated rows
+            (1, 1_000),  # min, max
+        ]
+    )
+    conn.execute.return_value.fetchone.side_effect = lambda: next(results)
+
+    key, ranges = verify.plan_ranges("src", "events", chunk_rows=1_000)
+
+    assert key == TableKey("id", "bigint", False)
+    assert [(r.lo, r.hi) for r in ranges] == [
+        (None, 251),
+        (251, 501),
+        (501, 751),
+        (751, None),
+    ]
+
+
+def test_range_filter_bounds_and_collation():
+    text_key = TableKey("slug", "text", True)
+    rng = KeyRange("posts", "a", "m")
+
+    clause = verify._range_filter(text_key, rng).as_string(None)
+
+    assert clause == (
+        '"slug" COLLATE "C" >= \'a\'::text AND "slug" COLLATE "C" < \'m\'::text'
+    )
+    assert verify._range_filter(None, rng).as_string(None) == "true"
+    open_range = KeyRange("posts", None, None)
+    assert verify._range_filter(text_key, open_range).as_string(None) == "true"
+
+
+@patch("supaneon_sync.verify.range_digest")
+@patch("supaneon_sync.verify.plan_ranges")
+@patch("supaneon_sync.verify._target_tables")
+@patch("supaneon_sync.verify.list_tables")
+@patch("supaneon_sync.verify.db")
+def test_verify_backup_reports_missing_tables_and_mismatched_ranges(
+    mock_db, mock_list, mock_target, mock_plan, mock_digest
+):
+    key = TableKey("id", "integer", False)
+    mock_list.return_value = ["users", "orders", "audit"]
+    mock_target.return_value = {"users", "orders"}
+    mock_plan.side_effect = lambda url, table, *a: (
+        key,
+        [KeyRange(table, None, 10), KeyRange(table, 10, None)],
+    )
+
+    def digest(url, schema, key, rng):
+        if url == "neon" and rng.table == "orders" and rng.lo == 10:
+            return RangeDigest(5, 999)
+        return RangeDigest(5, 123)
+
+    mock_digest.side_effect = digest
+
+    report = verify.verify_backup("src", "neon", "backup_x", workers=2)
+
+    assert report.missing == ["audit"]
+    assert report.tables == 2 and report.ranges == 4 and report.rows == 20
+    assert [(m.range.table, m.range.lo) for m in report.mismatches] == [("orders", 10)]
+    assert not report.ok
+
+
+@patch("supaneon_sync.restore.filtered_tables", return_value={})
+@patch("supaneon_sync.restore.verify_backup")
+@patch("supaneon_sync.restore.run_schemas", return_value=["billing", "public"])
+@patch("supaneon_sync.restore.validate_env")
+def test_run_verify_compares_every_schema_with_its_source(
+    mock_env, mock_schemas, mock_verify, mock_filtered
+):
+    mock_verify.side_effect = lambda src, neon, schema, **kw: verify.VerifyReport(
+        schema
+    )
+
+    reports = restore.run_verify("backup_x")
+
+    assert [
+        (c.args[2], c.kwargs["source_schema"]) for c in mock_verify.call_args_list
+    ] == [("backup_x", "billing"), ("backup_x__public", "public")]
+    assert [r.schema for r in reports] == ["backup_x", "backup_x__public"]